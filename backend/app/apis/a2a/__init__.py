@@ -1,13 +1,25 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Query, WebSocket, WebSocketDisconnect, status
 from pydantic import BaseModel
-from typing import Dict, Any, Optional, List, Union
+from typing import Dict, Any, Optional, List, Tuple, Union
+import asyncio
+import time
 import uuid
 from datetime import datetime
-import databutton as db
-from app.apis.auth import get_current_user
+from app.apis.auth import get_current_user, get_current_user_ws, websocket_subprotocol
+from app.libs.async_storage import run_blocking
+from app.libs.concurrency import KeyedBatcher
+from app.libs.conversation_store import CursorNotFoundError, get_conversation_store, project_headers
+from app.libs.inbox_index import get_inbox_index
+from app.libs.json_storage import sanitize_key
+from app.libs.metrics import get_metrics
+from app.libs.pubsub import get_message_bus
 
 router = APIRouter(prefix="/a2a", tags=["a2a"])
 
+_stage_seconds = get_metrics().histogram(
+    "a2a_stage_duration_seconds", "Duración de cada etapa del envío de un mensaje", ["stage"]
+)
+
 class AgentInfo(BaseModel):
     agent_id: str
     agent_name: Optional[str] = None
@@ -32,10 +44,56 @@ class ConversationResponse(BaseModel):
     conversation_id: str
     messages: List[Dict[str, Any]]
     metadata: Dict[str, Any]
+    total: Optional[int] = None
+    has_more_before: bool = False
+    has_more_after: bool = False
 
 def _sanitize_key(key: str) -> str:
     """Sanitiza la clave para almacenamiento seguro"""
-    return ''.join(c for c in key if c.isalnum() or c in '._-')
+    return sanitize_key(key)
+
+async def _flush_conversation(conversation_id: str, messages: List[Dict[str, Any]]) -> List[int]:
+    """Escribe en bloque los mensajes acumulados de una conversación"""
+    metadata: Dict[str, Any] = {}
+    for message in messages:
+        metadata.update(message.get("metadata") or {})
+    count = await run_blocking(get_conversation_store().append_many, conversation_id, messages, metadata)
+    first = count - len(messages)
+    return [first + i + 1 for i in range(len(messages))]
+
+def _message_topics(to_agent_id: str, conversation_id: str) -> List[str]:
+    return [f"agent:{to_agent_id}", f"conversation:{conversation_id}"]
+
+async def _flush_inbox(agent_id: str, records: List[Tuple[str, Dict[str, Any], int]]) -> List[Dict[str, Any]]:
+    """Escribe en bloque las referencias acumuladas para la bandeja de un agente"""
+    return await run_blocking(get_inbox_index().record_many, agent_id, records)
+
+# Los envíos concurrentes a la misma conversación (o al mismo agente receptor)
+# se agrupan en una sola escritura en lugar de pisarse entre sí
+_conversation_writes = KeyedBatcher(_flush_conversation)
+_inbox_writes = KeyedBatcher(_flush_inbox)
+
+def format_message(message: A2AMessage, message_id: str, conversation_id: str, timestamp: str) -> Dict[str, Any]:
+    """Convierte el mensaje recibido al formato A2A que se almacena y se publica"""
+    a2a_message = {
+        "message_id": message_id,
+        "conversation_id": conversation_id,
+        "timestamp": timestamp,
+        "from": {
+            "agent_id": message.from_agent.agent_id,
+            "agent_name": message.from_agent.agent_name or "Unknown Agent"
+        },
+        "to": {
+            "agent_id": message.to_agent.agent_id,
+            "agent_name": message.to_agent.agent_name or "Unknown Agent"
+        },
+        "type": message.message_type,
+        "content": message.content
+    }
+    
+    if message.metadata:
+        a2a_message["metadata"] = message.metadata
+    return a2a_message
 
 @router.post("/send")
 async def send_message(message: A2AMessage, current_user: dict = Depends(get_current_user)) -> A2AResponse:
@@ -47,71 +105,25 @@ async def send_message(message: A2AMessage, current_user: dict = Depends(get_cur
         timestamp = datetime.utcnow().isoformat()
         
         # Formatear el mensaje en formato A2A
-        a2a_message = {
-            "message_id": message_id,
-            "conversation_id": conversation_id,
-            "timestamp": timestamp,
-            "from": {
-                "agent_id": message.from_agent.agent_id,
-                "agent_name": message.from_agent.agent_name or "Unknown Agent"
-            },
-            "to": {
-                "agent_id": message.to_agent.agent_id,
-                "agent_name": message.to_agent.agent_name or "Unknown Agent"
-            },
-            "type": message.message_type,
-            "content": message.content
-        }
-        
-        if message.metadata:
-            a2a_message["metadata"] = message.metadata
+        a2a_message = format_message(message, message_id, conversation_id, timestamp)
         
-        # Almacenar el mensaje en el contexto de la conversación
-        context_key = f"a2a_conversation_{conversation_id}"
-        sanitized_key = _sanitize_key(context_key)
-        
-        try:
-            context = db.storage.json.get(sanitized_key, {})
-        except FileNotFoundError:
-            context = {
-                "conversation_id": conversation_id,
-                "messages": [],
-                "metadata": {}
-            }
-        
-        # Agregar el mensaje al historial
-        context["messages"].append(a2a_message)
-        
-        # Actualizar metadata si está presente
-        if message.metadata:
-            context["metadata"].update(message.metadata)
-        
-        # Guardar el contexto actualizado
-        db.storage.json.put(sanitized_key, context)
-        
-        # También agregamos el mensaje al contexto del agente receptor para facilitar la consulta
-        agent_context_key = f"a2a_agent_{message.to_agent.agent_id}"
-        sanitized_agent_key = _sanitize_key(agent_context_key)
-        
-        try:
-            agent_context = db.storage.json.get(sanitized_agent_key, {})
-        except FileNotFoundError:
-            agent_context = {}
+        # Anexar el mensaje al log segmentado de la conversación
+        started = time.perf_counter()
+        message_count = await _conversation_writes.submit(conversation_id, a2a_message)
+        inbox_started = time.perf_counter()
+        _stage_seconds.observe(inbox_started - started, "append")
         
-        if conversation_id not in agent_context:
-            agent_context[conversation_id] = {
-                "messages": [],
-                "metadata": {}
-            }
-        
-        agent_context[conversation_id]["messages"].append(a2a_message)
-        
-        if message.metadata:
-            if "metadata" not in agent_context[conversation_id]:
-                agent_context[conversation_id]["metadata"] = {}
-            agent_context[conversation_id]["metadata"].update(message.metadata)
+        # Registrar en el índice del agente receptor una referencia al mensaje (no una copia)
+        await _inbox_writes.submit(
+            message.to_agent.agent_id,
+            (conversation_id, a2a_message, message_count - 1),
+        )
+        publish_started = time.perf_counter()
+        _stage_seconds.observe(publish_started - inbox_started, "inbox")
         
-        db.storage.json.put(sanitized_agent_key, agent_context)
+        # Avisar en tiempo real a los suscritos al agente receptor o a la conversación
+        get_message_bus().publish(_message_topics(message.to_agent.agent_id, conversation_id), a2a_message)
+        _stage_seconds.observe(time.perf_counter() - publish_started, "publish")
         
         return A2AResponse(
             message_id=message_id,
@@ -124,22 +136,92 @@ async def send_message(message: A2AMessage, current_user: dict = Depends(get_cur
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error al enviar mensaje: {str(e)}")
 
+@router.websocket("/subscribe")
+async def subscribe_messages(
+    websocket: WebSocket,
+    agent_id: List[str] = Query([]),
+    conversation_id: List[str] = Query([]),
+    current_user: dict = Depends(get_current_user_ws),
+):
+    """Envía por WebSocket los mensajes nuevos de los agentes o conversaciones indicados.
+
+    Si el cliente no lee lo bastante rápido y se llena su buffer, se cierra la
+    conexión con el código 1013 (reintentar más tarde).
+    """
+    await websocket.accept(subprotocol=websocket_subprotocol(websocket))
+    topics = [f"agent:{a}" for a in agent_id] + [f"conversation:{c}" for c in conversation_id]
+    if not topics:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason="Se requiere agent_id o conversation_id")
+        return
+    
+    bus = get_message_bus()
+    subscription = bus.subscribe(topics)
+    
+    async def forward() -> None:
+        async for a2a_message in subscription:
+            await websocket.send_json({"event": "message", "data": a2a_message})
+        if subscription.dropped:
+            await websocket.close(code=status.WS_1013_TRY_AGAIN_LATER, reason="Cliente demasiado lento")
+    
+    async def wait_disconnect() -> None:
+        while (await websocket.receive())["type"] != "websocket.disconnect":
+            pass
+    
+    sender = asyncio.ensure_future(forward())
+    receiver = asyncio.ensure_future(wait_disconnect())
+    try:
+        await websocket.send_json({"event": "subscribed", "data": {"topics": topics}})
+        await asyncio.wait({sender, receiver}, return_when=asyncio.FIRST_COMPLETED)
+    except (WebSocketDisconnect, RuntimeError):
+        pass
+    finally:
+        bus.unsubscribe(subscription)
+        # Sin esperarlas: si el servidor está cancelando este handler, esperar
+        # aquí volvería a recibir la cancelación y el cierre no terminaría limpio
+        for task in (sender, receiver):
+            task.cancel()
+
 @router.get("/conversation/{conversation_id}")
-async def get_conversation(conversation_id: str, current_user: dict = Depends(get_current_user)) -> ConversationResponse:
-    """Obtiene todos los mensajes de una conversación específica"""
+async def get_conversation(
+    conversation_id: str,
+    limit: Optional[int] = Query(None, ge=1, le=1000),
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+    headers_only: bool = False,
+    current_user: dict = Depends(get_current_user),
+) -> ConversationResponse:
+    """Obtiene los mensajes de una conversación, opcionalmente paginados por cursor.
+
+    `before`/`after` aceptan un message_id o un timestamp ISO; los prefijos
+    `id:` y `ts:` fijan el tipo del cursor. Con `headers_only` se omiten
+    `content` y `metadata` de cada mensaje.
+    """
     try:
-        context_key = f"a2a_conversation_{conversation_id}"
-        sanitized_key = _sanitize_key(context_key)
-        
         try:
-            context = db.storage.json.get(sanitized_key)
-        except FileNotFoundError:
+            context = await run_blocking(
+                get_conversation_store().read_window,
+                conversation_id,
+                limit=limit,
+                before=before,
+                after=after,
+            )
+        except CursorNotFoundError as e:
+            raise HTTPException(status_code=400, detail=f"Cursor no encontrado: {e.args[0]}")
+        
+        if context is None:
             raise HTTPException(status_code=404, detail=f"Conversación no encontrada: {conversation_id}")
         
+        messages = context.get("messages", [])
+        if headers_only:
+            messages = [project_headers(m) for m in messages]
+        
         return ConversationResponse(
             conversation_id=conversation_id,
-            messages=context.get("messages", []),
-            metadata=context.get("metadata", {})
+            messages=messages,
+            metadata=context.get("metadata", {}),
+            total=context.get("total"),
+            has_more_before=context.get("has_more_before", False),
+            has_more_after=context.get("has_more_after", False)
         )
         
     except Exception as e:
@@ -148,21 +230,46 @@ async def get_conversation(conversation_id: str, current_user: dict = Depends(ge
         raise HTTPException(status_code=500, detail=f"Error al obtener conversación: {str(e)}")
 
 @router.get("/agent/{agent_id}/conversations")
-async def get_agent_conversations(agent_id: str, current_user: dict = Depends(get_current_user)) -> Dict[str, Any]:
-    """Obtiene todas las conversaciones de un agente específico"""
+async def get_agent_conversations(
+    agent_id: str,
+    limit: Optional[int] = Query(None, ge=1, le=1000),
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+    current_user: dict = Depends(get_current_user),
+) -> Dict[str, Any]:
+    """Obtiene el índice de conversaciones de un agente, de la más reciente a la más antigua"""
     try:
-        agent_context_key = f"a2a_agent_{agent_id}"
-        sanitized_key = _sanitize_key(agent_context_key)
-        
         try:
-            agent_context = db.storage.json.get(sanitized_key)
-        except FileNotFoundError:
-            return {"conversations": {}, "count": 0}
+            page = await run_blocking(
+                get_inbox_index().list_page,
+                agent_id,
+                limit=limit,
+                before=before,
+                after=after,
+            )
+        except CursorNotFoundError as e:
+            raise HTTPException(status_code=400, detail=f"Cursor no encontrado: {e.args[0]}")
         
         return {
-            "conversations": agent_context,
-            "count": len(agent_context)
+            "conversations": page["conversations"],
+            "count": len(page["conversations"]),
+            "total": page["total"],
+            "has_more": page["has_more"],
+            "next_cursor": page["next_cursor"]
         }
         
     except Exception as e:
+        if isinstance(e, HTTPException):
+            raise e
         raise HTTPException(status_code=500, detail=f"Error al obtener conversaciones del agente: {str(e)}")
+
+def _collect_metrics() -> List[Tuple[str, str, str, List[Tuple[Dict[str, Any], float]]]]:
+    """Estado del bus de mensajes en tiempo real"""
+    stats = get_message_bus().stats()
+    return [
+        ("a2a_subscribers", "gauge", "Suscriptores conectados", [({}, stats["subscribers"])]),
+        ("a2a_published_total", "counter", "Mensajes publicados en el bus", [({}, stats["published"])]),
+        ("a2a_dropped_subscribers_total", "counter", "Suscriptores desconectados por lentos", [({}, stats["dropped_subscribers"])]),
+    ]
+
+get_metrics().collector("a2a", _collect_metrics)
@@ -1,16 +1,47 @@
-from fastapi import APIRouter, HTTPException, Depends, Header, Request
+from fastapi import APIRouter, HTTPException, Depends, Header, Request, WebSocket, WebSocketException, status
+from fastapi.requests import HTTPConnection
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from pydantic import BaseModel
-import databutton as db
-import jwt
+import functools
+import hashlib
+import os
+import time
 from datetime import datetime, timedelta
 from typing import Dict, Any, Optional, List
+from app.env import env_flag
+from app.libs.cache import LockedTTLCache
+from app.libs.metrics import cache_families, get_metrics
+from databutton_app.lazy import lazy_import
+from databutton_app.mw.auth_mw import (
+    WS_BEARER_PREFIX,
+    Principal,
+    User,
+    auth_outcome_counts,
+    get_principal,
+    get_websocket_token,
+    register_auth_observer,
+    register_token_verifier,
+    set_principal,
+)
+
+# databutton y jwt tardan en importarse: se cargan al usarse por primera vez
+db = lazy_import("databutton")
+jwt = lazy_import("jwt")
 
 # Configuración para JWT
-JWT_SECRET = db.secrets.get("JWT_SECRET", "nexusforge_default_secret")
 ALGORITHM = "HS256"
+DEFAULT_JWT_SECRET = "nexusforge_default_secret"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24 * 7  # 1 semana
 
+# Payloads ya verificados por hash del token, válidos hasta su `exp`: un cliente
+# que repite el mismo token no vuelve a pagar la verificación de la firma. Con
+# cerrojo: el middleware de los routers es síncrono y corre en el threadpool
+TOKEN_CACHE_TTL_SECONDS = 300  # Para tokens sin `exp`
+_token_cache = LockedTTLCache(
+    max_size=int(os.environ.get("AUTH_TOKEN_CACHE_SIZE", 10000)),
+    ttl=TOKEN_CACHE_TTL_SECONDS,
+)
+
 # Esquema de seguridad para autenticación Bearer
 security = HTTPBearer()
 router = APIRouter(prefix="/auth", tags=["auth"])
@@ -30,6 +61,19 @@ class UserData(BaseModel):
     role: Optional[str] = None
 
 
+@functools.cache
+def get_jwt_secret() -> str:
+    """Secreto para firmar los tokens internos, leído una vez al primer uso"""
+    return db.secrets.get("JWT_SECRET", DEFAULT_JWT_SECRET)
+
+
+def __getattr__(name: str) -> Any:
+    # Compatibilidad: JWT_SECRET era una constante leída al importar el módulo
+    if name == "JWT_SECRET":
+        return get_jwt_secret()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     """Crea un token JWT con los datos proporcionados"""
     to_encode = data.copy()
@@ -40,30 +84,116 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
         expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     
     to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, JWT_SECRET, algorithm=ALGORITHM)
+    encoded_jwt = jwt.encode(to_encode, get_jwt_secret(), algorithm=ALGORITHM)
     return encoded_jwt
 
 
 def decode_token(token: str) -> dict:
     """Decodifica un token JWT y devuelve los datos"""
+    key = hashlib.sha256(token.encode()).digest()
+    payload = _token_cache.get(key)
+    if payload is not None:
+        return dict(payload)
+    
     try:
-        payload = jwt.decode(token, JWT_SECRET, algorithms=[ALGORITHM])
-        return payload
+        payload = jwt.decode(token, get_jwt_secret(), algorithms=[ALGORITHM])
     except jwt.PyJWTError:
         raise HTTPException(
             status_code=401,
             detail="Token inválido",
             headers={"WWW-Authenticate": "Bearer"},
         )
+    
+    exp = payload.get("exp")
+    ttl = exp - time.time() if isinstance(exp, (int, float)) else None
+    _token_cache.set(key, payload, ttl=ttl)
+    return dict(payload)
 
 
-async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> dict:
-    """Valida el token JWT y devuelve los datos del usuario"""
-    token = credentials.credentials
+def token_cache_stats() -> Dict[str, Any]:
+    """Aciertos, fallos y tamaño de la caché de tokens verificados"""
+    return _token_cache.stats()
+
+
+def verify_router_token(token: str) -> dict:
+    """Verifica un token interno en el middleware de los routers.
+
+    Por defecto los routers solo aceptan tokens de Firebase (RS256). Los internos
+    se aceptan únicamente con `AUTH_ACCEPT_INTERNAL_TOKENS` activado y un
+    `JWT_SECRET` propio: con el secreto por defecto cualquiera podría firmarlos.
+    """
+    if not env_flag("AUTH_ACCEPT_INTERNAL_TOKENS"):
+        raise ValueError("Los tokens internos no están habilitados en los routers")
+    if get_jwt_secret() == DEFAULT_JWT_SECRET:
+        raise ValueError("Los tokens internos requieren configurar JWT_SECRET")
+    return decode_token(token)
+
+
+# Si están habilitados, el middleware de autenticación verifica también los
+# tokens internos y cada petición resuelve su usuario una sola vez
+register_token_verifier(ALGORITHM, verify_router_token)
+
+# Métricas: duración de la autenticación por resultado y aciertos de la caché de tokens
+_auth_seconds = get_metrics().histogram(
+    "auth_duration_seconds", "Duración de la autenticación de cada petición", ["outcome"]
+)
+
+
+def _observe_auth(outcome: str, seconds: float) -> None:
+    # Las reutilizaciones del principal de la petición no verifican nada
+    if outcome != "reused":
+        _auth_seconds.observe(seconds, outcome)
+
+
+register_auth_observer(_observe_auth)
+
+
+def _collect_metrics() -> List[tuple]:
+    outcomes = auth_outcome_counts()
+    return [
+        ("auth_requests_total", "counter", "Autenticaciones por resultado",
+         [({"outcome": outcome}, count) for outcome, count in outcomes.items()]),
+        *cache_families("auth_token_cache", {"token": _token_cache}),
+    ]
+
+
+get_metrics().collector("auth", _collect_metrics)
+
+
+def _resolve_internal_user(connection: HTTPConnection, token: str) -> dict:
+    """Datos del token interno, reutilizando los que ya se verificaron en esta petición"""
+    principal = get_principal(connection)
+    if principal is not None and principal.scheme == ALGORITHM:
+        return dict(principal.claims)
+    
     user_data = decode_token(token)
+    if user_data.get("sub"):
+        set_principal(connection, Principal(ALGORITHM, user_data, User.model_validate(user_data)))
     return user_data
 
 
+async def get_current_user(request: Request, credentials: HTTPAuthorizationCredentials = Depends(security)) -> dict:
+    """Valida el token JWT y devuelve los datos del usuario"""
+    return _resolve_internal_user(request, credentials.credentials)
+
+
+def websocket_subprotocol(websocket: WebSocket) -> Optional[str]:
+    """Subprotocolo con el que aceptar el WebSocket, o None si el cliente no envió token"""
+    token = get_websocket_token(websocket)
+    return WS_BEARER_PREFIX + token if token else None
+
+
+async def get_current_user_ws(websocket: WebSocket) -> dict:
+    """Equivalente a get_current_user para WebSockets (los navegadores no envían cabeceras)"""
+    token = get_websocket_token(websocket)
+    if not token:
+        raise WebSocketException(code=status.WS_1008_POLICY_VIOLATION, reason="No autenticado")
+    try:
+        return _resolve_internal_user(websocket, token)
+    except HTTPException:
+        raise WebSocketException(code=status.WS_1008_POLICY_VIOLATION, reason="Token inválido")
+
+
 @router.get("/verify-token")
 async def verify_token(current_user: dict = Depends(get_current_user)) -> UserData:
     """Verifica si el token JWT es válido y devuelve los datos del usuario"""
@@ -75,6 +205,12 @@ async def verify_token(current_user: dict = Depends(get_current_user)) -> UserDa
     )
 
 
+@router.get("/token-cache")
+async def get_token_cache_stats(current_user: dict = Depends(get_current_user)) -> Dict[str, Any]:
+    """Devuelve las métricas de la caché de tokens verificados"""
+    return token_cache_stats()
+
+
 @router.post("/validate-supabase-token")
 async def validate_supabase_token(request: Request) -> TokenResponse:
     """Valida un token de Supabase y genera un token JWT interno"""
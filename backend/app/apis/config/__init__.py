@@ -1,7 +1,9 @@
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 import os
-import databutton as db
+from databutton_app.lazy import lazy_import
+
+db = lazy_import("databutton")
 
 router = APIRouter()
 
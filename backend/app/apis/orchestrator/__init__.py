@@ -1,20 +1,47 @@
-from fastapi import APIRouter, HTTPException, Depends, Request, Query
-from pydantic import BaseModel, Field
-from typing import Dict, Any, Optional, List, Union
+from fastapi import APIRouter, HTTPException, Depends, Request, Query, Response, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field, ValidationError
+from typing import Dict, Any, Optional, List, Union, AsyncIterator, Tuple
+import asyncio
+import functools
+import json
+import os
+import time
 import uuid
 from datetime import datetime
-import databutton as db
-from app.apis.auth import get_current_user
+from app.apis.auth import get_current_user, get_current_user_ws, websocket_subprotocol
 from app.apis.a2a import A2AMessage, AgentInfo
+from app.libs.agent_health import get_health_tracker
+from app.libs.async_storage import run_blocking
+from app.libs.dispatch import AgentQueueFullError, AgentTimeoutError, dispatcher_from_env
+from app.libs.fanout import fan_out, merge_responses
+from app.libs.lifecycle import on_shutdown
+from app.libs.metrics import cache_families, get_metrics
+from app.libs.routing import get_routing_table
+from app.libs.session_store import get_session_writer
 
 router = APIRouter(prefix="/orchestrator", tags=["orchestrator"])
 
+# Métricas: duración de cada etapa de una consulta, reparto por agente y llamadas a agentes
+_stage_seconds = get_metrics().histogram(
+    "orchestrator_stage_duration_seconds", "Duración de cada etapa de una consulta", ["stage"]
+)
+_routed = get_metrics().counter(
+    "orchestrator_routed_total", "Consultas dirigidas a cada agente", ["agent", "mode"]
+)
+_agent_call_seconds = get_metrics().histogram(
+    "agent_call_duration_seconds", "Duración de las llamadas a los agentes", ["agent", "outcome"]
+)
+
 # Definición de modelos para las solicitudes y respuestas
 class AgentRequest(BaseModel):
     query: str
     user_id: Optional[str] = None
     context: Optional[Dict[str, Any]] = None
     session_id: Optional[str] = None
+    # Consultar en paralelo a todos los agentes relevantes y combinar sus respuestas
+    multi_agent: bool = False
+    deadline_seconds: Optional[float] = Field(default=None, gt=0)
 
 class AgentResponse(BaseModel):
     request_id: str
@@ -30,305 +57,461 @@ class AgentStatus(BaseModel):
     status: str
     last_active: Optional[str] = None
     description: str
+    latency_ms: Optional[float] = None
+    error_rate: Optional[float] = None
+    load: Optional[float] = None
 
 class AllAgentsStatus(BaseModel):
     agents: List[AgentStatus]
     timestamp: str
 
-# Lista de agentes disponibles en el sistema
-AVAILABLE_AGENTS = [
-    {
-        "agent_id": "orchestrator",
-        "agent_name": "Master Agent Orchestrator",
-        "description": "Agente maestro que coordina la comunicación entre todos los agentes"
-    },
-    {
-        "agent_id": "training",
-        "agent_name": "Elite Training Strategist",
-        "description": "Especialista en diseño de planes de entrenamiento personalizados"
-    },
-    {
-        "agent_id": "nutrition",
-        "agent_name": "Precision Nutrition Architect",
-        "description": "Experto en nutrición y planes alimenticios personalizados"
-    },
-    {
-        "agent_id": "recovery",
-        "agent_name": "Recovery & Corrective Specialist",
-        "description": "Especialista en recuperación y corrección de problemas físicos"
-    },
-    {
-        "agent_id": "cognitive",
-        "agent_name": "Cognitive & Biohacking Strategist",
-        "description": "Estratega en optimización cognitiva y biohacking"
-    },
-    {
-        "agent_id": "motivation",
-        "agent_name": "Motivation & Behavior Coach",
-        "description": "Coach de motivación y comportamiento"
-    },
-    {
-        "agent_id": "biometrics",
-        "agent_name": "Biometrics Insight Engine",
-        "description": "Motor de análisis de datos biométricos"
-    },
-    {
-        "agent_id": "systems",
-        "agent_name": "Systems Integration & Automation Ops",
-        "description": "Operador de integración de sistemas y automatización"
-    },
-    {
-        "agent_id": "community",
-        "agent_name": "Community & Client-Success Liaison",
-        "description": "Enlace de éxito del cliente y comunidad"
-    },
-    {
-        "agent_id": "security",
-        "agent_name": "Security & Compliance Guardian",
-        "description": "Guardian de seguridad y cumplimiento"
-    }
-]
+class AgentHeartbeat(BaseModel):
+    load: Optional[float] = Field(default=None, ge=0, le=1)
 
 # Función para el enrutamiento de consultas a agentes específicos
 def route_query_to_agent(query: str, context: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
     """Determina qué agente debe manejar una consulta específica"""
-    # Palabras clave para cada agente
-    agent_keywords = {
-        "training": ["entrenamiento", "ejercicio", "rutina", "series", "repeticiones", "pesas", "cardio", "fuerza"],
-        "nutrition": ["nutrición", "comida", "dieta", "alimentación", "calorías", "macros", "proteínas"],
-        "recovery": ["recuperación", "descanso", "lesión", "dolor", "estiramiento", "movilidad", "fisioterapia"],
-        "cognitive": ["mente", "cognitivo", "mental", "focus", "concentración", "biohacking", "suplementos"],
-        "motivation": ["motivación", "hábitos", "disciplina", "constancia", "objetivos", "metas"],
-        "biometrics": ["datos", "métricas", "seguimiento", "progreso", "medidas", "peso", "grasa"],
-        "systems": ["sistema", "integración", "automatización", "herramientas", "apps", "tecnología"],
-        "community": ["comunidad", "grupo", "social", "compañeros", "coach", "apoyo"],
-        "security": ["seguridad", "privacidad", "datos personales", "protección", "normativa"]
-    }
-    
-    # Contar coincidencias de palabras clave para cada agente
-    agent_scores = {agent: 0 for agent in agent_keywords.keys()}
-    
-    query_lower = query.lower()
-    for agent, keywords in agent_keywords.items():
-        for keyword in keywords:
-            if keyword.lower() in query_lower:
-                agent_scores[agent] += 1
-    
-    # Si hay un agente con puntuación > 0, elegir el de mayor puntuación
-    max_score = max(agent_scores.values()) if agent_scores else 0
+    # Una sola instantánea por consulta aunque la tabla se recargue mientras tanto
+    snapshot = get_routing_table().snapshot()
+    unavailable = get_health_tracker().snapshot(snapshot.registry).unavailable
+
+    # Elegir el agente con más coincidencias de palabras clave, evitando los no disponibles
+    selected_agent = snapshot.matcher.best(query, exclude=unavailable)
     
-    if max_score > 0:
-        # En caso de empate, priorizar según el orden en AVAILABLE_AGENTS
-        max_agents = [agent for agent, score in agent_scores.items() if score == max_score]
-        
-        if len(max_agents) == 1:
-            selected_agent = max_agents[0]
-        else:
-            # Obtener el orden de los agentes empatados según AVAILABLE_AGENTS
-            agent_order = [a["agent_id"] for a in AVAILABLE_AGENTS]
-            ordered_max_agents = sorted(max_agents, key=lambda x: agent_order.index(x) if x in agent_order else float('inf'))
-            selected_agent = ordered_max_agents[0]
-    else:
+    if selected_agent is None:
         # Si no hay coincidencias claras, usar el contexto si existe
-        if context and "last_agent" in context:
+        if context and "last_agent" in context and context["last_agent"] not in unavailable:
             selected_agent = context["last_agent"]
         else:
-            # Por defecto, enviar al agente de entrenamiento
-            selected_agent = "training"
+            # Por defecto, el agente configurado en routing.json
+            selected_agent = snapshot.default_agent
     
-    # Buscar el agente seleccionado en la lista de agentes disponibles
-    agent_info = next((agent for agent in AVAILABLE_AGENTS if agent["agent_id"] == selected_agent), None)
+    # Buscar el agente seleccionado en el registro de agentes disponibles
+    record = snapshot.registry.get(selected_agent)
+    
+    if record is None:
+        # Si por alguna razón no se encuentra, usar el primero (el orquestador)
+        record = snapshot.registry.records[0]
+    
+    return record.info
+
+async def _simulated_agent(request: Dict[str, Any]) -> AsyncIterator[Union[str, Dict[str, Any]]]:
+    """Agente simulado que responde mientras no haya agentes reales registrados.
+
+    Responde por partes, como lo hará un agente basado en un LLM: primero los
+    fragmentos del texto y al final la respuesta completa.
+    """
+    agent = request["agent"]
+    if request["type"] == "message":
+        yield {
+            "text": f"Mensaje recibido por el agente {agent['agent_name']}. En una implementación real, se procesaría y se enviaría una respuesta."
+        }
+        return
     
-    if not agent_info:
-        # Si por alguna razón no se encuentra, usar el orquestador
-        agent_info = AVAILABLE_AGENTS[0]  # El orquestador
+    text = f"Tu consulta '{request['query']}' ha sido dirigida al agente {agent['agent_name']}."
+    for word in text.split(" "):
+        yield word + " "
     
-    return agent_info
+    yield {
+        "text": text,
+        "agent": agent,
+        "recommendations": [
+            "Esta es una respuesta simulada. En una implementación real, recibirías respuesta del agente específico."
+        ],
+        "next_steps": [
+            "Continuar el desarrollo de la API para el agente " + agent["agent_id"]
+        ]
+    }
+
+def _record_agent_call(agent_id: str, latency: float, ok: bool) -> None:
+    get_health_tracker().record_call(agent_id, latency, ok)
+    _agent_call_seconds.observe(latency, agent_id, "ok" if ok else "error")
+
+# Una cola acotada y un pool de workers por agente: un agente lento no frena a los demás
+_dispatcher = dispatcher_from_env(_simulated_agent, on_result=_record_agent_call)
+
+def _dispatch_error(agent_id: str, error: Exception) -> HTTPException:
+    """Traduce los errores del dispatcher a errores HTTP"""
+    if isinstance(error, HTTPException):
+        return error
+    if isinstance(error, AgentQueueFullError):
+        return HTTPException(
+            status_code=429,
+            detail=f"El agente {agent_id} está saturado, inténtalo más tarde",
+            headers={"Retry-After": "1"},
+        )
+    if isinstance(error, AgentTimeoutError):
+        return HTTPException(status_code=504, detail=f"El agente {agent_id} no respondió a tiempo")
+    return HTTPException(status_code=502, detail=f"Error del agente {agent_id}: {str(error)}")
 
-# Función para almacenar una sesión de usuario
-def store_session(session_id: str, user_id: str, data: Dict[str, Any]):
-    """Almacena o actualiza una sesión de usuario"""
+def _error_details(errors: Dict[str, HTTPException]) -> Dict[str, str]:
+    return {agent_id: error.detail for agent_id, error in errors.items()}
+
+async def _dispatch(agent_id: str, request: Dict[str, Any]) -> Dict[str, Any]:
+    """Envía la petición al agente traduciendo la saturación y los plazos a errores HTTP"""
     try:
-        session_key = f"session_{user_id}_{session_id}"
-        sanitized_key = ''.join(c for c in session_key if c.isalnum() or c in '._-')
-        
-        # Obtener la sesión existente o crear una nueva
-        try:
-            session = db.storage.json.get(sanitized_key, {})
-        except FileNotFoundError:
-            session = {}
-        
-        # Actualizar con los nuevos datos
-        session.update(data)
-        
-        # Agregar timestamp de última actualización
-        session["last_updated"] = datetime.utcnow().isoformat()
-        
-        # Guardar la sesión actualizada
-        db.storage.json.put(sanitized_key, session)
-        
-        return True
-    except Exception as e:
-        print(f"Error al almacenar sesión: {str(e)}")
-        return False
+        return await _dispatcher.dispatch(agent_id, request)
+    except (AgentQueueFullError, AgentTimeoutError) as e:
+        raise _dispatch_error(agent_id, e)
+
+@on_shutdown
+async def _close_dispatcher() -> None:
+    await _dispatcher.close()
+
+def _collect_metrics() -> List[Tuple[str, str, str, List[Tuple[Dict[str, Any], float]]]]:
+    """Estado de los pools de agentes y de la escritura diferida de sesiones"""
+    pools = _dispatcher.stats()
+    writer = get_session_writer().stats()
+    families = [
+        (f"agent_pool_{field}", kind, help, [({"agent": agent_id}, stats[field]) for agent_id, stats in pools.items()])
+        for field, kind, help in (
+            ("queued", "gauge", "Peticiones en la cola del agente"),
+            ("in_flight", "gauge", "Peticiones en curso del agente"),
+            ("rejected", "counter", "Peticiones rechazadas por cola llena"),
+            ("timeouts", "counter", "Peticiones que superaron el plazo"),
+        )
+    ]
+    families.append(("session_writes_pending", "gauge", "Sesiones pendientes de escribir", [({}, writer["pending"])]))
+    families.append(("session_writes_total", "counter", "Escrituras de sesiones realizadas", [({}, writer["writes"])]))
+    families.extend(cache_families("session_cache", {"session": get_session_writer().cache}))
+    return families
+
+get_metrics().collector("orchestrator", _collect_metrics)
+
+# Límites del modo multiagente
+FANOUT_MIN_SCORE = int(os.environ.get("ORCHESTRATOR_FANOUT_MIN_SCORE", 1))
+FANOUT_MAX_AGENTS = int(os.environ.get("ORCHESTRATOR_FANOUT_MAX_AGENTS", 3))
+FANOUT_DEADLINE_SECONDS = float(os.environ.get("ORCHESTRATOR_FANOUT_DEADLINE_SECONDS", 10))
 
-# Función para obtener una sesión de usuario
-def get_session(session_id: str, user_id: str) -> Dict[str, Any]:
-    """Obtiene una sesión de usuario"""
+def select_agents(query: str, context: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+    """Agentes disponibles con puntuación suficiente, del más al menos relevante"""
+    snapshot = get_routing_table().snapshot()
+    unavailable = get_health_tracker().snapshot(snapshot.registry).unavailable
+    ranked = snapshot.matcher.ranked(query, min_score=FANOUT_MIN_SCORE, exclude=unavailable)
+    agents = [snapshot.registry.get(agent_id).info for agent_id, _ in ranked[:FANOUT_MAX_AGENTS]]
+    # Sin coincidencias se usa el mismo criterio que el modo de un solo agente
+    return agents or [route_query_to_agent(query, context)]
+
+async def _fan_out_query(agents: List[Dict[str, Any]], request: Dict[str, Any], deadline: float) -> Dict[str, Any]:
+    """Consulta a varios agentes a la vez y combina las respuestas recibidas a tiempo"""
+    calls = {
+        agent["agent_id"]: functools.partial(_dispatch, agent["agent_id"], {**request, "agent": agent})
+        for agent in agents
+    }
+    results, errors = await fan_out(calls, deadline)
+    if not results:
+        raise HTTPException(status_code=504, detail=f"Ningún agente respondió a tiempo: {errors}")
+    return merge_responses(agents, results, errors)
+
+async def _load_session(session_id: str, user_id: str) -> Dict[str, Any]:
+    """Obtiene la sesión incluyendo las actualizaciones aún no escritas"""
     try:
-        session_key = f"session_{user_id}_{session_id}"
-        sanitized_key = ''.join(c for c in session_key if c.isalnum() or c in '._-')
-        
-        try:
-            session = db.storage.json.get(sanitized_key, {})
-        except FileNotFoundError:
-            session = {}
-        
-        return session
+        return await get_session_writer().get(session_id, user_id)
     except Exception as e:
         print(f"Error al obtener sesión: {str(e)}")
         return {}
 
+async def _prepare_query(request: AgentRequest, current_user: dict) -> Dict[str, Any]:
+    """Resuelve usuario, sesión y agentes de una consulta y actualiza la sesión"""
+    # Generar ID de solicitud
+    request_id = str(uuid.uuid4())
+    timestamp = datetime.utcnow().isoformat()
+    
+    # Obtener ID de usuario (del token o del proporcionado en la solicitud)
+    user_id = current_user.get("sub") or request.user_id
+    if not user_id:
+        raise HTTPException(status_code=400, detail="Se requiere ID de usuario")
+    
+    # Obtener o generar ID de sesión
+    session_id = request.session_id or str(uuid.uuid4())
+    
+    # Obtener contexto de la sesión si existe
+    started = time.perf_counter()
+    session_context = await _load_session(session_id, user_id)
+    routing_started = time.perf_counter()
+    _stage_seconds.observe(routing_started - started, "session_read")
+    
+    # Combinar con el contexto proporcionado en la solicitud
+    context = session_context
+    if request.context:
+        context.update(request.context)
+    
+    # Determinar qué agente (o agentes, en modo multiagente) debe manejar la consulta
+    if request.multi_agent:
+        target_agents = select_agents(request.query, context)
+    else:
+        target_agents = [route_query_to_agent(request.query, context)]
+    write_started = time.perf_counter()
+    _stage_seconds.observe(write_started - routing_started, "routing")
+    mode = "multi" if request.multi_agent else "single"
+    for agent in target_agents:
+        _routed.inc(agent["agent_id"], mode)
+    
+    # Actualizar el contexto con el agente seleccionado
+    context["last_agent"] = target_agents[0]["agent_id"]
+    context["last_query"] = request.query
+    context["last_timestamp"] = timestamp
+    
+    # Almacenar la sesión actualizada (escritura diferida y agrupada por sesión)
+    await get_session_writer().put(session_id, user_id, context)
+    _stage_seconds.observe(time.perf_counter() - write_started, "session_write")
+    
+    return {
+        "request_id": request_id,
+        "timestamp": timestamp,
+        "session_id": session_id,
+        "agents": target_agents,
+        "agent_request": {
+            "type": "query",
+            "query": request.query,
+            "context": context,
+            "user_id": user_id,
+            "session_id": session_id,
+        },
+    }
+
+def _build_response(plan: Dict[str, Any], agent_response: Dict[str, Any]) -> AgentResponse:
+    return AgentResponse(
+        request_id=plan["request_id"],
+        response=agent_response,
+        agent_id="orchestrator",
+        agent_name="Master Agent Orchestrator",
+        timestamp=plan["timestamp"],
+        session_id=plan["session_id"]
+    )
+
+async def _stream_agents(
+    agents: List[Dict[str, Any]],
+    agent_request: Dict[str, Any],
+    deadline: Optional[float],
+    results: Dict[str, Dict[str, Any]],
+    errors: Dict[str, HTTPException],
+) -> AsyncIterator[Dict[str, Any]]:
+    """Produce los fragmentos de todos los agentes según llegan y deja sus respuestas en `results`"""
+    chunks: asyncio.Queue = asyncio.Queue()
+    
+    async def run(agent: Dict[str, Any]) -> None:
+        agent_id = agent["agent_id"]
+        try:
+            async for kind, payload in _dispatcher.stream(agent_id, {**agent_request, "agent": agent}):
+                if kind == "chunk":
+                    chunks.put_nowait({"agent_id": agent_id, "text": payload})
+                else:
+                    results[agent_id] = payload
+        except Exception as e:
+            errors[agent_id] = _dispatch_error(agent_id, e)
+    
+    tasks = [asyncio.ensure_future(run(agent)) for agent in agents]
+    finished = asyncio.ensure_future(asyncio.wait(tasks, timeout=deadline))
+    try:
+        while not finished.done():
+            getter = asyncio.ensure_future(chunks.get())
+            await asyncio.wait({getter, finished}, return_when=asyncio.FIRST_COMPLETED)
+            if getter.done():
+                yield getter.result()
+            else:
+                getter.cancel()
+        while not chunks.empty():
+            yield chunks.get_nowait()
+    finally:
+        # Los agentes que no terminaron dentro del plazo (o si el cliente se fue) se cancelan
+        finished.cancel()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    
+    for agent in agents:
+        if agent["agent_id"] not in results and agent["agent_id"] not in errors:
+            errors[agent["agent_id"]] = HTTPException(status_code=504, detail="timeout")
+
+async def _query_events(plan: Dict[str, Any], request: AgentRequest) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+    """Eventos de una consulta: decisión de enrutamiento, fragmentos y resultado final"""
+    agents = plan["agents"]
+    yield ("routing", {
+        "request_id": plan["request_id"],
+        "session_id": plan["session_id"],
+        "multi_agent": request.multi_agent,
+        "agents": agents,
+    })
+    
+    deadline = request.deadline_seconds or (FANOUT_DEADLINE_SECONDS if request.multi_agent else None)
+    results: Dict[str, Dict[str, Any]] = {}
+    errors: Dict[str, HTTPException] = {}
+    async for chunk in _stream_agents(agents, plan["agent_request"], deadline, results, errors):
+        yield ("chunk", chunk)
+    
+    if not results:
+        error = errors[agents[0]["agent_id"]] if len(agents) == 1 else HTTPException(
+            status_code=504, detail=f"Ningún agente respondió a tiempo: {_error_details(errors)}"
+        )
+        yield ("error", {"status_code": error.status_code, "detail": error.detail})
+        return
+    
+    if request.multi_agent:
+        agent_response = merge_responses(agents, results, _error_details(errors))
+    else:
+        agent_response = results[agents[0]["agent_id"]]
+    yield ("result", _build_response(plan, agent_response).model_dump())
+
+def _sse_event(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
 # Endpoints de la API
 @router.post("/query")
 async def process_query(request: AgentRequest, current_user: dict = Depends(get_current_user)) -> AgentResponse:
     """Procesa una consulta de usuario y la dirige al agente adecuado"""
     try:
-        # Generar ID de solicitud
-        request_id = str(uuid.uuid4())
-        timestamp = datetime.utcnow().isoformat()
+        plan = await _prepare_query(request, current_user)
+        target_agents = plan["agents"]
         
-        # Obtener ID de usuario (del token o del proporcionado en la solicitud)
-        user_id = current_user.get("sub") or request.user_id
-        if not user_id:
-            raise HTTPException(status_code=400, detail="Se requiere ID de usuario")
-        
-        # Obtener o generar ID de sesión
-        session_id = request.session_id or str(uuid.uuid4())
-        
-        # Obtener contexto de la sesión si existe
-        session_context = get_session(session_id, user_id)
-        
-        # Combinar con el contexto proporcionado en la solicitud
-        context = session_context
-        if request.context:
-            context.update(request.context)
-        
-        # Determinar qué agente debe manejar la consulta
-        target_agent = route_query_to_agent(request.query, context)
-        
-        # Actualizar el contexto con el agente seleccionado
-        context["last_agent"] = target_agent["agent_id"]
-        context["last_query"] = request.query
-        context["last_timestamp"] = timestamp
-        
-        # Almacenar la sesión actualizada
-        store_session(session_id, user_id, context)
-        
-        # Aquí deberíamos enviar la consulta al agente específico
-        # Por ahora, simulamos una respuesta
-        
-        # Respuesta simulada del agente
-        agent_response = {
-            "text": f"Tu consulta '{request.query}' ha sido dirigida al agente {target_agent['agent_name']}.",
-            "agent": target_agent,
-            "recommendations": [
-                "Esta es una respuesta simulada. En una implementación real, recibirías respuesta del agente específico."
-            ],
-            "next_steps": [
-                "Continuar el desarrollo de la API para el agente " + target_agent["agent_id"]
-            ]
-        }
+        if request.multi_agent:
+            # Todos los agentes a la vez: se espera al más lento dentro del plazo, no a la suma
+            deadline = request.deadline_seconds or FANOUT_DEADLINE_SECONDS
+            agent_response = await _fan_out_query(target_agents, plan["agent_request"], deadline)
+        else:
+            # Enviar la consulta al pool de workers del agente elegido
+            target_agent = target_agents[0]
+            agent_response = await _dispatch(target_agent["agent_id"], {**plan["agent_request"], "agent": target_agent})
         
-        return AgentResponse(
-            request_id=request_id,
-            response=agent_response,
-            agent_id="orchestrator",
-            agent_name="Master Agent Orchestrator",
-            timestamp=timestamp,
-            session_id=session_id
-        )
+        return _build_response(plan, agent_response)
         
     except Exception as e:
+        if isinstance(e, HTTPException):
+            raise e
         raise HTTPException(status_code=500, detail=f"Error al procesar la consulta: {str(e)}")
 
-@router.get("/agents/status")
-async def get_agents_status(current_user: dict = Depends(get_current_user)) -> AllAgentsStatus:
+@router.post("/query/stream")
+async def stream_query(request: AgentRequest, current_user: dict = Depends(get_current_user)) -> StreamingResponse:
+    """Procesa una consulta y envía por SSE el enrutamiento, los fragmentos y el resultado"""
+    try:
+        plan = await _prepare_query(request, current_user)
+    except Exception as e:
+        if isinstance(e, HTTPException):
+            raise e
+        raise HTTPException(status_code=500, detail=f"Error al procesar la consulta: {str(e)}")
+    
+    async def events() -> AsyncIterator[str]:
+        try:
+            async for event, data in _query_events(plan, request):
+                yield _sse_event(event, data)
+        except Exception as e:
+            yield _sse_event("error", {"status_code": 500, "detail": f"Error al procesar la consulta: {str(e)}"})
+    
+    # Sin buffering en proxies intermedios para que cada evento llegue al momento
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@router.websocket("/query/ws")
+async def query_websocket(websocket: WebSocket, current_user: dict = Depends(get_current_user_ws)):
+    """Consultas por WebSocket: cada mensaje JSON es un AgentRequest y se responde con eventos"""
+    await websocket.accept(subprotocol=websocket_subprotocol(websocket))
+    try:
+        while True:
+            payload = await websocket.receive_json()
+            try:
+                request = AgentRequest.model_validate(payload)
+                plan = await _prepare_query(request, current_user)
+                async for event, data in _query_events(plan, request):
+                    await websocket.send_json({"event": event, "data": data})
+            except ValidationError as e:
+                await websocket.send_json({"event": "error", "data": {"status_code": 422, "detail": e.errors(include_url=False)}})
+            except HTTPException as e:
+                await websocket.send_json({"event": "error", "data": {"status_code": e.status_code, "detail": e.detail}})
+            except WebSocketDisconnect:
+                raise
+            except Exception as e:
+                await websocket.send_json({"event": "error", "data": {"status_code": 500, "detail": f"Error al procesar la consulta: {str(e)}"}})
+    except WebSocketDisconnect:
+        pass
+
+@router.get("/agents/status", response_model=AllAgentsStatus)
+async def get_agents_status(current_user: dict = Depends(get_current_user)) -> Response:
     """Obtiene el estado de todos los agentes disponibles"""
     try:
-        timestamp = datetime.utcnow().isoformat()
-        
-        # Por ahora, todos los agentes tienen el mismo estado
-        agents_status = []
-        for agent in AVAILABLE_AGENTS:
-            # En una implementación real, deberíamos verificar el estado real de cada agente
-            agents_status.append(AgentStatus(
-                agent_id=agent["agent_id"],
-                agent_name=agent["agent_name"],
-                status="online",  # Simular que todos están en línea
-                last_active=timestamp,
-                description=agent["description"]
-            ))
-        
-        return AllAgentsStatus(
-            agents=agents_status,
-            timestamp=timestamp
-        )
+        # Instantánea cacheada y ya serializada: consultarla a menudo no recalcula nada
+        registry = get_routing_table().snapshot().registry
+        return Response(content=get_health_tracker().snapshot(registry).body, media_type="application/json")
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error al obtener el estado de los agentes: {str(e)}")
 
+@router.get("/dispatch")
+async def get_dispatch_stats(current_user: dict = Depends(get_current_user)) -> Dict[str, Any]:
+    """Devuelve el estado de las colas y workers de cada agente"""
+    return {"agents": _dispatcher.stats()}
+
+@router.get("/routing")
+async def get_routing_info(current_user: dict = Depends(get_current_user)) -> Dict[str, Any]:
+    """Devuelve la versión de la tabla de enrutamiento en uso"""
+    table = get_routing_table()
+    return {**table.snapshot().summary(), "reloads": table.reloads, "reload_errors": table.reload_errors}
+
+@router.post("/routing/reload")
+async def reload_routing(current_user: dict = Depends(get_current_user)) -> Dict[str, Any]:
+    """Fuerza la relectura de routing.json sin esperar al sondeo periódico"""
+    table = get_routing_table()
+    reloaded = await run_blocking(table.reload)
+    return {**table.snapshot().summary(), "reloaded": reloaded}
+
 @router.get("/agent/{agent_id}")
 async def get_agent_info(agent_id: str, current_user: dict = Depends(get_current_user)) -> AgentStatus:
     """Obtiene información detallada de un agente específico"""
     try:
-        # Buscar el agente en la lista de agentes disponibles
-        agent_info = next((agent for agent in AVAILABLE_AGENTS if agent["agent_id"] == agent_id), None)
+        registry = get_routing_table().snapshot().registry
+        payload = get_health_tracker().agent_payload(registry, agent_id)
         
-        if not agent_info:
+        if payload is None:
             raise HTTPException(status_code=404, detail=f"Agente no encontrado: {agent_id}")
         
-        timestamp = datetime.utcnow().isoformat()
-        
-        # En una implementación real, deberíamos verificar el estado real del agente
-        return AgentStatus(
-            agent_id=agent_info["agent_id"],
-            agent_name=agent_info["agent_name"],
-            status="online",  # Simular que está en línea
-            last_active=timestamp,
-            description=agent_info["description"]
-        )
+        return payload
         
     except Exception as e:
         if isinstance(e, HTTPException):
             raise e
         raise HTTPException(status_code=500, detail=f"Error al obtener información del agente: {str(e)}")
 
+@router.post("/agent/{agent_id}/heartbeat")
+async def agent_heartbeat(agent_id: str, heartbeat: AgentHeartbeat, current_user: dict = Depends(get_current_user)) -> Dict[str, Any]:
+    """Registra un latido de un agente especializado"""
+    if agent_id not in get_routing_table().snapshot().registry:
+        raise HTTPException(status_code=404, detail=f"Agente no encontrado: {agent_id}")
+    
+    health = get_health_tracker()
+    status = health.heartbeat(agent_id, load=heartbeat.load)
+    await health.publish_heartbeat(agent_id)
+    return {"agent_id": agent_id, "status": status}
+
 @router.post("/agent/{agent_id}/message")
 async def send_message_to_agent(agent_id: str, message: A2AMessage, current_user: dict = Depends(get_current_user)) -> Dict[str, Any]:
     """Envía un mensaje a un agente específico"""
     try:
         # Verificar que el agente existe
-        agent_info = next((agent for agent in AVAILABLE_AGENTS if agent["agent_id"] == agent_id), None)
+        agent_info = get_routing_table().snapshot().registry.get(agent_id)
         
-        if not agent_info:
+        if agent_info is None:
             raise HTTPException(status_code=404, detail=f"Agente no encontrado: {agent_id}")
         
-        # Aquí deberíamos enviar el mensaje al agente específico
-        # Por ahora, simulamos una respuesta
-        
         # Generar IDs de mensaje y conversación si no se proporcionan
         message_id = message.message_id or str(uuid.uuid4())
         conversation_id = message.conversation_id or str(uuid.uuid4())
         timestamp = datetime.utcnow().isoformat()
         
-        # Respuesta simulada
+        # Enviar el mensaje al pool de workers del agente
+        agent_response = await _dispatch(agent_id, {
+            "type": "message",
+            "message": message.model_dump(),
+            "agent": agent_info.info,
+        })
+        
         return {
             "message_id": message_id,
             "conversation_id": conversation_id,
             "timestamp": timestamp,
             "status": "received",
-            "message": f"Mensaje recibido por el agente {agent_info['agent_name']}. En una implementación real, se procesaría y se enviaría una respuesta."
+            "message": agent_response["text"]
         }
         
     except Exception as e:
@@ -19,7 +19,17 @@ class Mode(str, Enum):
 
 mode = Mode.PROD if os.environ.get("DATABUTTON_SERVICE_TYPE") == "prodx" else Mode.DEV
 
+
+def env_flag(name: str, default: bool = False) -> bool:
+    """Lee una variable de entorno booleana ("1", "true", "yes")"""
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes")
+
+
 __all__ = [
     "Mode",
     "mode",
+    "env_flag",
 ]
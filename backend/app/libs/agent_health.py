@@ -0,0 +1,299 @@
+"""Seguimiento de la salud de los agentes a partir de latidos y llamadas.
+
+Los agentes informan de que siguen vivos con `heartbeat` (opcionalmente con su
+carga, de 0 a 1) y el dispatcher registra cada llamada con `record_call`. Con
+eso `AgentHealthTracker` calcula el estado de cada agente:
+
+- `unknown`: nunca ha enviado un latido; se le siguen enviando consultas.
+- `online`: latido reciente, tasa de errores y carga bajo los umbrales.
+- `degraded`: tasa de errores o carga por encima del umbral. La tasa de errores
+  solo cuenta las llamadas de los últimos `AGENT_HEALTH_WINDOW_SECONDS`: el
+  enrutamiento deja de enviar consultas a un agente degradado, así que sus
+  fallos caducan y vuelve a estar `online` pasado ese tiempo.
+- `offline`: su último latido es más antiguo que `AGENT_HEARTBEAT_TIMEOUT_SECONDS`.
+
+El endpoint de estado sirve una instantánea, ya serializada, que se reconstruye
+como mucho una vez cada `AGENT_STATUS_CACHE_SECONDS` (o antes si un agente
+cambia de estado), así que muchos paneles consultándolo no cuestan nada. La misma instantánea
+expone los agentes no disponibles para que el enrutamiento los evite.
+
+Con varios workers cada latido llega solo a uno de ellos. Si hay un estado
+compartido entre procesos (`SHARED_STATE_URL`, ver `app.libs.shared_state`) el
+endpoint de latidos publica cada uno con `publish_heartbeat` y cada worker
+incorpora los de los demás cada `AGENT_STATUS_CACHE_SECONDS` (`sync`, en un
+hilo), así que todos coinciden en qué agentes están `offline` o sobrecargados.
+La tasa de errores sigue siendo la de las llamadas que hace cada worker.
+
+Usage:
+
+    from app.libs.agent_health import get_health_tracker
+
+    health = get_health_tracker()
+    health.heartbeat("training", load=0.3)
+    health.record_call("training", latency=0.120, ok=True)
+    health.snapshot(registry).unavailable  # frozenset de agentes a evitar
+"""
+
+import asyncio
+import functools
+import json
+import os
+import time
+from collections import deque
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Callable, Deque, Dict, FrozenSet, List, Optional, Tuple
+
+from app.libs.agent_registry import AgentRegistry
+from app.libs.async_storage import run_blocking
+from app.libs.lifecycle import on_shutdown, on_startup
+from app.libs.routing import get_routing_table
+from app.libs.shared_state import SharedState, get_shared_state
+
+DEFAULT_HEARTBEAT_TIMEOUT_SECONDS = 30.0
+DEFAULT_STATUS_CACHE_SECONDS = 1.0
+DEFAULT_ERROR_RATE_THRESHOLD = 0.5
+DEFAULT_OVERLOAD_THRESHOLD = 0.9
+DEFAULT_WINDOW_SECONDS = 60.0
+
+UNAVAILABLE_STATUSES = frozenset({"degraded", "offline"})
+
+
+class AgentHealth:
+    """Estado vivo de un agente: último latido y ventana móvil de llamadas"""
+
+    def __init__(self, window: int):
+        self.last_heartbeat: Optional[float] = None
+        self.last_active: Optional[str] = None
+        self.load: Optional[float] = None
+        # (instante, latencia, ok) de las últimas llamadas, de la más antigua a la más reciente
+        self.calls: Deque[Tuple[float, float, bool]] = deque(maxlen=window)
+
+    def expire(self, cutoff: float) -> None:
+        """Descarta las llamadas anteriores a `cutoff`"""
+        while self.calls and self.calls[0][0] < cutoff:
+            self.calls.popleft()
+
+    def latency_ms(self) -> Optional[float]:
+        if not self.calls:
+            return None
+        return round(sum(latency for _, latency, _ in self.calls) / len(self.calls) * 1000, 3)
+
+    def error_rate(self) -> Optional[float]:
+        if not self.calls:
+            return None
+        return round(sum(1 for _, _, ok in self.calls if not ok) / len(self.calls), 4)
+
+
+@dataclass(frozen=True)
+class HealthSnapshot:
+    """Estado de todos los agentes en un instante; no se modifica una vez creado"""
+
+    built_at: float
+    registry: AgentRegistry
+    statuses: Dict[str, str]
+    unavailable: FrozenSet[str]
+    payload: Dict[str, Any]
+    body: bytes
+
+
+class AgentHealthTracker:
+    """Tabla en memoria con la salud de cada agente y una instantánea cacheada"""
+
+    def __init__(
+        self,
+        heartbeat_timeout: float = DEFAULT_HEARTBEAT_TIMEOUT_SECONDS,
+        cache_seconds: float = DEFAULT_STATUS_CACHE_SECONDS,
+        error_rate_threshold: float = DEFAULT_ERROR_RATE_THRESHOLD,
+        overload_threshold: float = DEFAULT_OVERLOAD_THRESHOLD,
+        min_calls: int = 5,
+        window: int = 100,
+        window_seconds: float = DEFAULT_WINDOW_SECONDS,
+        local_agents: Tuple[str, ...] = ("orchestrator",),
+        clock: Callable[[], float] = time.monotonic,
+        shared: Optional[SharedState] = None,
+    ):
+        self.heartbeat_timeout = heartbeat_timeout
+        self.cache_seconds = cache_seconds
+        self.error_rate_threshold = error_rate_threshold
+        self.overload_threshold = overload_threshold
+        self.min_calls = min_calls
+        self.window = window
+        self.window_seconds = window_seconds
+        # Agentes que corren en este mismo proceso: siempre en línea
+        self.local_agents = frozenset(local_agents)
+        self._clock = clock
+        self._agents: Dict[str, AgentHealth] = {}
+        self._snapshot: Optional[HealthSnapshot] = None
+        self.rebuilds = 0
+        # Latidos compartidos entre workers; con él `clock` debe ser la hora de pared
+        self.shared = shared
+        self._task: Optional[asyncio.Task] = None
+
+    def _health(self, agent_id: str) -> AgentHealth:
+        health = self._agents.get(agent_id)
+        if health is None:
+            health = self._agents[agent_id] = AgentHealth(self.window)
+        return health
+
+    def _invalidate_if_changed(self, agent_id: str, before: str) -> None:
+        # Un cambio de estado se publica al momento; el resto espera al TTL
+        if self._snapshot is not None and self.status(agent_id) != before:
+            self._snapshot = None
+
+    def heartbeat(self, agent_id: str, load: Optional[float] = None) -> str:
+        """Registra un latido del agente y devuelve su estado resultante"""
+        before = self.status(agent_id)
+        health = self._health(agent_id)
+        health.last_heartbeat = self._clock()
+        health.last_active = datetime.utcnow().isoformat()
+        health.load = load
+        self._invalidate_if_changed(agent_id, before)
+        return self.status(agent_id)
+
+    @staticmethod
+    def _heartbeat_key(agent_id: str) -> str:
+        return f"agent_heartbeat:{agent_id}"
+
+    async def publish_heartbeat(self, agent_id: str) -> None:
+        """Deja el último latido del agente en el estado compartido para los demás workers"""
+        health = self._agents.get(agent_id)
+        if self.shared is None or health is None or health.last_heartbeat is None:
+            return
+        beat = {"at": health.last_heartbeat, "last_active": health.last_active, "load": health.load}
+        await run_blocking(self.shared.set, self._heartbeat_key(agent_id), beat, self.heartbeat_timeout * 2)
+
+    def _read_heartbeats(self, agent_ids: Tuple[str, ...]) -> Dict[str, Dict[str, Any]]:
+        beats = {agent_id: self.shared.get(self._heartbeat_key(agent_id)) for agent_id in agent_ids}
+        return {agent_id: beat for agent_id, beat in beats.items() if beat is not None}
+
+    async def sync(self, agent_ids: Tuple[str, ...]) -> None:
+        """Incorpora los latidos más recientes que otros workers publicaron"""
+        if self.shared is None:
+            return
+        beats = await run_blocking(self._read_heartbeats, tuple(agent_ids))
+        for agent_id, beat in beats.items():
+            health = self._health(agent_id)
+            if health.last_heartbeat is not None and beat["at"] <= health.last_heartbeat:
+                continue
+            before = self.status(agent_id)
+            health.last_heartbeat = beat["at"]
+            health.last_active = beat["last_active"]
+            health.load = beat["load"]
+            self._invalidate_if_changed(agent_id, before)
+
+    async def _sync_loop(self) -> None:
+        while True:
+            try:
+                await self.sync(get_routing_table().snapshot().registry.ids)
+            except Exception as e:
+                print(f"Error al sincronizar latidos de agentes: {str(e)}")
+            await asyncio.sleep(self.cache_seconds)
+
+    def start(self) -> None:
+        if self.shared is not None and (self._task is None or self._task.done()):
+            self._task = asyncio.get_running_loop().create_task(self._sync_loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def record_call(self, agent_id: str, latency: float, ok: bool) -> None:
+        """Registra la duración (en segundos) y el resultado de una llamada al agente"""
+        before = self.status(agent_id)
+        self._health(agent_id).calls.append((self._clock(), latency, ok))
+        self._invalidate_if_changed(agent_id, before)
+
+    def status(self, agent_id: str) -> str:
+        if agent_id in self.local_agents:
+            return "online"
+        health = self._agents.get(agent_id)
+        if health is None or health.last_heartbeat is None:
+            return "unknown"
+        now = self._clock()
+        if now - health.last_heartbeat > self.heartbeat_timeout:
+            return "offline"
+        health.expire(now - self.window_seconds)
+        error_rate = health.error_rate()
+        if len(health.calls) >= self.min_calls and error_rate >= self.error_rate_threshold:
+            return "degraded"
+        if health.load is not None and health.load >= self.overload_threshold:
+            return "degraded"
+        return "online"
+
+    def _agent_payload(self, registry: AgentRegistry, agent_id: str, status: str, now: str) -> Dict[str, Any]:
+        health = self._agents.get(agent_id)
+        last_active = now if agent_id in self.local_agents else (health.last_active if health else None)
+        payload = registry.status_payload(agent_id, status, last_active)
+        payload["latency_ms"] = health.latency_ms() if health else None
+        payload["error_rate"] = health.error_rate() if health else None
+        payload["load"] = health.load if health else None
+        return payload
+
+    def snapshot(self, registry: AgentRegistry) -> HealthSnapshot:
+        """Instantánea del estado de los agentes del registro, cacheada brevemente"""
+        now = self._clock()
+        snapshot = self._snapshot
+        if (
+            snapshot is not None
+            and snapshot.registry is registry
+            and now - snapshot.built_at < self.cache_seconds
+        ):
+            return snapshot
+
+        timestamp = datetime.utcnow().isoformat()
+        statuses = {agent_id: self.status(agent_id) for agent_id in registry.ids}
+        agents: List[Dict[str, Any]] = [
+            self._agent_payload(registry, agent_id, status, timestamp)
+            for agent_id, status in statuses.items()
+        ]
+        snapshot = HealthSnapshot(
+            built_at=now,
+            registry=registry,
+            statuses=statuses,
+            unavailable=frozenset(agent_id for agent_id, status in statuses.items() if status in UNAVAILABLE_STATUSES),
+            payload={"agents": agents, "timestamp": timestamp},
+            body=json.dumps({"agents": agents, "timestamp": timestamp}).encode(),
+        )
+        self._snapshot = snapshot
+        self.rebuilds += 1
+        return snapshot
+
+    def agent_payload(self, registry: AgentRegistry, agent_id: str) -> Optional[Dict[str, Any]]:
+        """Estado de un agente tomado de la instantánea vigente"""
+        snapshot = self.snapshot(registry)
+        record = registry.get(agent_id)
+        if record is None:
+            return None
+        return snapshot.payload["agents"][record.rank]
+
+
+@functools.cache
+def get_health_tracker() -> AgentHealthTracker:
+    """Devuelve el registro de salud de agentes compartido por la aplicación"""
+    state = get_shared_state()
+    return AgentHealthTracker(
+        heartbeat_timeout=float(os.environ.get("AGENT_HEARTBEAT_TIMEOUT_SECONDS", DEFAULT_HEARTBEAT_TIMEOUT_SECONDS)),
+        cache_seconds=float(os.environ.get("AGENT_STATUS_CACHE_SECONDS", DEFAULT_STATUS_CACHE_SECONDS)),
+        error_rate_threshold=float(os.environ.get("AGENT_ERROR_RATE_THRESHOLD", DEFAULT_ERROR_RATE_THRESHOLD)),
+        overload_threshold=float(os.environ.get("AGENT_OVERLOAD_THRESHOLD", DEFAULT_OVERLOAD_THRESHOLD)),
+        window_seconds=float(os.environ.get("AGENT_HEALTH_WINDOW_SECONDS", DEFAULT_WINDOW_SECONDS)),
+        # Los latidos compartidos se comparan entre procesos: hora de pared
+        clock=time.time if state.shared else time.monotonic,
+        shared=state if state.shared else None,
+    )
+
+
+@on_startup
+def _sync_heartbeats() -> None:
+    get_health_tracker().start()
+
+
+@on_shutdown
+async def _stop_heartbeat_sync() -> None:
+    await get_health_tracker().stop()
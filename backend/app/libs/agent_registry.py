@@ -0,0 +1,78 @@
+"""Registro de agentes con búsqueda por id en tiempo constante.
+
+Cada agente de la tabla de enrutamiento se convierte en un `AgentRecord`
+inmutable. `AgentRegistry` indexa los registros por id, guarda el rango de
+prioridad de cada agente (su posición en `routing.json`) y precalcula la parte
+fija de las respuestas de estado, de modo que buscar un agente o listar su
+estado no recorre la lista ni vuelve a construir los diccionarios base.
+
+Usage:
+
+    from app.libs.agent_registry import AgentRegistry
+
+    registry = AgentRegistry(agents)
+    record = registry.get("training")
+    record.rank                      # 1
+    registry.status_payload("training", "online", timestamp)
+"""
+
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+AGENT_INFO_FIELDS = ("agent_id", "agent_name", "description")
+
+
+@dataclass(frozen=True)
+class AgentRecord:
+    """Datos de un agente; `info` es el diccionario público y no debe modificarse"""
+
+    agent_id: str
+    agent_name: str
+    description: str
+    keywords: Tuple[str, ...]
+    rank: int
+    info: Dict[str, Any] = field(compare=False, repr=False)
+
+
+class AgentRegistry:
+    """Agentes indexados por id en el orden de prioridad de la configuración"""
+
+    def __init__(self, agents: List[Dict[str, Any]]):
+        records = []
+        by_id: Dict[str, AgentRecord] = {}
+        for rank, agent in enumerate(agents):
+            if agent["agent_id"] in by_id:
+                raise ValueError(f"Agente duplicado: {agent['agent_id']}")
+            record = AgentRecord(
+                agent_id=agent["agent_id"],
+                agent_name=agent["agent_name"],
+                description=agent["description"],
+                keywords=tuple(agent.get("keywords", ())),
+                rank=rank,
+                info={name: agent[name] for name in AGENT_INFO_FIELDS},
+            )
+            records.append(record)
+            by_id[record.agent_id] = record
+
+        self.records: Tuple[AgentRecord, ...] = tuple(records)
+        self._by_id = by_id
+        self.ids: Tuple[str, ...] = tuple(by_id)
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def __iter__(self) -> Iterator[AgentRecord]:
+        return iter(self.records)
+
+    def __contains__(self, agent_id: object) -> bool:
+        return agent_id in self._by_id
+
+    def get(self, agent_id: str) -> Optional[AgentRecord]:
+        return self._by_id.get(agent_id)
+
+    def status_payload(self, agent_id: str, status: str, last_active: Optional[str]) -> Optional[Dict[str, Any]]:
+        """Respuesta de estado de un agente a partir de sus datos precalculados"""
+        record = self._by_id.get(agent_id)
+        if record is None:
+            return None
+        return {**record.info, "status": status, "last_active": last_active}
@@ -0,0 +1,196 @@
+"""Fachada asíncrona para las llamadas bloqueantes de almacenamiento.
+
+`db.storage.json` y los almacenes construidos encima son síncronos. Llamarlos
+directamente desde un endpoint `async def` bloquea el bucle de eventos de
+uvicorn durante cada viaje al almacenamiento. `run_blocking` los ejecuta en un
+pool de hilos acotado (`STORAGE_MAX_WORKERS`) y registra cuánto esperan y
+cuánto tardan. `LoopLagMonitor` mide el retraso del bucle de eventos para
+verificar que nada lo bloquea.
+
+Usage:
+
+    from app.libs.async_storage import run_blocking
+
+    conversation = await run_blocking(store.read_window, conversation_id, limit=50)
+"""
+
+import asyncio
+import contextvars
+import functools
+import math
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Deque, Dict, Iterable, Optional
+
+from app.libs.lifecycle import on_shutdown, on_startup
+from app.libs.metrics import get_metrics
+
+DEFAULT_MAX_WORKERS = 16
+
+_operation_seconds = get_metrics().histogram(
+    "storage_operation_duration_seconds", "Duración de las operaciones de almacenamiento", ["op"]
+)
+_queue_wait_seconds = get_metrics().histogram(
+    "storage_queue_wait_seconds", "Espera en cola del pool de almacenamiento"
+)
+
+
+def _operation_name(fn: Callable[..., Any]) -> str:
+    fn = getattr(fn, "func", fn)  # functools.partial
+    return getattr(fn, "__qualname__", type(fn).__name__)
+
+
+def percentile(values: Iterable[float], q: float) -> float:
+    """Percentil `q` (0-100) por el método del rango más cercano"""
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    rank = max(1, math.ceil(q / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+class StorageExecutor:
+    """Pool de hilos acotado para operaciones de almacenamiento bloqueantes"""
+
+    def __init__(self, max_workers: int = DEFAULT_MAX_WORKERS, window: int = 2048):
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="storage")
+        self._durations: Deque[float] = deque(maxlen=window)
+        self._waits: Deque[float] = deque(maxlen=window)
+        self.calls = 0
+        self.errors = 0
+        self.in_flight = 0
+        self.busy_seconds = 0.0
+
+    async def run(self, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """Ejecuta `fn` en el pool y devuelve su resultado sin bloquear el bucle"""
+        loop = asyncio.get_running_loop()
+        context = contextvars.copy_context()
+        submitted = time.perf_counter()
+        op = _operation_name(fn)
+
+        def call() -> Any:
+            started = time.perf_counter()
+            self._waits.append(started - submitted)
+            _queue_wait_seconds.observe(started - submitted)
+            try:
+                return context.run(fn, *args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - started
+                self._durations.append(elapsed)
+                self.busy_seconds += elapsed
+                _operation_seconds.observe(elapsed, op)
+
+        self.calls += 1
+        self.in_flight += 1
+        try:
+            return await loop.run_in_executor(self._executor, call)
+        except Exception:
+            self.errors += 1
+            raise
+        finally:
+            self.in_flight -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_workers": self.max_workers,
+            "calls": self.calls,
+            "errors": self.errors,
+            "in_flight": self.in_flight,
+            "busy_seconds": self.busy_seconds,
+            "duration_p50": percentile(self._durations, 50),
+            "duration_p99": percentile(self._durations, 99),
+            "queue_wait_p99": percentile(self._waits, 99),
+        }
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=True)
+
+
+class LoopLagMonitor:
+    """Mide cuánto tarda el bucle de eventos en despertar una tarea dormida.
+
+    Un retraso alto indica que algún código síncrono está bloqueando el bucle.
+    """
+
+    def __init__(self, interval: float = 0.05, window: int = 2048, warn_threshold: float = 0.1):
+        self.interval = interval
+        self.warn_threshold = warn_threshold
+        self._samples: Deque[float] = deque(maxlen=window)
+        self._task: Optional[asyncio.Task] = None
+        self.max_lag = 0.0
+        self.blocked_seconds = 0.0
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - started - self.interval)
+            self.record(lag)
+
+    def record(self, lag: float) -> None:
+        self._samples.append(lag)
+        self.blocked_seconds += lag
+        if lag > self.max_lag:
+            self.max_lag = lag
+        if lag > self.warn_threshold:
+            print(f"Bucle de eventos bloqueado {lag * 1000:.0f} ms")
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "samples": len(self._samples),
+            "lag_p50": percentile(self._samples, 50),
+            "lag_p99": percentile(self._samples, 99),
+            "lag_max": self.max_lag,
+            "blocked_seconds": self.blocked_seconds,
+        }
+
+
+@functools.cache
+def get_storage_executor() -> StorageExecutor:
+    """Devuelve el pool de almacenamiento compartido por los routers"""
+    return StorageExecutor(int(os.environ.get("STORAGE_MAX_WORKERS", DEFAULT_MAX_WORKERS)))
+
+
+@functools.cache
+def get_loop_monitor() -> LoopLagMonitor:
+    """Devuelve el monitor de retraso del bucle de eventos de la aplicación"""
+    return LoopLagMonitor()
+
+
+async def run_blocking(fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+    """Ejecuta una llamada bloqueante de almacenamiento fuera del bucle de eventos"""
+    return await get_storage_executor().run(fn, *args, **kwargs)
+
+
+@on_startup
+def _start_loop_monitor() -> None:
+    get_loop_monitor().start()
+
+
+@on_shutdown
+async def _stop_loop_monitor() -> None:
+    await get_loop_monitor().stop()
+
+
+@on_shutdown
+def _shutdown_storage_executor() -> None:
+    # Esperar a que terminen las escrituras en curso antes de salir
+    get_storage_executor().shutdown()
+    get_storage_executor.cache_clear()
@@ -0,0 +1,101 @@
+"""Primitivas de concurrencia en proceso para serializar escrituras por clave.
+
+`KeyedLock` entrega un `asyncio.Lock` independiente por clave (por ejemplo por
+conversación) que se libera de memoria cuando nadie lo usa. `KeyedBatcher`
+construye encima un "group commit": las operaciones concurrentes sobre la
+misma clave se acumulan mientras hay una escritura en curso y la siguiente
+escritura las aplica todas de una vez.
+
+Usage:
+
+    from app.libs.concurrency import KeyedBatcher
+
+    def flush(conversation_id, items):
+        return store.append_many(conversation_id, items)
+
+    batcher = KeyedBatcher(flush)
+    result = await batcher.submit(conversation_id, message)
+"""
+
+import asyncio
+import inspect
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Callable, Dict, List, Tuple
+
+
+class KeyedLock:
+    """Locks asíncronos por clave con limpieza automática"""
+
+    def __init__(self):
+        self._locks: Dict[str, Tuple[asyncio.Lock, int]] = {}
+
+    def __len__(self) -> int:
+        return len(self._locks)
+
+    @asynccontextmanager
+    async def hold(self, key: str) -> AsyncIterator[None]:
+        lock, users = self._locks.get(key, (None, 0))
+        if lock is None:
+            lock = asyncio.Lock()
+        self._locks[key] = (lock, users + 1)
+        try:
+            async with lock:
+                yield
+        finally:
+            lock, users = self._locks[key]
+            if users == 1:
+                del self._locks[key]
+            else:
+                self._locks[key] = (lock, users - 1)
+
+
+class KeyedBatcher:
+    """Agrupa operaciones concurrentes sobre la misma clave en una sola escritura.
+
+    `flush(key, items)` recibe los elementos pendientes en orden de llegada y
+    devuelve una lista de resultados del mismo tamaño (o un awaitable con ella).
+    """
+
+    def __init__(self, flush: Callable[[str, List[Any]], Any], max_batch: int = 500):
+        self._flush = flush
+        self.max_batch = max_batch
+        self._locks = KeyedLock()
+        self._pending: Dict[str, List[Tuple[Any, asyncio.Future]]] = {}
+        self.flushes = 0
+        self.items = 0
+
+    async def submit(self, key: str, item: Any) -> Any:
+        future = asyncio.get_running_loop().create_future()
+        self._pending.setdefault(key, []).append((item, future))
+
+        async with self._locks.hold(key):
+            # Otro envío pudo haber escrito este elemento mientras esperábamos
+            while not future.done():
+                await self._flush_pending(key)
+        return future.result()
+
+    async def _flush_pending(self, key: str) -> None:
+        pending = self._pending.get(key, [])
+        batch, rest = pending[:self.max_batch], pending[self.max_batch:]
+        if rest:
+            self._pending[key] = rest
+        else:
+            self._pending.pop(key, None)
+        if not batch:
+            return
+
+        try:
+            results = self._flush(key, [item for item, _ in batch])
+            if inspect.isawaitable(results):
+                results = await results
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        self.flushes += 1
+        self.items += len(batch)
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
@@ -0,0 +1,443 @@
+"""Almacén de conversaciones A2A con log segmentado de solo-anexado.
+
+Cada conversación se guarda como un manifiesto pequeño más una serie de
+segmentos de tamaño fijo. Enviar un mensaje solo reescribe el segmento final
+y el manifiesto, por lo que el coste por mensaje no depende de la longitud de
+la conversación. El manifiesto guarda además el rango de timestamps de cada
+segmento para que las lecturas paginadas solo carguen los segmentos de la
+ventana pedida.
+
+Usage:
+
+    from app.libs.conversation_store import get_conversation_store
+
+    store = get_conversation_store()
+    store.append(conversation_id, message, metadata)
+    page = store.read_window(conversation_id, limit=50, before=cursor)
+"""
+
+import bisect
+import functools
+import os
+import re
+from abc import ABC, abstractmethod
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.env import env_flag
+from app.libs.json_storage import (
+    VersionConflictError,
+    compare_and_put,
+    get_json_storage,
+    read_json,
+    sanitize_key,
+)
+from app.libs.message_codec import (
+    ENCODINGS,
+    decode_messages,
+    encode_messages,
+    extend_messages,
+    get_message_encoding,
+    row_timestamp,
+)
+from app.libs.shared_state import get_shared_state
+
+DEFAULT_SEGMENT_SIZE = 100
+MANIFEST_FORMAT = "segmented-v1"
+
+# Campos que se devuelven cuando solo se piden las cabeceras de los mensajes
+HEADER_FIELDS = ("message_id", "conversation_id", "timestamp", "from", "to", "type")
+
+
+# Prefijos que fijan el tipo de un cursor
+TIMESTAMP_PREFIX = "ts:"
+ID_PREFIX = "id:"
+_ISO_TIMESTAMP = re.compile(r"\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}")
+
+
+class CursorNotFoundError(KeyError):
+    """El cursor indicado no corresponde a ningún mensaje de la conversación"""
+
+
+def parse_cursor(cursor: str) -> Tuple[str, str]:
+    """Clasifica un cursor como ("timestamp", iso) o ("message_id", id).
+
+    Los prefijos `ts:` e `id:` fijan el tipo. Sin prefijo solo es timestamp un
+    ISO con fecha y hora separadas por guiones y dos puntos, de modo que ids
+    numéricos como "20240101" o "20240101T1200" se tratan como ids.
+    """
+    if cursor.startswith(ID_PREFIX):
+        return ("message_id", cursor[len(ID_PREFIX):])
+    explicit = cursor.startswith(TIMESTAMP_PREFIX)
+    value = cursor[len(TIMESTAMP_PREFIX):] if explicit else cursor
+    if not explicit and not _ISO_TIMESTAMP.match(value):
+        return ("message_id", cursor)
+    try:
+        parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        if explicit:
+            raise CursorNotFoundError(cursor)
+        return ("message_id", cursor)
+    # Los timestamps se guardan como ISO en UTC sin zona horaria
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return ("timestamp", parsed.isoformat())
+
+
+def project_headers(message: Dict[str, Any]) -> Dict[str, Any]:
+    """Devuelve solo las cabeceras de un mensaje, sin contenido ni metadata"""
+    return {field: message[field] for field in HEADER_FIELDS if field in message}
+
+
+class ConversationStore(ABC):
+    """Interfaz de almacenamiento de conversaciones A2A"""
+
+    @abstractmethod
+    def append_many(
+        self,
+        conversation_id: str,
+        messages: List[Dict[str, Any]],
+        metadata: Optional[Dict[str, Any]] = None,
+    ) -> int:
+        """Agrega mensajes en orden al final de la conversación.
+
+        Devuelve la posición siguiente al último mensaje escrito, es decir el
+        total de mensajes de la conversación tras la escritura.
+        """
+
+    def append(
+        self,
+        conversation_id: str,
+        message: Dict[str, Any],
+        metadata: Optional[Dict[str, Any]] = None,
+    ) -> int:
+        """Agrega un mensaje al final de la conversación y devuelve el total de mensajes"""
+        return self.append_many(conversation_id, [message], metadata)
+
+    @abstractmethod
+    def read_window(
+        self,
+        conversation_id: str,
+        limit: Optional[int] = None,
+        before: Optional[str] = None,
+        after: Optional[str] = None,
+    ) -> Optional[Dict[str, Any]]:
+        """Devuelve una ventana de mensajes acotada por cursores o None si no existe.
+
+        Sin `after` se devuelven los últimos `limit` mensajes anteriores a `before`;
+        con `after` se devuelven los primeros `limit` posteriores al cursor.
+        """
+
+    def load(self, conversation_id: str) -> Optional[Dict[str, Any]]:
+        """Devuelve la conversación completa o None si no existe"""
+        return self.read_window(conversation_id)
+
+
+def _segment_range(messages: List[Dict[str, Any]]) -> Dict[str, str]:
+    return {"first_ts": messages[0]["timestamp"], "last_ts": messages[-1]["timestamp"]}
+
+
+# Un segmento guarda sus mensajes completos en `messages` o codificados en
+# `packed` (ver `app.libs.message_codec`); se leen igual en los dos casos.
+
+def _segment_length(document: Dict[str, Any]) -> int:
+    if "packed" in document:
+        return len(document["packed"]["rows"])
+    return len(document.get("messages", []))
+
+
+def _segment_messages(document: Dict[str, Any], limit: Optional[int] = None) -> List[Dict[str, Any]]:
+    if "packed" in document:
+        return decode_messages(document["packed"], limit)
+    return document.get("messages", [])[:limit]
+
+
+def _segment_bounds(document: Dict[str, Any]) -> Dict[str, str]:
+    if "packed" in document:
+        rows = document["packed"]["rows"]
+        return {"first_ts": row_timestamp(rows[0]), "last_ts": row_timestamp(rows[-1])}
+    return _segment_range(document["messages"])
+
+
+def _extend_segment(
+    document: Dict[str, Any],
+    keep: int,
+    messages: List[Dict[str, Any]],
+    conversation_id: str,
+    encoding: str,
+) -> Dict[str, Any]:
+    """Segmento con los `keep` primeros mensajes de `document` más `messages`, en `encoding`"""
+    if encoding == "compact":
+        packed = document.get("packed")
+        if packed is None:
+            packed = encode_messages(document.get("messages", [])[:keep], conversation_id)
+        return {"packed": extend_messages(packed, keep, messages)}
+    return {"messages": _segment_messages(document, keep) + messages}
+
+
+class SegmentedConversationStore(ConversationStore):
+    """Conversaciones en segmentos de tamaño fijo sobre un almacén clave→JSON.
+
+    En modo `optimistic` el segmento final y el manifiesto se escriben con
+    `compare_and_put`: si otro proceso anexó mensajes entre la lectura y la
+    escritura se reintenta sobre el estado nuevo en lugar de sobrescribirlo.
+    En ese modo los mensajes presentes en un segmento se consideran
+    confirmados aunque el manifiesto aún no los refleje.
+    """
+
+    def __init__(
+        self,
+        storage: Any = None,
+        segment_size: int = DEFAULT_SEGMENT_SIZE,
+        optimistic: bool = False,
+        max_retries: int = 10,
+        encoding: str = "json",
+    ):
+        if segment_size < 1:
+            raise ValueError("segment_size debe ser mayor que 0")
+        if encoding not in ENCODINGS:
+            raise ValueError(f"encoding debe ser uno de {ENCODINGS}")
+        self._storage = storage
+        self.segment_size = segment_size
+        self.optimistic = optimistic
+        self.max_retries = max_retries
+        self.encoding = encoding
+
+    @property
+    def storage(self) -> Any:
+        return self._storage if self._storage is not None else get_json_storage()
+
+    def _manifest_key(self, conversation_id: str) -> str:
+        # Misma clave que el formato anterior para poder migrar en el sitio
+        return sanitize_key(f"a2a_conversation_{conversation_id}")
+
+    def _segment_key(self, conversation_id: str, index: int) -> str:
+        return sanitize_key(f"a2a_conversation_{conversation_id}_seg_{index}")
+
+    def _new_manifest(self, conversation_id: str) -> Dict[str, Any]:
+        return {
+            "format": MANIFEST_FORMAT,
+            "conversation_id": conversation_id,
+            "segment_size": self.segment_size,
+            "message_count": 0,
+            "segments": [],
+            "metadata": {},
+            "version": 0,
+        }
+
+    def _migrate_legacy(self, conversation_id: str) -> Optional[Dict[str, Any]]:
+        """Convierte un documento con todos los mensajes en manifiesto + segmentos.
+
+        Se hace bajo un cerrojo por conversación del estado compartido y el
+        manifiesto se confirma con la misma escritura que los anexos, así que
+        un lector y un escritor que encuentran a la vez el documento antiguo
+        no se pisan: el segundo en entrar ve el manifiesto ya migrado.
+        """
+        key = self._manifest_key(conversation_id)
+        with get_shared_state().lock(f"conversation:{key}"):
+            legacy = read_json(self.storage, key)
+            if legacy is None or legacy.get("format") == MANIFEST_FORMAT:
+                return legacy
+            manifest = self._new_manifest(conversation_id)
+            messages = legacy.get("messages", [])
+            size = manifest["segment_size"]
+            for index, start in enumerate(range(0, len(messages), size)):
+                chunk = messages[start:start + size]
+                segment = _extend_segment({}, 0, chunk, conversation_id, self.encoding)
+                self.storage.put(self._segment_key(conversation_id, index), {**segment, "version": 1})
+                manifest["segments"].append(_segment_range(chunk))
+            manifest["message_count"] = len(messages)
+            manifest["metadata"] = legacy.get("metadata", {})
+            version = legacy.get("version", 0)
+            manifest["version"] = version + 1
+            self._write(key, manifest, version)
+            return manifest
+
+    def _read_manifest(self, conversation_id: str) -> Optional[Dict[str, Any]]:
+        document = read_json(self.storage, self._manifest_key(conversation_id))
+        if document is None:
+            return None
+        if document.get("format") != MANIFEST_FORMAT:
+            return self._migrate_legacy(conversation_id)
+        return document
+
+    def _read_segment(self, conversation_id: str, index: int, length: int) -> List[Dict[str, Any]]:
+        segment = read_json(self.storage, self._segment_key(conversation_id, index)) or {}
+        # Descartar mensajes escritos sin que el manifiesto llegara a confirmarlos
+        return _segment_messages(segment, length)
+
+    def _write(self, key: str, document: Dict[str, Any], expected_version: int) -> None:
+        if self.optimistic:
+            compare_and_put(self.storage, key, document, expected_version)
+        else:
+            self.storage.put(key, document)
+
+    def append_many(
+        self,
+        conversation_id: str,
+        messages: List[Dict[str, Any]],
+        metadata: Optional[Dict[str, Any]] = None,
+    ) -> int:
+        manifest = self._read_manifest(conversation_id) or self._new_manifest(conversation_id)
+        size = manifest["segment_size"]
+        count = manifest["message_count"]
+        segments = list(manifest["segments"])
+        pending = list(messages)
+        conflicts = 0
+
+        # Primero los segmentos y después el manifiesto, que es el punto de confirmación
+        while pending:
+            index, offset = divmod(count, size)
+            key = self._segment_key(conversation_id, index)
+            # Un segmento nuevo no necesita leerse salvo que otro proceso pueda estar escribiéndolo
+            document = (read_json(self.storage, key) or {}) if offset or self.optimistic else {}
+            stored = _segment_length(document)
+            if self.optimistic and stored > offset:
+                offset = stored
+                if offset >= size:
+                    del segments[index:]
+                    segments.append(_segment_bounds(document))
+                    count = (index + 1) * size
+                    continue
+
+            segment = _extend_segment(document, offset, pending[:size - offset], conversation_id, self.encoding)
+            version = document.get("version", 0)
+            try:
+                self._write(key, {**segment, "version": version + 1}, version)
+            except VersionConflictError:
+                conflicts += 1
+                if conflicts > self.max_retries:
+                    raise
+                continue
+
+            pending = pending[size - offset:]
+            del segments[index:]
+            segments.append(_segment_bounds(segment))
+            count = index * size + _segment_length(segment)
+
+        self._commit_manifest(conversation_id, manifest, count, segments, metadata)
+        return count
+
+    def _commit_manifest(
+        self,
+        conversation_id: str,
+        manifest: Dict[str, Any],
+        count: int,
+        segments: List[Dict[str, str]],
+        metadata: Optional[Dict[str, Any]],
+    ) -> None:
+        key = self._manifest_key(conversation_id)
+        for _ in range(self.max_retries + 1):
+            # Nunca retroceder si otro escritor ya confirmó más mensajes
+            if manifest["message_count"] > count:
+                count, segments = manifest["message_count"], manifest["segments"]
+            version = manifest.get("version", 0)
+            updated = {
+                **manifest,
+                "message_count": count,
+                "segments": segments,
+                "metadata": {**manifest.get("metadata", {}), **(metadata or {})},
+                "version": version + 1,
+            }
+            try:
+                self._write(key, updated, version)
+                return
+            except VersionConflictError:
+                manifest = self._read_manifest(conversation_id)
+        raise VersionConflictError(key)
+
+    def read_window(
+        self,
+        conversation_id: str,
+        limit: Optional[int] = None,
+        before: Optional[str] = None,
+        after: Optional[str] = None,
+    ) -> Optional[Dict[str, Any]]:
+        manifest = self._read_manifest(conversation_id)
+        if manifest is None:
+            return None
+        return _SegmentReader(self, conversation_id, manifest).window(limit, before, after)
+
+
+class _SegmentReader:
+    """Lee segmentos bajo demanda durante una única consulta, sin repetir lecturas"""
+
+    def __init__(self, store: SegmentedConversationStore, conversation_id: str, manifest: Dict[str, Any]):
+        self.store = store
+        self.conversation_id = conversation_id
+        self.manifest = manifest
+        self.size = manifest["segment_size"]
+        self.count = manifest["message_count"]
+        self._segments: Dict[int, List[Dict[str, Any]]] = {}
+
+    def segment(self, index: int) -> List[Dict[str, Any]]:
+        if index not in self._segments:
+            length = min(self.size, self.count - index * self.size)
+            self._segments[index] = self.store._read_segment(self.conversation_id, index, length)
+        return self._segments[index]
+
+    def position_of_id(self, message_id: str) -> int:
+        # Los cursores suelen apuntar a mensajes recientes: buscar desde el final
+        for index in reversed(range((self.count + self.size - 1) // self.size)):
+            for offset, message in enumerate(self.segment(index)):
+                if message.get("message_id") == message_id:
+                    return index * self.size + offset
+        raise CursorNotFoundError(message_id)
+
+    def position_of_timestamp(self, timestamp: str, inclusive: bool) -> int:
+        """Primera posición cuyo timestamp es >= (o > si no es inclusivo) que el dado"""
+        last_timestamps = [segment["last_ts"] for segment in self.manifest["segments"]]
+        search = bisect.bisect_left if inclusive else bisect.bisect_right
+        index = search(last_timestamps, timestamp)
+        if index >= len(last_timestamps):
+            return self.count
+        messages = self.segment(index)
+        offset = search([message["timestamp"] for message in messages], timestamp)
+        return index * self.size + offset
+
+    def resolve(self, cursor: str, is_after: bool) -> int:
+        kind, value = parse_cursor(cursor)
+        if kind == "timestamp":
+            return self.position_of_timestamp(value, inclusive=not is_after)
+        position = self.position_of_id(value)
+        return position + 1 if is_after else position
+
+    def window(self, limit: Optional[int], before: Optional[str], after: Optional[str]) -> Dict[str, Any]:
+        low = self.resolve(after, is_after=True) if after else 0
+        high = self.resolve(before, is_after=False) if before else self.count
+        high = max(low, high)
+
+        if limit is not None:
+            if after:
+                high = min(high, low + limit)
+            else:
+                low = max(low, high - limit)
+
+        messages: List[Dict[str, Any]] = []
+        for index in range(low // self.size, (high + self.size - 1) // self.size):
+            start = index * self.size
+            messages.extend(self.segment(index)[max(low - start, 0):high - start])
+
+        return {
+            "conversation_id": self.conversation_id,
+            "messages": messages,
+            "metadata": self.manifest.get("metadata", {}),
+            "total": self.count,
+            "has_more_before": low > 0,
+            "has_more_after": high < self.count,
+        }
+
+
+@functools.cache
+def get_conversation_store() -> ConversationStore:
+    """Devuelve el almacén de conversaciones configurado para la aplicación"""
+    from app.libs.sqlite_storage import SqliteConversationStore, get_sqlite_database, sqlite_enabled
+
+    if sqlite_enabled():
+        return SqliteConversationStore(get_sqlite_database(), encoding=get_message_encoding())
+    segment_size = int(os.environ.get("A2A_SEGMENT_SIZE", DEFAULT_SEGMENT_SIZE))
+    return SegmentedConversationStore(
+        segment_size=segment_size,
+        optimistic=env_flag("A2A_OPTIMISTIC_WRITES", default=get_shared_state().shared),
+        encoding=get_message_encoding(),
+    )
@@ -0,0 +1,315 @@
+"""Despacho asíncrono de peticiones a los agentes con un pool acotado por agente.
+
+Cada agente tiene su propia cola acotada y un número fijo de workers
+(`AGENT_CONCURRENCY`, `AGENT_QUEUE_SIZE`), de modo que un agente lento solo
+agota sus propios recursos: cuando su cola está llena las peticiones nuevas se
+rechazan al momento con `AgentQueueFullError` (el API responde 429), y cada
+petición tiene un plazo total (`AGENT_TIMEOUT_SECONDS`) que incluye la espera
+en cola; al vencer se cancela y se lanza `AgentTimeoutError` (504). Si quien
+espera cancela antes (p. ej. el cliente se desconecta), se cancela también el
+handler en curso y el worker queda libre al momento; esas peticiones cuentan
+como `cancelled` y no se notifican a `on_result`.
+
+Un handler es una corrutina `handler(request) -> dict` o, si el agente
+responde por partes, un generador asíncrono que produce fragmentos de texto
+(`str`) y termina produciendo la respuesta completa (`dict`). `stream` entrega
+los fragmentos según llegan; `dispatch` solo la respuesta final. Los agentes
+sin handler registrado usan el handler por defecto del dispatcher.
+
+Usage:
+
+    from app.libs.dispatch import AgentDispatcher
+
+    dispatcher = AgentDispatcher(default_handler=simulated_agent)
+    dispatcher.register("nutrition", nutrition_agent, concurrency=2)
+    response = await dispatcher.dispatch("nutrition", {"query": "..."})
+
+    async for kind, payload in dispatcher.stream("nutrition", {"query": "..."}):
+        ...  # ("chunk", "texto parcial") ... ("result", {...})
+"""
+
+import asyncio
+import inspect
+import os
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple, Union
+
+DEFAULT_CONCURRENCY = 4
+DEFAULT_QUEUE_SIZE = 64
+DEFAULT_TIMEOUT_SECONDS = 30.0
+
+AgentHandler = Callable[
+    [Dict[str, Any]],
+    Union[Awaitable[Dict[str, Any]], AsyncIterator[Union[str, Dict[str, Any]]]],
+]
+ChunkCallback = Callable[[str], None]
+ResultCallback = Callable[[str, float, bool], None]
+
+
+class AgentQueueFullError(Exception):
+    """La cola del agente está llena; conviene reintentar más tarde"""
+
+
+class AgentTimeoutError(Exception):
+    """El agente no respondió dentro del plazo"""
+
+
+class AgentWorkerPool:
+    """Cola acotada y workers de un agente"""
+
+    def __init__(
+        self,
+        agent_id: str,
+        handler: AgentHandler,
+        concurrency: int = DEFAULT_CONCURRENCY,
+        queue_size: int = DEFAULT_QUEUE_SIZE,
+        timeout: float = DEFAULT_TIMEOUT_SECONDS,
+        on_result: Optional[ResultCallback] = None,
+    ):
+        if concurrency < 1:
+            raise ValueError("concurrency debe ser mayor que 0")
+        self.agent_id = agent_id
+        self.handler = handler
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.on_result = on_result
+        self._queue: Optional[asyncio.Queue] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._workers: List[asyncio.Task] = []
+        self.in_flight = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.cancelled = 0
+
+    def _ensure_workers(self) -> asyncio.Queue:
+        # Los workers pertenecen al bucle en el que se arrancaron
+        loop = asyncio.get_running_loop()
+        if self._queue is None or self._loop is not loop:
+            # Como en `close`, cancelar los del bucle anterior para no dejarlos vivos;
+            # desde su propio bucle porque no es el que está corriendo ahora
+            for worker in self._workers:
+                try:
+                    worker.get_loop().call_soon_threadsafe(worker.cancel)
+                except RuntimeError:
+                    # Bucle ya cerrado: sus workers no volverán a ejecutarse
+                    pass
+            self._loop = loop
+            self._queue = asyncio.Queue(maxsize=self.queue_size)
+            self._workers = [loop.create_task(self._work(self._queue)) for _ in range(self.concurrency)]
+        return self._queue
+
+    async def submit(self, request: Dict[str, Any], on_chunk: Optional[ChunkCallback] = None) -> Dict[str, Any]:
+        """Encola la petición y espera la respuesta del agente.
+
+        Si el handler responde por partes, `on_chunk` recibe cada fragmento.
+        """
+        queue = self._ensure_workers()
+        future = asyncio.get_running_loop().create_future()
+        deadline = time.monotonic() + self.timeout
+        try:
+            queue.put_nowait((request, future, deadline, on_chunk))
+        except asyncio.QueueFull:
+            self.rejected += 1
+            raise AgentQueueFullError(self.agent_id)
+
+        try:
+            return await asyncio.wait_for(future, self.timeout)
+        except asyncio.TimeoutError:
+            # wait_for cancela el future: el worker lo descarta si sigue en cola o
+            # cancela el handler si ya había empezado (ver `_run`)
+            self.timeouts += 1
+            raise AgentTimeoutError(self.agent_id)
+
+    async def _work(self, queue: asyncio.Queue) -> None:
+        while True:
+            request, future, deadline, on_chunk = await queue.get()
+            try:
+                if not future.done():
+                    await self._run(request, future, deadline, on_chunk)
+            finally:
+                queue.task_done()
+
+    async def _call(self, request: Dict[str, Any], on_chunk: Optional[ChunkCallback]) -> Dict[str, Any]:
+        result = self.handler(request)
+        if not inspect.isasyncgen(result):
+            return await result
+        final: Dict[str, Any] = {}
+        async for item in result:
+            if isinstance(item, str):
+                if on_chunk is not None:
+                    on_chunk(item)
+            else:
+                final = item
+        return final
+
+    async def _run(
+        self,
+        request: Dict[str, Any],
+        future: asyncio.Future,
+        deadline: float,
+        on_chunk: Optional[ChunkCallback],
+    ) -> None:
+        self.in_flight += 1
+        started = time.monotonic()
+        ok = False
+        abandoned = False
+        call = asyncio.ensure_future(self._call(request, on_chunk))
+
+        def cancel_call(waiter: asyncio.Future) -> None:
+            # Quien esperaba la respuesta canceló (plazo o desconexión): el handler no sigue ocupando el worker
+            if waiter.cancelled():
+                call.cancel()
+
+        future.add_done_callback(cancel_call)
+        try:
+            result = await asyncio.wait_for(call, max(deadline - started, 0))
+            ok = True
+            if not future.done():
+                future.set_result(result)
+        except asyncio.TimeoutError:
+            if not future.done():
+                future.set_exception(AgentTimeoutError(self.agent_id))
+        except asyncio.CancelledError:
+            if not (future.cancelled() and call.cancelled()):
+                # Es el propio worker el que se está cancelando (close)
+                call.cancel()
+                raise
+            abandoned = time.monotonic() < deadline
+        except Exception as e:
+            if not future.done():
+                future.set_exception(e)
+        finally:
+            future.remove_done_callback(cancel_call)
+            self.in_flight -= 1
+            if ok:
+                self.completed += 1
+            elif abandoned:
+                self.cancelled += 1
+            else:
+                self.failed += 1
+            if self.on_result is not None and not abandoned:
+                self.on_result(self.agent_id, time.monotonic() - started, ok)
+
+    async def close(self) -> None:
+        workers, self._workers = self._workers, []
+        for worker in workers:
+            worker.cancel()
+        for worker in workers:
+            try:
+                await worker
+            except (asyncio.CancelledError, RuntimeError):
+                # RuntimeError: el worker pertenece a un bucle ya cerrado
+                pass
+        self._queue = None
+        self._loop = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "concurrency": self.concurrency,
+            "queue_size": self.queue_size,
+            "timeout_seconds": self.timeout,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "in_flight": self.in_flight,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "timeouts": self.timeouts,
+            "cancelled": self.cancelled,
+        }
+
+
+class AgentDispatcher:
+    """Reparte peticiones entre los pools de cada agente, creados bajo demanda"""
+
+    def __init__(
+        self,
+        default_handler: Optional[AgentHandler] = None,
+        concurrency: int = DEFAULT_CONCURRENCY,
+        queue_size: int = DEFAULT_QUEUE_SIZE,
+        timeout: float = DEFAULT_TIMEOUT_SECONDS,
+        on_result: Optional[ResultCallback] = None,
+    ):
+        self.default_handler = default_handler
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.on_result = on_result
+        self._handlers: Dict[str, Tuple[AgentHandler, Dict[str, Any]]] = {}
+        self._pools: Dict[str, AgentWorkerPool] = {}
+
+    def register(
+        self,
+        agent_id: str,
+        handler: AgentHandler,
+        concurrency: Optional[int] = None,
+        queue_size: Optional[int] = None,
+        timeout: Optional[float] = None,
+    ) -> None:
+        """Asocia un handler al agente; sustituye al pool anterior si lo había"""
+        options = {"concurrency": concurrency, "queue_size": queue_size, "timeout": timeout}
+        self._handlers[agent_id] = (handler, {k: v for k, v in options.items() if v is not None})
+        self._pools.pop(agent_id, None)
+
+    def pool(self, agent_id: str) -> AgentWorkerPool:
+        pool = self._pools.get(agent_id)
+        if pool is None:
+            handler, options = self._handlers.get(agent_id, (self.default_handler, {}))
+            if handler is None:
+                raise KeyError(agent_id)
+            pool = self._pools[agent_id] = AgentWorkerPool(
+                agent_id,
+                handler,
+                concurrency=options.get("concurrency", self.concurrency),
+                queue_size=options.get("queue_size", self.queue_size),
+                timeout=options.get("timeout", self.timeout),
+                on_result=self.on_result,
+            )
+        return pool
+
+    async def dispatch(self, agent_id: str, request: Dict[str, Any]) -> Dict[str, Any]:
+        """Envía la petición al agente y espera su respuesta"""
+        return await self.pool(agent_id).submit(request)
+
+    async def stream(self, agent_id: str, request: Dict[str, Any]) -> AsyncIterator[Tuple[str, Any]]:
+        """Produce ("chunk", texto) por cada fragmento y al final ("result", respuesta)"""
+        chunks: asyncio.Queue = asyncio.Queue()
+        task = asyncio.ensure_future(self.pool(agent_id).submit(request, on_chunk=chunks.put_nowait))
+        try:
+            while not task.done():
+                getter = asyncio.ensure_future(chunks.get())
+                await asyncio.wait({getter, task}, return_when=asyncio.FIRST_COMPLETED)
+                if getter.done():
+                    yield ("chunk", getter.result())
+                else:
+                    getter.cancel()
+            while not chunks.empty():
+                yield ("chunk", chunks.get_nowait())
+            yield ("result", task.result())
+        finally:
+            # Si quien consume deja de leer (p. ej. se desconecta el cliente) se cancela
+            # la espera, y con ella el handler del agente, que libera su worker
+            task.cancel()
+
+    async def close(self) -> None:
+        for pool in list(self._pools.values()):
+            await pool.close()
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return {agent_id: pool.stats() for agent_id, pool in self._pools.items()}
+
+
+def dispatcher_from_env(
+    default_handler: Optional[AgentHandler] = None,
+    on_result: Optional[ResultCallback] = None,
+) -> AgentDispatcher:
+    """Crea un dispatcher con los límites configurados por variables de entorno"""
+    return AgentDispatcher(
+        default_handler=default_handler,
+        concurrency=int(os.environ.get("AGENT_CONCURRENCY", DEFAULT_CONCURRENCY)),
+        queue_size=int(os.environ.get("AGENT_QUEUE_SIZE", DEFAULT_QUEUE_SIZE)),
+        timeout=float(os.environ.get("AGENT_TIMEOUT_SECONDS", DEFAULT_TIMEOUT_SECONDS)),
+        on_result=on_result,
+    )
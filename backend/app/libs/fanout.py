@@ -0,0 +1,65 @@
+"""Ejecución en paralelo de una consulta en varios agentes con plazo común.
+
+`fan_out` lanza todas las llamadas a la vez y espera como mucho `deadline`
+segundos: lo que haya terminado se devuelve y lo que no se cancela, así una
+consulta que toca varios dominios tarda lo que el agente más lento dentro del
+plazo, no la suma de todos. `merge_responses` combina las respuestas en una
+sola en el orden de relevancia de los agentes.
+
+Usage:
+
+    from app.libs.fanout import fan_out, merge_responses
+
+    results, errors = await fan_out({"training": call_training, "nutrition": call_nutrition}, deadline=5)
+    response = merge_responses(agents, results, errors)
+"""
+
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, List, Tuple
+
+LIST_FIELDS = ("recommendations", "next_steps")
+
+
+async def fan_out(
+    calls: Dict[str, Callable[[], Awaitable[Dict[str, Any]]]],
+    deadline: float,
+) -> Tuple[Dict[str, Dict[str, Any]], Dict[str, str]]:
+    """Ejecuta las llamadas concurrentemente; devuelve (resultados, errores) por agente"""
+    tasks = {asyncio.ensure_future(call()): agent_id for agent_id, call in calls.items()}
+    done, pending = await asyncio.wait(tasks, timeout=deadline)
+
+    for task in pending:
+        task.cancel()
+    if pending:
+        await asyncio.gather(*pending, return_exceptions=True)
+
+    results: Dict[str, Dict[str, Any]] = {}
+    errors: Dict[str, str] = {agent_id: "timeout" for task, agent_id in tasks.items() if task in pending}
+    for task in done:
+        agent_id = tasks[task]
+        error = task.exception()
+        if error is None:
+            results[agent_id] = task.result()
+        else:
+            errors[agent_id] = getattr(error, "detail", None) or str(error) or type(error).__name__
+    return results, errors
+
+
+def merge_responses(
+    agents: List[Dict[str, Any]],
+    results: Dict[str, Dict[str, Any]],
+    errors: Dict[str, str],
+) -> Dict[str, Any]:
+    """Combina las respuestas de varios agentes en una sola respuesta"""
+    answered = [agent for agent in agents if agent["agent_id"] in results]
+    merged: Dict[str, Any] = {
+        "text": "\n\n".join(results[agent["agent_id"]].get("text", "") for agent in answered),
+        "agent": answered[0] if answered else None,
+        "agents": answered,
+        "responses": {agent["agent_id"]: results[agent["agent_id"]] for agent in answered},
+        "partial": bool(errors),
+        "errors": errors,
+    }
+    for field in LIST_FIELDS:
+        merged[field] = [item for agent in answered for item in results[agent["agent_id"]].get(field, [])]
+    return merged
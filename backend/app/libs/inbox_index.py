@@ -0,0 +1,282 @@
+"""Índice secundario de bandejas de entrada por agente para A2A.
+
+En lugar de copiar cada mensaje en el documento del agente receptor, el índice
+guarda por conversación solo una referencia al último mensaje (id, timestamp y
+posición en el log de la conversación). El tamaño del documento crece con el
+número de conversaciones, no con el número de mensajes.
+
+Usage:
+
+    from app.libs.inbox_index import get_inbox_index
+
+    inbox = get_inbox_index()
+    inbox.record(agent_id, conversation_id, message, position)
+    entries = inbox.list(agent_id)
+    page = inbox.list_page(agent_id, limit=20, before=cursor)
+
+Las conversaciones se guardan ordenadas por actividad, de la más antigua a la
+más reciente, para que una página sea un corte del documento y no haya que
+ordenarlo en cada consulta.
+"""
+
+import bisect
+import functools
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.env import env_flag
+from app.libs.conversation_store import ID_PREFIX, CursorNotFoundError, parse_cursor
+from app.libs.json_storage import (
+    VersionConflictError,
+    compare_and_put,
+    get_json_storage,
+    read_json,
+    sanitize_key,
+)
+from app.libs.shared_state import get_shared_state
+
+INBOX_FORMAT = "inbox-v2"
+# Formato anterior, con las conversaciones en orden de inserción
+UNORDERED_FORMATS = ("inbox-v1",)
+
+
+def _activity_key(item: Tuple[str, Dict[str, Any]]) -> Tuple[str, str]:
+    conversation_id, entry = item
+    return (entry["last_timestamp"], conversation_id)
+
+
+def order_by_activity(conversations: Dict[str, Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """Devuelve las conversaciones ordenadas de la más antigua a la más reciente"""
+    return dict(sorted(conversations.items(), key=_activity_key))
+
+
+def merge_ordered(
+    conversations: Dict[str, Dict[str, Any]],
+    updates: Dict[str, Dict[str, Any]],
+) -> Dict[str, Dict[str, Any]]:
+    """Aplica `updates` a conversaciones ya ordenadas manteniendo el orden"""
+    items = [item for item in conversations.items() if item[0] not in updates]
+    for item in updates.items():
+        bisect.insort(items, item, key=_activity_key)
+    return dict(items)
+
+
+def make_inbox_entry(
+    message: Dict[str, Any],
+    position: int,
+    previous: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
+    """Construye la entrada del índice que apunta al último mensaje recibido"""
+    last_position = (previous or {}).get("last_position")
+    if previous and position is not None and last_position is not None and position < last_position:
+        # Llegó tarde un mensaje anterior: solo cuenta, el puntero sigue en el más reciente
+        entry = dict(previous, message_count=previous["message_count"] + 1)
+        entry["metadata"] = {**previous.get("metadata", {}), **(message.get("metadata") or {})}
+        return entry
+
+    entry = {
+        "message_count": (previous or {}).get("message_count", 0) + 1,
+        "last_message_id": message["message_id"],
+        "last_timestamp": message["timestamp"],
+        "last_position": position,
+        "last_from": message["from"]["agent_id"],
+        "last_type": message["type"],
+        "metadata": dict((previous or {}).get("metadata", {})),
+    }
+    if message.get("metadata"):
+        entry["metadata"].update(message["metadata"])
+    return entry
+
+
+class InboxIndex(ABC):
+    """Interfaz del índice agente → conversaciones"""
+
+    @abstractmethod
+    def record_many(
+        self,
+        agent_id: str,
+        records: List[Tuple[str, Dict[str, Any], int]],
+    ) -> List[Dict[str, Any]]:
+        """Registra varios (conversation_id, mensaje, posición) en una sola escritura"""
+
+    def record(
+        self,
+        agent_id: str,
+        conversation_id: str,
+        message: Dict[str, Any],
+        position: int,
+    ) -> Dict[str, Any]:
+        """Registra un mensaje recibido por el agente y devuelve la entrada actualizada"""
+        return self.record_many(agent_id, [(conversation_id, message, position)])[0]
+
+    @abstractmethod
+    def list(self, agent_id: str) -> Dict[str, Dict[str, Any]]:
+        """Devuelve las entradas del índice del agente por id de conversación"""
+
+    def list_page(
+        self,
+        agent_id: str,
+        limit: Optional[int] = None,
+        before: Optional[str] = None,
+        after: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """Devuelve las conversaciones del agente de la más reciente a la más antigua.
+
+        Los cursores aceptan un id de conversación o un timestamp ISO (ver
+        `parse_cursor`; `next_cursor` lleva siempre el prefijo `id:`): `before`
+        devuelve conversaciones con actividad más antigua que el cursor y `after`
+        las más recientes.
+        """
+        entries = self.list_ordered(agent_id)
+        ordered = list(entries.items())
+
+        def cursor_key(cursor: str, is_after: bool) -> Tuple[str, str]:
+            kind, value = parse_cursor(cursor)
+            if kind == "timestamp":
+                # Los extremos se excluyen igual que con un id de conversación
+                return (value, "\uffff" if is_after else "")
+            if value not in entries:
+                raise CursorNotFoundError(value)
+            return (entries[value]["last_timestamp"], value)
+
+        low, high = 0, len(ordered)
+        if after:
+            low = bisect.bisect_right(ordered, cursor_key(after, is_after=True), key=_activity_key)
+        if before:
+            high = bisect.bisect_left(ordered, cursor_key(before, is_after=False), key=_activity_key)
+        high = max(low, high)
+
+        total = high - low
+        if limit is not None:
+            # Con `after` se devuelven las conversaciones más cercanas al cursor
+            if after and not before:
+                high = min(high, low + limit)
+            else:
+                low = max(low, high - limit)
+        page = ordered[low:high][::-1]
+
+        return {
+            "conversations": dict(page),
+            "total": len(entries),
+            "has_more": len(page) < total,
+            "next_cursor": ID_PREFIX + page[-1][0] if page else None,
+        }
+
+    def list_ordered(self, agent_id: str) -> Dict[str, Dict[str, Any]]:
+        """Entradas del agente ordenadas de la más antigua a la más reciente"""
+        return order_by_activity(self.list(agent_id))
+
+
+class JsonInboxIndex(InboxIndex):
+    """Índice guardado como un documento de referencias por agente.
+
+    En modo `optimistic` el documento se escribe con `compare_and_put` y se
+    reintenta sobre la versión nueva si otro proceso lo modificó.
+    """
+
+    def __init__(self, storage: Any = None, optimistic: bool = False, max_retries: int = 10):
+        self._storage = storage
+        self.optimistic = optimistic
+        self.max_retries = max_retries
+
+    @property
+    def storage(self) -> Any:
+        return self._storage if self._storage is not None else get_json_storage()
+
+    def _key(self, agent_id: str) -> str:
+        return sanitize_key(f"a2a_inbox_{agent_id}")
+
+    def _legacy_key(self, agent_id: str) -> str:
+        return sanitize_key(f"a2a_agent_{agent_id}")
+
+    def _migrate_legacy(self, agent_id: str) -> Dict[str, Any]:
+        """Construye el índice a partir del documento antiguo con mensajes copiados.
+
+        Se guarda siempre con `compare_and_put` esperando que el índice no
+        exista: si otro lector o escritor lo creó antes se usa el suyo.
+        """
+        key = self._key(agent_id)
+        for _ in range(self.max_retries + 1):
+            document = {"format": INBOX_FORMAT, "agent_id": agent_id, "conversations": {}, "version": 0}
+            legacy = read_json(self.storage, self._legacy_key(agent_id)) or {}
+            conversations = {}
+            for conversation_id, context in legacy.items():
+                messages = context.get("messages", [])
+                if not messages:
+                    continue
+                entry = make_inbox_entry(messages[-1], position=None)
+                entry["message_count"] = len(messages)
+                entry["metadata"] = context.get("metadata", {})
+                conversations[conversation_id] = entry
+            if not conversations:
+                return document
+            document = {**document, "conversations": order_by_activity(conversations), "version": 1}
+            try:
+                compare_and_put(self.storage, key, document, 0)
+                return document
+            except VersionConflictError:
+                current = read_json(self.storage, key)
+                if current is not None:
+                    return self._ordered(current)
+        raise VersionConflictError(key)
+
+    def _ordered(self, document: Dict[str, Any]) -> Dict[str, Any]:
+        if document.get("format") in UNORDERED_FORMATS:
+            # Se reescribe ordenado en la siguiente escritura
+            return {**document, "format": INBOX_FORMAT, "conversations": order_by_activity(document["conversations"])}
+        return document
+
+    def _read(self, agent_id: str) -> Dict[str, Any]:
+        document = read_json(self.storage, self._key(agent_id))
+        if document is None:
+            return self._migrate_legacy(agent_id)
+        return self._ordered(document)
+
+    def record_many(
+        self,
+        agent_id: str,
+        records: List[Tuple[str, Dict[str, Any], int]],
+    ) -> List[Dict[str, Any]]:
+        key = self._key(agent_id)
+        for _ in range(self.max_retries + 1):
+            document = self._read(agent_id)
+            version = document.get("version", 0)
+            conversations = document["conversations"]
+            updates: Dict[str, Dict[str, Any]] = {}
+            entries = []
+            for conversation_id, message, position in records:
+                previous = updates.get(conversation_id) or conversations.get(conversation_id)
+                entry = make_inbox_entry(message, position, previous)
+                updates[conversation_id] = entry
+                entries.append(entry)
+
+            updated = {
+                **document,
+                "conversations": merge_ordered(conversations, updates),
+                "version": version + 1,
+            }
+            if not self.optimistic:
+                self.storage.put(key, updated)
+                return entries
+            try:
+                compare_and_put(self.storage, key, updated, version)
+                return entries
+            except VersionConflictError:
+                continue
+        raise VersionConflictError(key)
+
+    def list(self, agent_id: str) -> Dict[str, Dict[str, Any]]:
+        return self._read(agent_id)["conversations"]
+
+    def list_ordered(self, agent_id: str) -> Dict[str, Dict[str, Any]]:
+        return self.list(agent_id)
+
+
+@functools.cache
+def get_inbox_index() -> InboxIndex:
+    """Devuelve el índice de bandejas de entrada configurado para la aplicación"""
+    from app.libs.sqlite_storage import SqliteInboxIndex, get_sqlite_database, sqlite_enabled
+
+    if sqlite_enabled():
+        return SqliteInboxIndex(get_sqlite_database())
+    return JsonInboxIndex(optimistic=env_flag("A2A_OPTIMISTIC_WRITES", default=get_shared_state().shared))
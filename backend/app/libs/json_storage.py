@@ -0,0 +1,106 @@
+"""Utilidades comunes para los almacenes basados en `db.storage.json`.
+
+Usage:
+
+    from app.libs.json_storage import get_json_storage, read_json, sanitize_key
+
+    storage = get_json_storage()
+    data = read_json(storage, sanitize_key("session_user_abc"))
+
+Los documentos con campo `version` pueden escribirse en modo optimista con
+`compare_and_put`, que falla con `VersionConflictError` si otro escritor los
+modificó desde que se leyeron. Cuando el almacenamiento no tiene escritura
+condicional propia, la comprobación y la escritura se hacen bajo un cerrojo del
+estado compartido (`app.libs.shared_state`), atómico entre los procesos que lo
+comparten.
+
+`get_json_storage` devuelve el almacenamiento envuelto en `InstrumentedStorage`,
+que cuenta y mide la duración de cada lectura y escritura.
+"""
+
+import time
+from typing import Any, Dict, Optional
+
+from app.libs.metrics import get_metrics
+from app.libs.shared_state import get_shared_state
+from databutton_app.lazy import lazy_import
+
+db = lazy_import("databutton")
+
+_storage_seconds = get_metrics().histogram(
+    "json_storage_duration_seconds", "Duración de las lecturas y escrituras de db.storage.json", ["op"]
+)
+
+
+def sanitize_key(key: str) -> str:
+    """Sanitiza la clave para almacenamiento seguro"""
+    return ''.join(c for c in key if c.isalnum() or c in '._-')
+
+
+class InstrumentedStorage:
+    """Envoltorio de un almacenamiento JSON que mide cada `get` y `put`.
+
+    Solo cuenta operaciones y su duración: medir los bytes obligaría a
+    serializar otra vez cada documento, que cuesta más que la propia operación.
+    """
+
+    __slots__ = ("_storage",)
+
+    def __init__(self, storage: Any):
+        self._storage = storage
+
+    def get(self, key: str, *args: Any, **kwargs: Any) -> Any:
+        started = time.perf_counter()
+        try:
+            value = self._storage.get(key, *args, **kwargs)
+        finally:
+            _storage_seconds.observe(time.perf_counter() - started, "get")
+        return value
+
+    def put(self, key: str, value: Any) -> None:
+        started = time.perf_counter()
+        try:
+            self._storage.put(key, value)
+        finally:
+            _storage_seconds.observe(time.perf_counter() - started, "put")
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._storage, name)
+
+
+def get_json_storage() -> Any:
+    """Devuelve el almacenamiento JSON por defecto (databutton), instrumentado"""
+    return InstrumentedStorage(db.storage.json)
+
+
+def read_json(storage: Any, key: str) -> Optional[Any]:
+    """Lee un documento JSON y devuelve None si no existe"""
+    try:
+        return storage.get(key)
+    except FileNotFoundError:
+        return None
+
+
+class VersionConflictError(Exception):
+    """El documento cambió de versión entre la lectura y la escritura"""
+
+
+def compare_and_put(storage: Any, key: str, value: Dict[str, Any], expected_version: int) -> None:
+    """Escribe `value` solo si la versión guardada sigue siendo `expected_version`.
+
+    Usa `storage.compare_and_put` cuando el backend ofrece una escritura
+    condicional atómica. En caso contrario comprueba la versión y escribe
+    dentro de un cerrojo por clave del estado compartido: atómico entre los
+    escritores que pasan por aquí y comparten ese estado.
+    """
+    native = getattr(storage, "compare_and_put", None)
+    if native is not None:
+        if not native(key, value, expected_version):
+            raise VersionConflictError(key)
+        return
+
+    with get_shared_state().lock(f"storage:{key}"):
+        current = read_json(storage, key)
+        if (current or {}).get("version", 0) != expected_version:
+            raise VersionConflictError(key)
+        storage.put(key, value)
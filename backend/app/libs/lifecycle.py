@@ -0,0 +1,53 @@
+"""Registro de tareas de arranque y apagado de la aplicación.
+
+Los módulos registran funciones (síncronas o asíncronas) que `main.create_app`
+ejecuta desde el `lifespan` de FastAPI.
+
+Usage:
+
+    from app.libs.lifecycle import on_shutdown
+
+    @on_shutdown
+    async def flush_pending_writes():
+        ...
+"""
+
+import inspect
+from typing import Any, Callable, List
+
+_startup: List[Callable[[], Any]] = []
+_shutdown: List[Callable[[], Any]] = []
+
+
+def on_startup(fn: Callable[[], Any]) -> Callable[[], Any]:
+    """Registra una función para ejecutarse al arrancar la aplicación"""
+    if fn not in _startup:
+        _startup.append(fn)
+    return fn
+
+
+def on_shutdown(fn: Callable[[], Any]) -> Callable[[], Any]:
+    """Registra una función para ejecutarse al detener la aplicación"""
+    if fn not in _shutdown:
+        _shutdown.append(fn)
+    return fn
+
+
+async def _run(hooks: List[Callable[[], Any]]) -> None:
+    for hook in hooks:
+        try:
+            result = hook()
+            if inspect.isawaitable(result):
+                await result
+        except Exception as e:
+            print(f"Error en tarea de ciclo de vida {getattr(hook, '__name__', hook)}: {str(e)}")
+
+
+async def run_startup() -> None:
+    """Ejecuta las tareas de arranque en orden de registro"""
+    await _run(_startup)
+
+
+async def run_shutdown() -> None:
+    """Ejecuta las tareas de apagado en orden inverso al de registro"""
+    await _run(list(reversed(_shutdown)))
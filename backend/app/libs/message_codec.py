@@ -0,0 +1,211 @@
+"""Codificación compacta de los mensajes A2A almacenados.
+
+Un mensaje A2A guardado repite en cada copia los nombres de campo, los dos
+descriptores de agente (casi siempre `"agent_name": "Unknown Agent"`) y un
+timestamp ISO de 26 caracteres. En formato compacto un bloque de mensajes se
+guarda como:
+
+    {"codec": "a2a-compact-v1", "conversation_id": "...",
+     "agents": [["training", "Unknown Agent"], ["nutrition", "Nutrición"]],
+     "rows": [[message_id, conversation_id|None, epoch_us, from, to, type, content, metadata|None], ...]}
+
+donde `from`/`to` son índices en la tabla `agents` del bloque y
+`conversation_id` es None cuando coincide con el del bloque. Un mensaje que no
+se puede representar así sin pérdida (campos adicionales, un timestamp que no
+vuelve idéntico) se guarda tal cual dentro de `rows`. La lectura detecta el
+formato, así que los documentos escritos con y sin codificación conviven.
+
+`A2A_MESSAGE_ENCODING=compact` activa el formato al escribir (por defecto
+`json`, los mensajes completos). `pack`/`unpack` serializan a bytes con
+msgpack, o con orjson o json si no está instalado, para los backends que
+guardan binario; `pack_message` guarda así un único mensaje compacto.
+
+Usage:
+
+    from app.libs.message_codec import decode_messages, encode_messages
+
+    block = encode_messages(messages, conversation_id)
+    assert decode_messages(block) == messages
+"""
+
+import json
+import os
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+CODEC = "a2a-compact-v1"
+ENCODINGS = ("json", "compact")
+
+# Primer byte de `pack`: cómo está serializado el resto
+_MSGPACK_TAG = b"\x01"
+_JSON_TAG = b"\x02"
+
+_REQUIRED_FIELDS = frozenset({"message_id", "conversation_id", "timestamp", "from", "to", "type", "content"})
+_MESSAGE_FIELDS = _REQUIRED_FIELDS | {"metadata"}
+_AGENT_FIELDS = frozenset({"agent_id", "agent_name"})
+_EPOCH = datetime(1970, 1, 1)
+
+
+def get_message_encoding() -> str:
+    """Codificación con la que se escriben los mensajes (`A2A_MESSAGE_ENCODING`)"""
+    encoding = os.environ.get("A2A_MESSAGE_ENCODING", "json").strip().lower()
+    if encoding not in ENCODINGS:
+        raise ValueError(f"A2A_MESSAGE_ENCODING debe ser uno de {ENCODINGS}: {encoding!r}")
+    return encoding
+
+
+def timestamp_to_epoch_us(timestamp: str) -> Optional[int]:
+    """Microsegundos desde la época, o None si el timestamp no vuelve idéntico al decodificarlo"""
+    try:
+        parsed = datetime.fromisoformat(timestamp)
+    except (TypeError, ValueError):
+        return None
+    if parsed.tzinfo is not None or parsed.isoformat() != timestamp:
+        return None
+    delta = parsed - _EPOCH
+    return (delta.days * 86400 + delta.seconds) * 1_000_000 + delta.microseconds
+
+
+def epoch_us_to_timestamp(epoch_us: int) -> str:
+    return (_EPOCH + timedelta(microseconds=epoch_us)).isoformat()
+
+
+class _AgentTable:
+    """Tabla de descriptores de agente de un bloque; cada descriptor se guarda una vez"""
+
+    def __init__(self, agents: Optional[List[List[Optional[str]]]] = None) -> None:
+        self.agents: List[List[Optional[str]]] = [list(agent) for agent in agents or []]
+        self._index: Dict[Tuple[str, Optional[str]], int] = {
+            (agent_id, agent_name): index for index, (agent_id, agent_name) in enumerate(self.agents)
+        }
+
+    def intern(self, agent: Any) -> Optional[int]:
+        if not isinstance(agent, dict) or not agent.keys() <= _AGENT_FIELDS or "agent_id" not in agent:
+            return None
+        if "agent_name" in agent and agent["agent_name"] is None:
+            return None
+        key = (agent["agent_id"], agent.get("agent_name"))
+        index = self._index.get(key)
+        if index is None:
+            index = self._index[key] = len(self.agents)
+            self.agents.append(list(key))
+        return index
+
+
+def _encode_row(message: Dict[str, Any], conversation_id: Optional[str], agents: _AgentTable) -> Any:
+    keys = message.keys()
+    if not (keys == _REQUIRED_FIELDS or keys == _MESSAGE_FIELDS):
+        return message
+    if message["conversation_id"] is None or ("metadata" in message and message["metadata"] is None):
+        return message
+    epoch_us = timestamp_to_epoch_us(message["timestamp"])
+    sender = agents.intern(message["from"])
+    recipient = agents.intern(message["to"])
+    if epoch_us is None or sender is None or recipient is None:
+        return message
+    own_conversation = message["conversation_id"]
+    return [
+        message["message_id"],
+        None if own_conversation == conversation_id else own_conversation,
+        epoch_us,
+        sender,
+        recipient,
+        message["type"],
+        message["content"],
+        message.get("metadata"),
+    ]
+
+
+def encode_messages(messages: List[Dict[str, Any]], conversation_id: Optional[str] = None) -> Dict[str, Any]:
+    """Bloque compacto con los mensajes, en el mismo orden"""
+    agents = _AgentTable()
+    rows = [_encode_row(message, conversation_id, agents) for message in messages]
+    return {"codec": CODEC, "conversation_id": conversation_id, "agents": agents.agents, "rows": rows}
+
+
+def extend_messages(block: Dict[str, Any], keep: int, messages: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Bloque con las primeras `keep` filas de `block` seguidas de `messages`, sin decodificar las existentes"""
+    agents = _AgentTable(block["agents"])
+    conversation_id = block["conversation_id"]
+    rows = block["rows"][:keep] + [_encode_row(message, conversation_id, agents) for message in messages]
+    return {"codec": CODEC, "conversation_id": conversation_id, "agents": agents.agents, "rows": rows}
+
+
+def row_timestamp(row: Any) -> str:
+    """Timestamp ISO de una fila de un bloque, sin decodificar el resto del mensaje"""
+    return row["timestamp"] if isinstance(row, dict) else epoch_us_to_timestamp(row[2])
+
+
+def _agent(agents: List[List[Optional[str]]], index: int) -> Dict[str, Any]:
+    agent_id, agent_name = agents[index]
+    agent = {"agent_id": agent_id}
+    if agent_name is not None:
+        agent["agent_name"] = agent_name
+    return agent
+
+
+def decode_messages(block: Dict[str, Any], limit: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Mensajes completos (los `limit` primeros) a partir de un bloque de `encode_messages`"""
+    if block.get("codec") != CODEC:
+        raise ValueError(f"Codificación de mensajes desconocida: {block.get('codec')!r}")
+    agents = block["agents"]
+    messages = []
+    for row in block["rows"][:limit]:
+        if isinstance(row, dict):
+            messages.append(row)
+            continue
+        message_id, conversation_id, epoch_us, sender, recipient, message_type, content, metadata = row
+        message = {
+            "message_id": message_id,
+            "conversation_id": block["conversation_id"] if conversation_id is None else conversation_id,
+            "timestamp": epoch_us_to_timestamp(epoch_us),
+            "from": _agent(agents, sender),
+            "to": _agent(agents, recipient),
+            "type": message_type,
+            "content": content,
+        }
+        if metadata is not None:
+            message["metadata"] = metadata
+        messages.append(message)
+    return messages
+
+
+def pack(value: Any) -> bytes:
+    """Serializa a bytes con msgpack si está disponible, si no con orjson o json"""
+    if msgpack is not None:
+        return _MSGPACK_TAG + msgpack.packb(value, use_bin_type=True)
+    if orjson is not None:
+        return _JSON_TAG + orjson.dumps(value)
+    return _JSON_TAG + json.dumps(value, separators=(",", ":"), ensure_ascii=False).encode()
+
+
+def unpack(data: bytes) -> Any:
+    tag, body = data[:1], data[1:]
+    if tag == _MSGPACK_TAG:
+        if msgpack is None:
+            raise RuntimeError("Datos guardados con msgpack: instala el paquete `msgpack` para leerlos")
+        return msgpack.unpackb(body, raw=False)
+    if tag == _JSON_TAG:
+        return orjson.loads(body) if orjson is not None else json.loads(body)
+    raise ValueError(f"Formato binario desconocido: {tag!r}")
+
+
+def pack_message(message: Dict[str, Any], conversation_id: Optional[str] = None) -> bytes:
+    """Un solo mensaje en binario, con sus descriptores de agente en línea"""
+    block = encode_messages([message], conversation_id)
+    return pack([block["agents"], block["rows"][0]])
+
+
+def unpack_message(data: bytes, conversation_id: Optional[str] = None) -> Dict[str, Any]:
+    agents, row = unpack(data)
+    return decode_messages({"codec": CODEC, "conversation_id": conversation_id, "agents": agents, "rows": [row]})[0]
@@ -0,0 +1,257 @@
+"""Métricas del proceso en formato de texto de Prometheus.
+
+Contadores e histogramas en memoria, pensados para el camino crítico: cada
+observación es una búsqueda en un diccionario por la tupla de etiquetas y una
+suma bajo un lock. Los valores que otros componentes ya llevan (estadísticas de
+cachés, pools, el bus de mensajes...) no se duplican: se registran
+*collectors* que los leen solo cuando se pide `/metrics`.
+
+Usage:
+
+    from app.libs.metrics import get_metrics
+
+    metrics = get_metrics()
+    routed = metrics.counter("orchestrator_routed_total", "Consultas por agente", ["agent"])
+    routed.inc("nutrition")
+
+    stage = metrics.histogram("orchestrator_stage_seconds", "Duración por etapa", ["stage"])
+    with stage.time("routing"):
+        ...
+
+    print(metrics.render())
+"""
+
+import bisect
+import functools
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Segundos: de 0,5 ms (búsquedas en memoria) a 10 s (agentes lentos)
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# (etiquetas, valor) de una muestra
+Sample = Tuple[Dict[str, Any], float]
+# (nombre, tipo, ayuda, muestras) de una familia que produce un collector
+Family = Tuple[str, str, str, Iterable[Sample]]
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: Dict[str, Any]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Contador monótono por combinación de etiquetas"""
+
+    type = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels: str) -> float:
+        return self._values.get(labels, 0)
+
+    def samples(self) -> List[Tuple[str, Dict[str, Any], float]]:
+        with self._lock:
+            items = list(self._values.items())
+        return [(self.name, dict(zip(self.labelnames, labels)), value) for labels, value in items]
+
+
+class Histogram:
+    """Histograma acumulativo de buckets fijos por combinación de etiquetas"""
+
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Por etiquetas: [conteo por bucket (+Inf al final), suma, total]
+        self._values: Dict[Tuple[str, ...], List[Any]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    @contextmanager
+    def time(self, *labels: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *labels)
+
+    def count(self, *labels: str) -> int:
+        entry = self._values.get(labels)
+        return entry[2] if entry is not None else 0
+
+    def samples(self) -> List[Tuple[str, Dict[str, Any], float]]:
+        with self._lock:
+            items = [(labels, (list(entry[0]), entry[1], entry[2])) for labels, entry in self._values.items()]
+        samples = []
+        for labels, (counts, total, count) in items:
+            base = dict(zip(self.labelnames, labels))
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                samples.append((f"{self.name}_bucket", {**base, "le": _format_value(bound)}, cumulative))
+            samples.append((f"{self.name}_sum", base, total))
+            samples.append((f"{self.name}_count", base, count))
+        return samples
+
+
+class MetricsRegistry:
+    """Métricas registradas y collectors que se leen al exportar"""
+
+    def __init__(self):
+        self._metrics: Dict[str, Any] = {}
+        self._collectors: Dict[str, Callable[[], Iterable[Family]]] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric: Any) -> Any:
+        with self._lock:
+            # Los módulos pueden importarse más de una vez: se reutiliza la métrica existente
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                if type(existing) is not type(metric) or existing.labelnames != metric.labelnames:
+                    raise ValueError(f"Métrica {metric.name} ya registrada con otra definición")
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, help, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        help: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        return self._register(Histogram(name, help, labelnames, buckets))
+
+    def collector(self, name: str, collect: Callable[[], Iterable[Family]]) -> None:
+        """Registra (o sustituye) una función que devuelve familias de métricas al exportar"""
+        with self._lock:
+            self._collectors[name] = collect
+
+    def render(self) -> str:
+        """Todas las métricas en el formato de exposición de texto de Prometheus"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+            collectors = list(self._collectors.items())
+
+        lines: List[str] = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+
+        for collector_name, collect in collectors:
+            try:
+                families = list(collect())
+            except Exception as e:
+                print(f"Error en el collector de métricas {collector_name}: {str(e)}")
+                continue
+            for name, metric_type, help, samples in families:
+                lines.append(f"# HELP {name} {help}")
+                lines.append(f"# TYPE {name} {metric_type}")
+                for labels, value in samples:
+                    lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+def cache_families(prefix: str, caches: Dict[str, Any]) -> List[Family]:
+    """Familias de aciertos, fallos y tamaño de varias TTLCache por nombre"""
+    stats = {name: cache.stats() for name, cache in caches.items()}
+    return [
+        (f"{prefix}_hits_total", "counter", "Aciertos de la caché", [({"cache": n}, s["hits"]) for n, s in stats.items()]),
+        (f"{prefix}_misses_total", "counter", "Fallos de la caché", [({"cache": n}, s["misses"]) for n, s in stats.items()]),
+        (f"{prefix}_entries", "gauge", "Entradas en la caché", [({"cache": n}, s["size"]) for n, s in stats.items()]),
+    ]
+
+
+@functools.cache
+def get_metrics() -> MetricsRegistry:
+    """Devuelve el registro de métricas del proceso"""
+    return MetricsRegistry()
+
+
+class MetricsMiddleware:
+    """Middleware ASGI que mide cada petición HTTP por método, ruta y estado.
+
+    La ruta es la plantilla con la que se registró
+    (`/a2a/conversation/{conversation_id}`), no la URL, para que el número de
+    series no crezca con los identificadores.
+    """
+
+    def __init__(self, app: Any, registry: Optional[MetricsRegistry] = None):
+        self.app = app
+        registry = registry or get_metrics()
+        self.requests = registry.counter(
+            "http_requests_total", "Peticiones HTTP por método, ruta y estado", ["method", "route", "status"]
+        )
+        self.latency = registry.histogram(
+            "http_request_duration_seconds", "Duración de las peticiones HTTP", ["method", "route"]
+        )
+
+    async def __call__(self, scope: Dict[str, Any], receive: Callable, send: Callable) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status = [500]
+
+        async def send_with_status(message: Dict[str, Any]) -> None:
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = scope.get("route")
+            path = getattr(route, "path", None) or "unmatched"
+            method = scope["method"]
+            self.latency.observe(time.perf_counter() - started, method, path)
+            self.requests.inc(method, path, str(status[0]))
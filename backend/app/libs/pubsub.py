@@ -0,0 +1,162 @@
+"""Pub/sub en proceso para enviar mensajes A2A en tiempo real.
+
+Cada suscriptor tiene un buffer acotado (`A2A_SUBSCRIBER_BUFFER`). Publicar
+nunca espera: si el buffer de un suscriptor está lleno, ese suscriptor es
+lento y se le desconecta (`dropped`) en lugar de frenar al emisor o acumular
+memoria sin límite; el cliente puede reconectarse y recuperar lo perdido con
+los endpoints paginados.
+
+Los temas son cadenas (`agent:<id>`, `conversation:<id>`). Un mensaje que
+coincide con varios temas de un mismo suscriptor se le entrega una sola vez.
+Es seguro publicar desde otro bucle de eventos u otro hilo: la entrega se
+programa en el bucle del suscriptor.
+
+Usage:
+
+    from app.libs.pubsub import get_message_bus
+
+    bus = get_message_bus()
+    subscription = bus.subscribe(["agent:training"])
+    bus.publish(["agent:training", "conversation:c1"], message)
+    message = await subscription.get()  # None si se le desconectó por lento
+"""
+
+import asyncio
+import functools
+import os
+import threading
+from typing import Any, Dict, Iterable, Optional, Set
+
+DEFAULT_BUFFER_SIZE = 256
+
+_CLOSED = object()
+
+
+class Subscription:
+    """Buffer acotado de mensajes de uno o varios temas"""
+
+    def __init__(self, topics: Iterable[str], buffer_size: int):
+        self.topics = frozenset(topics)
+        self.buffer_size = buffer_size
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._loop = asyncio.get_running_loop()
+        self.closed = False
+        self.dropped = False
+        self.delivered = 0
+
+    def _offer(self, message: Any) -> bool:
+        """Añade el mensaje al buffer; devuelve False si el suscriptor va demasiado lento"""
+        if self.closed:
+            return True
+        if self._queue.qsize() >= self.buffer_size:
+            self.dropped = True
+            self._close()
+            return False
+        self._queue.put_nowait(message)
+        self.delivered += 1
+        return True
+
+    def _close(self) -> None:
+        if not self.closed:
+            self.closed = True
+            self._queue.put_nowait(_CLOSED)
+
+    async def get(self) -> Optional[Any]:
+        """Siguiente mensaje, o None cuando la suscripción se ha cerrado"""
+        message = await self._queue.get()
+        if message is _CLOSED:
+            # Se deja el marcador para que las siguientes llamadas también terminen
+            self._queue.put_nowait(_CLOSED)
+            return None
+        return message
+
+    def __aiter__(self) -> "Subscription":
+        return self
+
+    async def __anext__(self) -> Any:
+        message = await self.get()
+        if message is None:
+            raise StopAsyncIteration
+        return message
+
+
+class PubSub:
+    """Reparto de mensajes a los suscriptores de cada tema"""
+
+    def __init__(self, buffer_size: int = DEFAULT_BUFFER_SIZE):
+        self.buffer_size = buffer_size
+        self._topics: Dict[str, Set[Subscription]] = {}
+        # Los suscriptores pueden vivir en otros hilos (p. ej. otro bucle del servidor)
+        self._lock = threading.Lock()
+        self.published = 0
+        self.dropped_subscribers = 0
+
+    @property
+    def subscribers(self) -> int:
+        with self._lock:
+            return len({subscription for subs in self._topics.values() for subscription in subs})
+
+    def subscribe(self, topics: Iterable[str]) -> Subscription:
+        subscription = Subscription(topics, self.buffer_size)
+        with self._lock:
+            for topic in subscription.topics:
+                self._topics.setdefault(topic, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        with self._lock:
+            for topic in subscription.topics:
+                subs = self._topics.get(topic)
+                if subs is not None:
+                    subs.discard(subscription)
+                    if not subs:
+                        del self._topics[topic]
+        if not subscription.closed and not subscription._loop.is_closed():
+            subscription._loop.call_soon_threadsafe(subscription._close)
+
+    def publish(self, topics: Iterable[str], message: Any) -> int:
+        """Entrega el mensaje a los suscriptores de los temas; devuelve a cuántos"""
+        targets: Set[Subscription] = set()
+        with self._lock:
+            for topic in topics:
+                targets.update(self._topics.get(topic, ()))
+        self.published += 1
+
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+
+        for subscription in targets:
+            if subscription._loop is loop:
+                if not subscription._offer(message):
+                    self._drop(subscription)
+            elif subscription._loop.is_closed():
+                # Su bucle ya no existe: nadie volverá a leer la suscripción
+                self.unsubscribe(subscription)
+            else:
+                subscription._loop.call_soon_threadsafe(self._offer_threadsafe, subscription, message)
+        return len(targets)
+
+    def _offer_threadsafe(self, subscription: Subscription, message: Any) -> None:
+        if not subscription._offer(message):
+            self._drop(subscription)
+
+    def _drop(self, subscription: Subscription) -> None:
+        self.dropped_subscribers += 1
+        self.unsubscribe(subscription)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "buffer_size": self.buffer_size,
+            "topics": len(self._topics),
+            "subscribers": self.subscribers,
+            "published": self.published,
+            "dropped_subscribers": self.dropped_subscribers,
+        }
+
+
+@functools.cache
+def get_message_bus() -> PubSub:
+    """Devuelve el bus de mensajes A2A del proceso"""
+    return PubSub(buffer_size=int(os.environ.get("A2A_SUBSCRIBER_BUFFER", DEFAULT_BUFFER_SIZE)))
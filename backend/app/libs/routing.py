@@ -0,0 +1,283 @@
+"""Enrutamiento de consultas por palabras clave con un patrón precompilado.
+
+Todas las palabras clave de todos los agentes se compilan una sola vez en una
+única expresión regular construida a partir de un trie (los prefijos comunes
+se comparten), de forma que puntuar una consulta es una sola pasada sobre el
+texto normalizado, sin importar cuántas palabras clave haya por agente.
+
+La puntuación conserva la semántica original: cada palabra clave suma un
+punto a su agente si aparece como subcadena de la consulta, aunque se
+solape con otra (p. ej. "datos" y "datos personales").
+
+Los agentes y sus palabras clave se leen de `routing.json` (junto a
+`routers.json`, o la ruta de `ROUTING_CONFIG_PATH`) y se compilan en un
+`RoutingSnapshot` inmutable. `RoutingTable` vigila el archivo y, si cambia,
+compila una instantánea nueva y la sustituye de forma atómica: las peticiones
+en curso terminan con la instantánea que ya tenían.
+
+Usage:
+
+    from app.libs.routing import get_routing_table
+
+    snapshot = get_routing_table().snapshot()
+    snapshot.matcher.best("Quiero una rutina")  # "training"
+"""
+
+import asyncio
+import functools
+import hashlib
+import json
+import os
+import pathlib
+import re
+import unicodedata
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Container, Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+from app.libs.agent_registry import AGENT_INFO_FIELDS, AgentRegistry
+from app.libs.async_storage import run_blocking
+from app.libs.lifecycle import on_shutdown, on_startup
+
+DEFAULT_ROUTING_PATH = pathlib.Path(__file__).resolve().parents[2] / "routing.json"
+DEFAULT_RELOAD_SECONDS = 2.0
+
+
+def normalize_text(text: str) -> str:
+    """Pasa a minúsculas y elimina acentos para comparar sin distinguirlos.
+
+    Tras descomponer (NFKD) se descartan los caracteres no ASCII: los acentos
+    quedan como marcas combinables y desaparecen, "ñ" pasa a "n".
+    """
+    text = text.casefold()
+    if text.isascii():
+        return text
+    return unicodedata.normalize("NFKD", text).encode("ascii", "ignore").decode("ascii")
+
+
+def _trie_pattern(words: Iterable[str]) -> str:
+    """Construye una alternativa regex equivalente a `words` factorizando prefijos.
+
+    En cada nodo se prueban antes las continuaciones más largas, así que el
+    grupo captura la palabra más larga que empieza en cada posición.
+    """
+    trie: Dict[str, dict] = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[""] = {}
+
+    def build(node: Dict[str, dict]) -> str:
+        terminal = "" in node
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        if terminal:
+            return "(?:" + body + ")?"
+        return body
+
+    return build(trie)
+
+
+class KeywordMatcher:
+    """Puntúa agentes por palabras clave en una sola pasada sobre la consulta"""
+
+    def __init__(self, keywords: Dict[str, List[str]], priority: Optional[List[str]] = None):
+        agents_by_keyword: Dict[str, List[str]] = {}
+        for agent, words in keywords.items():
+            for word in words:
+                normalized = normalize_text(word)
+                if normalized and agent not in agents_by_keyword.setdefault(normalized, []):
+                    agents_by_keyword[normalized].append(agent)
+
+        self.agents = list(keywords)
+        self._agents_by_keyword = agents_by_keyword
+
+        # Si aparece una palabra clave también aparecen todas las contenidas en ella
+        self._implied: Dict[str, FrozenSet[str]] = {
+            word: frozenset(other for other in agents_by_keyword if other in word)
+            for word in agents_by_keyword
+        }
+
+        # Búsqueda anticipada de ancho cero: una coincidencia (la más larga) por posición
+        self._pattern = re.compile("(?=(" + _trie_pattern(agents_by_keyword) + "))") if agents_by_keyword else None
+
+        order = {agent: rank for rank, agent in enumerate(priority or [])}
+        self._rank = {agent: order.get(agent, len(order)) for agent in self.agents}
+
+    def matched_keywords(self, query: str) -> FrozenSet[str]:
+        """Devuelve las palabras clave (normalizadas) presentes en la consulta"""
+        if self._pattern is None:
+            return frozenset()
+        found = set()
+        for word in set(self._pattern.findall(normalize_text(query))):
+            found.update(self._implied[word])
+        return frozenset(found)
+
+    def _matched_scores(self, query: str) -> Dict[str, int]:
+        scores: Dict[str, int] = {}
+        for word in self.matched_keywords(query):
+            for agent in self._agents_by_keyword[word]:
+                scores[agent] = scores.get(agent, 0) + 1
+        return scores
+
+    def scores(self, query: str) -> Dict[str, int]:
+        """Número de palabras clave de cada agente presentes en la consulta"""
+        return {agent: 0 for agent in self.agents} | self._matched_scores(query)
+
+    def ranked(self, query: str, min_score: int = 1, exclude: Container[str] = ()) -> List[Tuple[str, int]]:
+        """Agentes con al menos `min_score` coincidencias, de mayor a menor relevancia"""
+        scores = self._matched_scores(query)
+        ranked = [(agent, score) for agent, score in scores.items() if score >= min_score and agent not in exclude]
+        return sorted(ranked, key=lambda item: (-item[1], self._rank[item[0]]))
+
+    def best(self, query: str, exclude: Container[str] = ()) -> Optional[str]:
+        """Agente con mayor puntuación; los empates se resuelven por prioridad.
+
+        Los agentes de `exclude` (p. ej. los no disponibles) no se eligen.
+        """
+        scores = self._matched_scores(query)
+        if exclude:
+            scores = {agent: score for agent, score in scores.items() if agent not in exclude}
+        if not scores:
+            return None
+        return min(scores, key=lambda agent: (-scores[agent], self._rank[agent]))
+
+
+@dataclass(frozen=True)
+class RoutingSnapshot:
+    """Tabla de enrutamiento compilada; nunca se modifica una vez creada"""
+
+    version: str
+    registry: AgentRegistry
+    default_agent: str
+    matcher: KeywordMatcher
+    loaded_at: str
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "version": self.version,
+            "loaded_at": self.loaded_at,
+            "default_agent": self.default_agent,
+            "agents": list(self.registry.ids),
+        }
+
+
+def compile_snapshot(config: Dict[str, Any]) -> RoutingSnapshot:
+    """Valida la configuración de enrutamiento y la compila en una instantánea"""
+    agents = []
+    for raw in config.get("agents", []):
+        agent = {field: raw.get(field) for field in AGENT_INFO_FIELDS}
+        if not all(isinstance(value, str) and value for value in agent.values()):
+            raise ValueError(f"Agente inválido en la configuración de enrutamiento: {raw}")
+        words = raw.get("keywords", [])
+        if not isinstance(words, list) or not all(isinstance(word, str) for word in words):
+            raise ValueError(f"Palabras clave inválidas para {agent['agent_id']}")
+        agents.append({**agent, "keywords": words})
+
+    if not agents:
+        raise ValueError("La configuración de enrutamiento no define agentes")
+
+    registry = AgentRegistry(agents)
+    default_agent = config.get("default_agent", agents[0]["agent_id"])
+    if default_agent not in registry:
+        raise ValueError(f"Agente por defecto desconocido: {default_agent}")
+
+    # La versión incluye un hash del contenido para distinguir ediciones sin cambio de versión
+    digest = hashlib.sha256(json.dumps(config, sort_keys=True).encode()).hexdigest()[:12]
+    return RoutingSnapshot(
+        version=f"{config.get('version', 'unversioned')}+{digest}",
+        registry=registry,
+        default_agent=default_agent,
+        matcher=KeywordMatcher(
+            {record.agent_id: list(record.keywords) for record in registry if record.keywords},
+            priority=list(registry.ids),
+        ),
+        loaded_at=datetime.utcnow().isoformat(),
+    )
+
+
+def load_snapshot(path: pathlib.Path) -> RoutingSnapshot:
+    with open(path, encoding="utf-8") as f:
+        return compile_snapshot(json.load(f))
+
+
+class RoutingTable:
+    """Mantiene la instantánea vigente y la recarga cuando cambia el archivo"""
+
+    def __init__(self, path: pathlib.Path, reload_interval: float = DEFAULT_RELOAD_SECONDS):
+        self.path = pathlib.Path(path)
+        self.reload_interval = reload_interval
+        self._signature = self._file_signature()
+        self._snapshot = load_snapshot(self.path)
+        self._task: Optional[asyncio.Task] = None
+        self.reloads = 0
+        self.reload_errors = 0
+
+    def snapshot(self) -> RoutingSnapshot:
+        """Instantánea vigente; leerla es solo leer un atributo"""
+        return self._snapshot
+
+    def _file_signature(self) -> Optional[Tuple[float, int]]:
+        try:
+            stat = self.path.stat()
+        except FileNotFoundError:
+            return None
+        return (stat.st_mtime, stat.st_size)
+
+    def reload(self) -> bool:
+        """Recompila la tabla si el archivo cambió; devuelve True si se sustituyó"""
+        signature = self._file_signature()
+        if signature is None or signature == self._signature:
+            return False
+        try:
+            snapshot = load_snapshot(self.path)
+        except Exception as e:
+            # Una configuración inválida nunca reemplaza a la vigente
+            self.reload_errors += 1
+            self._signature = signature
+            print(f"Error al recargar la tabla de enrutamiento: {str(e)}")
+            return False
+        self._signature = signature
+        self._snapshot = snapshot
+        self.reloads += 1
+        print(f"Tabla de enrutamiento recargada: {snapshot.version}")
+        return True
+
+    async def _watch(self) -> None:
+        while True:
+            await asyncio.sleep(self.reload_interval)
+            await run_blocking(self.reload)
+
+    def start(self) -> None:
+        if self.reload_interval > 0 and (self._task is None or self._task.done()):
+            self._task = asyncio.get_running_loop().create_task(self._watch())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+@functools.cache
+def get_routing_table() -> RoutingTable:
+    """Devuelve la tabla de enrutamiento de la aplicación"""
+    path = os.environ.get("ROUTING_CONFIG_PATH", str(DEFAULT_ROUTING_PATH))
+    interval = float(os.environ.get("ROUTING_RELOAD_SECONDS", DEFAULT_RELOAD_SECONDS))
+    return RoutingTable(pathlib.Path(path), interval)
+
+
+@on_startup
+def _watch_routing_table() -> None:
+    get_routing_table().start()
+
+
+@on_shutdown
+async def _stop_routing_table() -> None:
+    await get_routing_table().stop()
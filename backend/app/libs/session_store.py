@@ -0,0 +1,271 @@
+"""Persistencia de sesiones del orquestador con escritura diferida.
+
+`JsonSessionStore` guarda cada sesión como un documento
+`session_{user}_{session}`. `WriteBehindSessionWriter` acepta las
+actualizaciones sin esperar al almacenamiento, agrupa las que llegan para la
+misma sesión dentro de una ventana corta (`SESSION_WRITE_BEHIND_SECONDS`) en
+una sola escritura y vacía lo pendiente al apagar la aplicación. Las lecturas
+a través del writer ven las actualizaciones aún no escritas, y una escritura
+que falla se vuelve a encolar (debajo de las actualizaciones más recientes)
+para reintentarse en la siguiente ventana.
+
+Delante del almacén hay una caché LRU/TTL de lectura y escritura en cada
+proceso (`SESSION_CACHE_SIZE`, `SESSION_CACHE_TTL_SECONDS`): las consultas
+seguidas de una misma sesión se resuelven en memoria. Sin estado compartido el
+TTL es corto para que una sesión actualizada por otro worker se relea como
+mucho tras ese tiempo. Con un estado compartido entre procesos
+(`SHARED_STATE_URL`, ver `app.libs.shared_state`) cada escritura cambia la
+versión compartida de la sesión y cada lectura la comprueba (en un hilo, fuera
+del bucle de eventos): un worker relee la sesión en cuanto otro la ha escrito,
+mientras que tras una escritura propia la caché se queda con la sesión escrita
+y su nueva versión.
+Lo que otro worker tiene aún pendiente de escribir se ve al cerrarse su ventana.
+Las escrituras de `JsonSessionStore` leen, combinan y guardan bajo el cerrojo
+del estado compartido, así que dos workers que escriben la misma sesión no
+pierden campos.
+
+Usage:
+
+    from app.libs.session_store import get_session_writer
+
+    sessions = get_session_writer()
+    context = await sessions.get(session_id, user_id)
+    sessions.schedule(session_id, user_id, {"last_agent": "training"})
+"""
+
+import asyncio
+import functools
+import json
+import os
+import uuid
+from datetime import datetime
+from typing import Any, Dict, Optional, Tuple, Union
+
+from app.libs.async_storage import run_blocking
+from app.libs.cache import TTLCache
+from app.libs.concurrency import KeyedLock
+from app.libs.json_storage import get_json_storage, read_json, sanitize_key
+from app.libs.lifecycle import on_shutdown
+from app.libs.shared_state import SharedState, get_shared_state
+from app.libs.sqlite_storage import SqliteSessionStore, get_sqlite_database, sqlite_enabled
+
+DEFAULT_WRITE_BEHIND_SECONDS = 1.0
+DEFAULT_CACHE_SIZE = 4096
+DEFAULT_CACHE_TTL_SECONDS = 5.0
+# Mucho más que el TTL de la caché: una entrada cacheada caduca antes que la versión con la que se comparó
+VERSION_TTL_SECONDS = 24 * 3600.0
+
+SessionKey = Tuple[str, str]
+
+
+class JsonSessionStore:
+    """Sesiones de usuario como documentos en un almacén clave→JSON"""
+
+    def __init__(self, storage: Any = None):
+        self._storage = storage
+
+    @property
+    def storage(self) -> Any:
+        return self._storage if self._storage is not None else get_json_storage()
+
+    def _key(self, session_id: str, user_id: str) -> str:
+        return sanitize_key(f"session_{user_id}_{session_id}")
+
+    def get(self, session_id: str, user_id: str) -> Dict[str, Any]:
+        """Obtiene una sesión de usuario o un diccionario vacío"""
+        return read_json(self.storage, self._key(session_id, user_id)) or {}
+
+    def put(self, session_id: str, user_id: str, data: Dict[str, Any]) -> Dict[str, Any]:
+        """Almacena o actualiza una sesión de usuario"""
+        key = self._key(session_id, user_id)
+        # Mismo cerrojo que `compare_and_put`: otro worker no escribe el documento entre la lectura y la escritura
+        with get_shared_state().lock(f"storage:{key}"):
+            session = dict(read_json(self.storage, key) or {})
+            session.update(data)
+            session["last_updated"] = datetime.utcnow().isoformat()
+            self.storage.put(key, session)
+        return session
+
+
+class WriteBehindSessionWriter:
+    """Acumula actualizaciones de sesión y las escribe agrupadas por sesión"""
+
+    def __init__(
+        self,
+        store: Union[JsonSessionStore, SqliteSessionStore],
+        window: float = DEFAULT_WRITE_BEHIND_SECONDS,
+        cache: Optional[TTLCache] = None,
+        shared: Optional[SharedState] = None,
+    ):
+        self.store = store
+        self.window = window
+        # Entradas (versión compartida, sesión); la versión es None sin estado compartido
+        self.cache = cache if cache is not None else TTLCache(DEFAULT_CACHE_SIZE, DEFAULT_CACHE_TTL_SECONDS)
+        self.shared = shared
+        self._pending: Dict[SessionKey, Dict[str, Any]] = {}
+        self._inflight: Dict[SessionKey, Dict[str, Any]] = {}
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._timer_loop: Optional[asyncio.AbstractEventLoop] = None
+        self._flush_task: Optional[asyncio.Task] = None
+        self._flush_lock = KeyedLock()
+        self.updates = 0
+        self.writes = 0
+        self.errors = 0
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    def _overlay(self, key: SessionKey) -> Dict[str, Any]:
+        return {**self._inflight.get(key, {}), **self._pending.get(key, {})}
+
+    @staticmethod
+    def _version_key(key: SessionKey) -> str:
+        return f"session_version:{json.dumps(key)}"
+
+    async def _shared_version(self, key: SessionKey) -> Optional[str]:
+        if self.shared is None:
+            return None
+        return await run_blocking(self.shared.get, self._version_key(key))
+
+    async def get(self, session_id: str, user_id: str) -> Dict[str, Any]:
+        """Lee la sesión combinando lo guardado con lo pendiente de escribir"""
+        key = (session_id, user_id)
+        version = await self._shared_version(key)
+        cached = self.cache.get(key, count=False)
+        if cached is not None and cached[0] != version:
+            # Otro worker escribió la sesión después de cachearla
+            self.cache.pop(key)
+        cached = self.cache.get(key)
+        if cached is None:
+            session = await run_blocking(self.store.get, session_id, user_id)
+            session = {**session, **self._overlay(key)}
+            self.cache.set(key, (version, session))
+        else:
+            session = cached[1]
+        # Copia para que quien llama pueda modificarla sin alterar la caché
+        return dict(session)
+
+    def _cache_update(self, key: SessionKey, data: Dict[str, Any]) -> None:
+        cached = self.cache.get(key, count=False)
+        if cached is not None:
+            version, session = cached
+            self.cache.set(key, (version, {**session, **data}))
+
+    async def put(self, session_id: str, user_id: str, data: Dict[str, Any]) -> None:
+        """Actualiza la sesión; con ventana 0 espera a la escritura, si no la difiere"""
+        if self.window <= 0:
+            self.updates += 1
+            self._cache_update((session_id, user_id), data)
+            if not await self._write((session_id, user_id), data):
+                # No servir desde la caché datos que no llegaron a guardarse
+                self.cache.pop((session_id, user_id))
+            return
+        self.schedule(session_id, user_id, data)
+
+    def schedule(self, session_id: str, user_id: str, data: Dict[str, Any]) -> None:
+        """Encola la actualización y programa una escritura al cerrar la ventana"""
+        self.updates += 1
+        self._pending.setdefault((session_id, user_id), {}).update(data)
+        self._cache_update((session_id, user_id), data)
+        self._arm_timer()
+
+    def _arm_timer(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._timer is None or self._timer_loop is not loop or loop.is_closed():
+            self._timer_loop = loop
+            self._timer = loop.call_later(self.window, self._start_flush)
+
+    def _start_flush(self) -> None:
+        # Se guarda la tarea: sin una referencia podría recogerse antes de terminar
+        self._timer = None
+        task = self._flush_task = asyncio.ensure_future(self.flush())
+        task.add_done_callback(self._flush_done)
+
+    def _flush_done(self, task: asyncio.Task) -> None:
+        if self._flush_task is task:
+            self._flush_task = None
+        if not task.cancelled() and task.exception() is not None:
+            self.errors += 1
+            print(f"Error al vaciar sesiones: {task.exception()}")
+
+    def _put_versioned(self, key: SessionKey, data: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
+        """Escribe la sesión y su nueva versión sin que otro worker se intercale entre ambas"""
+        version_key = self._version_key(key)
+        with self.shared.lock(version_key):
+            session = self.store.put(key[0], key[1], data)
+            version = uuid.uuid4().hex
+            self.shared.set(version_key, version, VERSION_TTL_SECONDS)
+        return version, session
+
+    async def _write(self, key: SessionKey, data: Dict[str, Any]) -> bool:
+        try:
+            if self.shared is None:
+                await run_blocking(self.store.put, key[0], key[1], data)
+            else:
+                version, session = await run_blocking(self._put_versioned, key, data)
+                # La sesión recién escrita ya incluye lo de otros workers: la caché
+                # queda al día con la versión propia y la siguiente lectura acierta
+                self.cache.set(key, (version, {**session, **self._overlay(key)}))
+            self.writes += 1
+            return True
+        except Exception as e:
+            self.errors += 1
+            print(f"Error al almacenar sesión: {str(e)}")
+            return False
+
+    async def flush(self) -> None:
+        """Escribe todas las actualizaciones pendientes"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        # Un vaciado programado que ya esté en curso termina antes que este
+        task = self._flush_task
+        if task is not None and task is not asyncio.current_task() and task.get_loop() is asyncio.get_running_loop():
+            await asyncio.wait({task})
+
+        # Un vaciado a la vez para no escribir una versión antigua después de una nueva
+        async with self._flush_lock.hold("flush"):
+            pending, self._pending = self._pending, {}
+            self._inflight = pending
+            written = [False] * len(pending)
+            try:
+                written = await asyncio.gather(*(self._write(key, data) for key, data in pending.items()))
+            finally:
+                self._inflight = {}
+                for (key, data), ok in zip(pending.items(), written):
+                    if not ok:
+                        # Lo llegado mientras tanto es más reciente y prevalece
+                        self._pending[key] = {**data, **self._pending.get(key, {})}
+                if self._pending:
+                    self._arm_timer()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "window_seconds": self.window,
+            "updates": self.updates,
+            "writes": self.writes,
+            "errors": self.errors,
+            "pending": self.pending,
+            "shared": self.shared is not None,
+            "cache": self.cache.stats(),
+        }
+
+
+@functools.cache
+def get_session_writer() -> WriteBehindSessionWriter:
+    """Devuelve el writer de sesiones compartido por el orquestador"""
+    window = float(os.environ.get("SESSION_WRITE_BEHIND_SECONDS", DEFAULT_WRITE_BEHIND_SECONDS))
+    cache = TTLCache(
+        max_size=int(os.environ.get("SESSION_CACHE_SIZE", DEFAULT_CACHE_SIZE)),
+        ttl=float(os.environ.get("SESSION_CACHE_TTL_SECONDS", DEFAULT_CACHE_TTL_SECONDS)),
+    )
+    state = get_shared_state()
+    store = SqliteSessionStore(get_sqlite_database()) if sqlite_enabled() else JsonSessionStore()
+    return WriteBehindSessionWriter(store, window=window, cache=cache, shared=state if state.shared else None)
+
+
+@on_shutdown
+async def _flush_sessions() -> None:
+    await get_session_writer().flush()
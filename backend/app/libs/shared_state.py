@@ -0,0 +1,308 @@
+"""Estado compartido entre workers: clave→JSON con TTL y cerrojos.
+
+Con un solo proceso basta con la memoria, pero con varios workers (o varias
+máquinas) detrás de un balanceador lo que deba verse igual desde todos tiene
+que vivir fuera del proceso. `SHARED_STATE_URL` elige el backend:
+
+- `memory://` (por defecto): un diccionario en el proceso; `shared` es False.
+- `sqlite://<ruta>`: un archivo SQLite en modo WAL que comparten los workers
+  de una misma máquina (`sqlite:///var/lib/nexusforge/state.db`, o relativa
+  al directorio de trabajo con `sqlite://shared_state.db`).
+- `redis://host:puerto/db`: Redis (o compatible) para varias máquinas;
+  requiere el paquete `redis`.
+
+Sobre él se apoyan la versión compartida de cada sesión, con la que cada
+worker sabe cuándo su caché local de sesiones está desfasada, y el cerrojo que
+hace atómico `compare_and_put` entre procesos.
+
+Usage:
+
+    from app.libs.shared_state import get_shared_state
+
+    state = get_shared_state()
+    state.set("clave", {"a": 1}, ttl=5.0)
+    state.get("clave")  # {"a": 1}, o None si no existe o caducó
+    with state.lock("a2a_inbox_training"):
+        ...
+"""
+
+import contextlib
+import functools
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+
+DEFAULT_URL = "memory://"
+DEFAULT_LOCK_TTL_SECONDS = 10.0
+DEFAULT_LOCK_TIMEOUT_SECONDS = 10.0
+
+
+class LockTimeoutError(Exception):
+    """No se pudo adquirir el cerrojo dentro del plazo"""
+
+
+def _dumps(value: Any) -> str:
+    return json.dumps(value, separators=(",", ":"), default=str)
+
+
+class SharedState:
+    """Interfaz común de los backends de estado compartido.
+
+    Los valores se guardan serializados en JSON, así que se leen como copias
+    y las tuplas vuelven como listas. `ttl` en segundos; None es sin caducidad.
+    """
+
+    # True si el estado lo ven también otros procesos
+    shared = False
+
+    def get(self, key: str) -> Any:
+        raise NotImplementedError
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        raise NotImplementedError
+
+    def delete(self, key: str) -> None:
+        raise NotImplementedError
+
+    def add(self, key: str, value: Any, ttl: Optional[float] = None) -> bool:
+        """Guarda el valor solo si la clave no existe (o caducó); devuelve si lo guardó"""
+        raise NotImplementedError
+
+    def delete_if(self, key: str, value: Any) -> bool:
+        """Borra la clave solo si su valor sigue siendo `value`"""
+        raise NotImplementedError
+
+    @contextlib.contextmanager
+    def lock(
+        self,
+        name: str,
+        ttl: float = DEFAULT_LOCK_TTL_SECONDS,
+        timeout: float = DEFAULT_LOCK_TIMEOUT_SECONDS,
+        poll: float = 0.005,
+    ) -> Iterator[None]:
+        """Cerrojo exclusivo entre todos los procesos que comparten el estado.
+
+        Caduca a los `ttl` segundos para que un proceso que muere con el
+        cerrojo no bloquee a los demás indefinidamente.
+        """
+        key = f"lock:{name}"
+        token = uuid.uuid4().hex
+        deadline = time.monotonic() + timeout
+        while not self.add(key, token, ttl):
+            if time.monotonic() >= deadline:
+                raise LockTimeoutError(name)
+            time.sleep(poll)
+        try:
+            yield
+        finally:
+            self.delete_if(key, token)
+
+    def close(self) -> None:
+        pass
+
+
+class MemorySharedState(SharedState):
+    """Estado en un diccionario del proceso; seguro entre hilos"""
+
+    def __init__(self, clock: Callable[[], float] = time.monotonic):
+        self._clock = clock
+        self._entries: Dict[str, Tuple[Optional[float], str]] = {}
+        self._lock = threading.Lock()
+
+    def _live(self, key: str) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, raw = entry
+        if expires_at is not None and expires_at <= self._clock():
+            del self._entries[key]
+            return None
+        return raw
+
+    def _expires_at(self, ttl: Optional[float]) -> Optional[float]:
+        return None if ttl is None else self._clock() + ttl
+
+    def get(self, key: str) -> Any:
+        with self._lock:
+            raw = self._live(key)
+        return None if raw is None else json.loads(raw)
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        raw = _dumps(value)
+        with self._lock:
+            self._entries[key] = (self._expires_at(ttl), raw)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def add(self, key: str, value: Any, ttl: Optional[float] = None) -> bool:
+        raw = _dumps(value)
+        with self._lock:
+            if self._live(key) is not None:
+                return False
+            self._entries[key] = (self._expires_at(ttl), raw)
+            return True
+
+    def delete_if(self, key: str, value: Any) -> bool:
+        raw = _dumps(value)
+        with self._lock:
+            if self._live(key) != raw:
+                return False
+            del self._entries[key]
+            return True
+
+
+
+class SqliteSharedState(SharedState):
+    """Estado en un archivo SQLite (WAL) compartido por los procesos de una máquina.
+
+    Cada hilo usa su propia conexión. Las caducidades usan la hora del
+    sistema, común a todos los procesos, y las entradas caducadas se purgan
+    cada `purge_every` escrituras.
+    """
+
+    shared = True
+
+    def __init__(self, path: str, clock: Callable[[], float] = time.time, purge_every: int = 1000):
+        self.path = path
+        self.purge_every = purge_every
+        self._clock = clock
+        self._local = threading.local()
+        self._writes = 0
+        self._connect().execute(
+            "CREATE TABLE IF NOT EXISTS shared_state ("
+            " key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL)"
+        )
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # Sin transacciones implícitas: cada sentencia es atómica por sí sola
+            conn = sqlite3.connect(self.path, timeout=30.0, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _expires_at(self, ttl: Optional[float]) -> Optional[float]:
+        return None if ttl is None else self._clock() + ttl
+
+    def _wrote(self) -> None:
+        self._writes += 1
+        if self._writes % self.purge_every == 0:
+            self._connect().execute("DELETE FROM shared_state WHERE expires_at <= ?", (self._clock(),))
+
+    def get(self, key: str) -> Any:
+        row = self._connect().execute(
+            "SELECT value FROM shared_state WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)",
+            (key, self._clock()),
+        ).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        self._connect().execute(
+            "INSERT INTO shared_state (key, value, expires_at) VALUES (?, ?, ?)"
+            " ON CONFLICT(key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at",
+            (key, _dumps(value), self._expires_at(ttl)),
+        )
+        self._wrote()
+
+    def delete(self, key: str) -> None:
+        self._connect().execute("DELETE FROM shared_state WHERE key = ?", (key,))
+
+    def add(self, key: str, value: Any, ttl: Optional[float] = None) -> bool:
+        # Inserta, o sustituye solo una entrada ya caducada, en una única sentencia
+        cursor = self._connect().execute(
+            "INSERT INTO shared_state (key, value, expires_at) VALUES (?, ?, ?)"
+            " ON CONFLICT(key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at"
+            " WHERE shared_state.expires_at IS NOT NULL AND shared_state.expires_at <= ?",
+            (key, _dumps(value), self._expires_at(ttl), self._clock()),
+        )
+        self._wrote()
+        return cursor.rowcount == 1
+
+    def delete_if(self, key: str, value: Any) -> bool:
+        cursor = self._connect().execute(
+            "DELETE FROM shared_state WHERE key = ? AND value = ?", (key, _dumps(value))
+        )
+        return cursor.rowcount == 1
+
+    def close(self) -> None:
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+_DELETE_IF_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+class RedisSharedState(SharedState):
+    """Estado en Redis (o un servidor compatible), para workers en varias máquinas"""
+
+    shared = True
+
+    def __init__(self, url: str, prefix: str = "nexusforge:"):
+        try:
+            import redis
+        except ImportError as e:
+            raise RuntimeError("SHARED_STATE_URL=redis:// requiere el paquete `redis`") from e
+        self.prefix = prefix
+        self._client = redis.Redis.from_url(url)
+        self._delete_if = self._client.register_script(_DELETE_IF_SCRIPT)
+
+    @staticmethod
+    def _px(ttl: Optional[float]) -> Optional[int]:
+        return None if ttl is None else max(1, int(ttl * 1000))
+
+    def get(self, key: str) -> Any:
+        raw = self._client.get(self.prefix + key)
+        return None if raw is None else json.loads(raw)
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        self._client.set(self.prefix + key, _dumps(value), px=self._px(ttl))
+
+    def delete(self, key: str) -> None:
+        self._client.delete(self.prefix + key)
+
+    def add(self, key: str, value: Any, ttl: Optional[float] = None) -> bool:
+        return bool(self._client.set(self.prefix + key, _dumps(value), nx=True, px=self._px(ttl)))
+
+    def delete_if(self, key: str, value: Any) -> bool:
+        return bool(self._delete_if(keys=[self.prefix + key], args=[_dumps(value)]))
+
+    def close(self) -> None:
+        self._client.close()
+
+
+def open_shared_state(url: str) -> SharedState:
+    """Crea el backend indicado por la URL (`memory://`, `sqlite://…`, `redis://…`)"""
+    scheme, sep, rest = url.partition("://")
+    if not sep:
+        raise ValueError(f"URL de estado compartido no válida: {url!r}")
+    if scheme == "memory":
+        return MemorySharedState()
+    if scheme == "sqlite":
+        if not rest:
+            raise ValueError("sqlite:// necesita la ruta del archivo")
+        return SqliteSharedState(rest)
+    if scheme in ("redis", "rediss", "unix"):
+        return RedisSharedState(url)
+    raise ValueError(f"Backend de estado compartido desconocido: {scheme!r}")
+
+
+@functools.cache
+def get_shared_state() -> SharedState:
+    """Devuelve el estado compartido configurado con `SHARED_STATE_URL`"""
+    return open_shared_state(os.environ.get("SHARED_STATE_URL", DEFAULT_URL))
+
@@ -0,0 +1,408 @@
+"""Backend de almacenamiento en SQLite (modo WAL) para A2A y sesiones.
+
+Alternativa a los documentos de `db.storage.json`: cada mensaje, entrada de
+bandeja y sesión es una fila. Anexar un mensaje inserta una fila en lugar de
+reescribir un segmento y un manifiesto, y las lecturas paginadas usan los
+índices por conversación, posición, `message_id` y timestamp en lugar de
+cargar documentos completos. Se activa con `STORAGE_BACKEND=sqlite`; el
+archivo es `SQLITE_STORAGE_PATH` (`nexusforge.db` por defecto, relativo al
+directorio de trabajo).
+
+Cada escritura es una transacción `BEGIN IMMEDIATE`, que SQLite serializa
+también entre procesos, así que varios workers de una máquina pueden compartir
+el archivo sin control de versión. Las conexiones se reutilizan desde un pool
+(`SQLITE_POOL_SIZE`) y cada una guarda compiladas las sentencias que ejecuta.
+
+Usage:
+
+    from app.libs.sqlite_storage import SqliteConversationStore, get_sqlite_database
+
+    store = SqliteConversationStore(get_sqlite_database())
+    store.append(conversation_id, message, metadata)
+    page = store.read_window(conversation_id, limit=50, before=cursor)
+"""
+
+import contextlib
+import functools
+import json
+import os
+import queue
+import sqlite3
+import threading
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from app.libs.conversation_store import ID_PREFIX, ConversationStore, CursorNotFoundError, parse_cursor
+from app.libs.inbox_index import InboxIndex, make_inbox_entry
+from app.libs.message_codec import ENCODINGS, get_message_encoding, pack_message, unpack_message
+from app.libs.metrics import get_metrics
+
+DEFAULT_PATH = "nexusforge.db"
+DEFAULT_POOL_SIZE = 16
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS conversations (
+    conversation_id TEXT PRIMARY KEY,
+    message_count INTEGER NOT NULL,
+    metadata TEXT NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS messages (
+    conversation_id TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    message_id TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    body NOT NULL,
+    PRIMARY KEY (conversation_id, position)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS messages_by_timestamp ON messages (conversation_id, timestamp);
+CREATE INDEX IF NOT EXISTS messages_by_id ON messages (conversation_id, message_id);
+CREATE TABLE IF NOT EXISTS inbox (
+    agent_id TEXT NOT NULL,
+    conversation_id TEXT NOT NULL,
+    last_timestamp TEXT NOT NULL,
+    entry TEXT NOT NULL,
+    PRIMARY KEY (agent_id, conversation_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS inbox_by_timestamp ON inbox (agent_id, last_timestamp, conversation_id);
+CREATE TABLE IF NOT EXISTS sessions (
+    user_id TEXT NOT NULL,
+    session_id TEXT NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (user_id, session_id)
+) WITHOUT ROWID;
+"""
+
+_sqlite_seconds = get_metrics().histogram(
+    "sqlite_storage_duration_seconds", "Duración de las operaciones del backend SQLite", ["op"]
+)
+
+
+def _dumps(value: Any) -> str:
+    return json.dumps(value, separators=(",", ":"), default=str)
+
+
+class SqliteDatabase:
+    """Archivo SQLite en modo WAL con un pool acotado de conexiones"""
+
+    def __init__(self, path: str, pool_size: int = DEFAULT_POOL_SIZE):
+        if pool_size < 1:
+            raise ValueError("pool_size debe ser mayor que 0")
+        self.path = path
+        self.pool_size = pool_size
+        self._pool: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+        with self.connection() as conn:
+            conn.executescript(SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        # Sin transacciones implícitas: se abren explícitamente en `transaction`
+        conn = sqlite3.connect(
+            self.path,
+            timeout=30.0,
+            isolation_level=None,
+            check_same_thread=False,
+            cached_statements=256,
+        )
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    @contextlib.contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        """Presta una conexión del pool; la crea si aún no se llegó a `pool_size`"""
+        try:
+            conn = self._pool.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                create = self._created < self.pool_size
+                if create:
+                    self._created += 1
+            if not create:
+                conn = self._pool.get()
+            else:
+                try:
+                    conn = self._connect()
+                except BaseException:
+                    # Devolver el hueco: si no, el pool se queda con una conexión menos para siempre
+                    with self._lock:
+                        self._created -= 1
+                    raise
+        try:
+            yield conn
+        finally:
+            self._pool.put(conn)
+
+    @contextlib.contextmanager
+    def transaction(self, write: bool = False) -> Iterator[sqlite3.Connection]:
+        """Transacción de lectura (instantánea consistente) o de escritura exclusiva"""
+        with self.connection() as conn:
+            conn.execute("BEGIN IMMEDIATE" if write else "BEGIN")
+            try:
+                yield conn
+                conn.execute("COMMIT")
+            except BaseException:
+                # No devolver al pool una conexión con la transacción abierta
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                raise
+
+    def close(self) -> None:
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+@functools.cache
+def get_sqlite_database() -> SqliteDatabase:
+    """Devuelve la base de datos SQLite de la aplicación"""
+    return SqliteDatabase(
+        os.environ.get("SQLITE_STORAGE_PATH", DEFAULT_PATH),
+        pool_size=int(os.environ.get("SQLITE_POOL_SIZE", DEFAULT_POOL_SIZE)),
+    )
+
+
+def sqlite_enabled() -> bool:
+    """Indica si `STORAGE_BACKEND` selecciona este backend"""
+    return os.environ.get("STORAGE_BACKEND", "databutton").strip().lower() == "sqlite"
+
+
+class SqliteConversationStore(ConversationStore):
+    """Conversaciones como filas de `messages` indexadas por posición.
+
+    Con `encoding="compact"` el cuerpo de cada mensaje se guarda en binario
+    (`pack_message`); las filas en JSON y en binario se leen igual.
+    """
+
+    def __init__(self, database: SqliteDatabase, encoding: str = "json"):
+        if encoding not in ENCODINGS:
+            raise ValueError(f"encoding debe ser uno de {ENCODINGS}")
+        self.database = database
+        self.encoding = encoding
+
+    def _encode(self, message: Dict[str, Any], conversation_id: str) -> Any:
+        if self.encoding == "compact":
+            return pack_message(message, conversation_id)
+        return _dumps(message)
+
+    @staticmethod
+    def _decode(body: Any, conversation_id: str) -> Dict[str, Any]:
+        if isinstance(body, bytes):
+            return unpack_message(body, conversation_id)
+        return json.loads(body)
+
+    def append_many(
+        self,
+        conversation_id: str,
+        messages: List[Dict[str, Any]],
+        metadata: Optional[Dict[str, Any]] = None,
+    ) -> int:
+        with _sqlite_seconds.time("append"), self.database.transaction(write=True) as conn:
+            row = conn.execute(
+                "SELECT message_count, metadata FROM conversations WHERE conversation_id = ?",
+                (conversation_id,),
+            ).fetchone()
+            count, stored_metadata = (row[0], json.loads(row[1])) if row else (0, {})
+            conn.executemany(
+                "INSERT INTO messages (conversation_id, position, message_id, timestamp, body) VALUES (?, ?, ?, ?, ?)",
+                [
+                    (
+                        conversation_id,
+                        count + offset,
+                        message["message_id"],
+                        message["timestamp"],
+                        self._encode(message, conversation_id),
+                    )
+                    for offset, message in enumerate(messages)
+                ],
+            )
+            count += len(messages)
+            conn.execute(
+                "INSERT INTO conversations (conversation_id, message_count, metadata) VALUES (?, ?, ?)"
+                " ON CONFLICT(conversation_id) DO UPDATE SET"
+                " message_count = excluded.message_count, metadata = excluded.metadata",
+                (conversation_id, count, _dumps({**stored_metadata, **(metadata or {})})),
+            )
+        return count
+
+    def _resolve(self, conn: sqlite3.Connection, conversation_id: str, cursor: str, is_after: bool, count: int) -> int:
+        kind, value = parse_cursor(cursor)
+        if kind == "timestamp":
+            # Primera posición con timestamp >= (o > si es `after`) que el cursor
+            op = ">" if is_after else ">="
+            row = conn.execute(
+                f"SELECT position FROM messages WHERE conversation_id = ? AND timestamp {op} ?"
+                " ORDER BY timestamp, position LIMIT 1",
+                (conversation_id, value),
+            ).fetchone()
+            return count if row is None else row[0]
+        # Si un id se repite vale el más reciente, como en el almacén segmentado
+        row = conn.execute(
+            "SELECT MAX(position) FROM messages WHERE conversation_id = ? AND message_id = ?",
+            (conversation_id, value),
+        ).fetchone()
+        if row[0] is None:
+            raise CursorNotFoundError(value)
+        return row[0] + 1 if is_after else row[0]
+
+    def read_window(
+        self,
+        conversation_id: str,
+        limit: Optional[int] = None,
+        before: Optional[str] = None,
+        after: Optional[str] = None,
+    ) -> Optional[Dict[str, Any]]:
+        with _sqlite_seconds.time("read_window"), self.database.transaction() as conn:
+            row = conn.execute(
+                "SELECT message_count, metadata FROM conversations WHERE conversation_id = ?",
+                (conversation_id,),
+            ).fetchone()
+            if row is None:
+                return None
+            count, metadata = row[0], json.loads(row[1])
+
+            low = self._resolve(conn, conversation_id, after, True, count) if after else 0
+            high = self._resolve(conn, conversation_id, before, False, count) if before else count
+            high = max(low, high)
+            if limit is not None:
+                if after:
+                    high = min(high, low + limit)
+                else:
+                    low = max(low, high - limit)
+
+            rows = conn.execute(
+                "SELECT body FROM messages WHERE conversation_id = ? AND position >= ? AND position < ?"
+                " ORDER BY position",
+                (conversation_id, low, high),
+            ).fetchall()
+
+        return {
+            "conversation_id": conversation_id,
+            "messages": [self._decode(body, conversation_id) for body, in rows],
+            "metadata": metadata,
+            "total": count,
+            "has_more_before": low > 0,
+            "has_more_after": high < count,
+        }
+
+
+class SqliteInboxIndex(InboxIndex):
+    """Índice de bandejas como filas (agente, conversación) ordenadas por actividad"""
+
+    def __init__(self, database: SqliteDatabase):
+        self.database = database
+
+    def record_many(
+        self,
+        agent_id: str,
+        records: List[Tuple[str, Dict[str, Any], int]],
+    ) -> List[Dict[str, Any]]:
+        entries = []
+        with _sqlite_seconds.time("inbox_record"), self.database.transaction(write=True) as conn:
+            for conversation_id, message, position in records:
+                row = conn.execute(
+                    "SELECT entry FROM inbox WHERE agent_id = ? AND conversation_id = ?",
+                    (agent_id, conversation_id),
+                ).fetchone()
+                entry = make_inbox_entry(message, position, json.loads(row[0]) if row else None)
+                conn.execute(
+                    "INSERT INTO inbox (agent_id, conversation_id, last_timestamp, entry) VALUES (?, ?, ?, ?)"
+                    " ON CONFLICT(agent_id, conversation_id) DO UPDATE SET"
+                    " last_timestamp = excluded.last_timestamp, entry = excluded.entry",
+                    (agent_id, conversation_id, entry["last_timestamp"], _dumps(entry)),
+                )
+                entries.append(entry)
+        return entries
+
+    def list(self, agent_id: str) -> Dict[str, Dict[str, Any]]:
+        with self.database.connection() as conn:
+            rows = conn.execute("SELECT conversation_id, entry FROM inbox WHERE agent_id = ?", (agent_id,)).fetchall()
+        return {conversation_id: json.loads(entry) for conversation_id, entry in rows}
+
+    def list_page(
+        self,
+        agent_id: str,
+        limit: Optional[int] = None,
+        before: Optional[str] = None,
+        after: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        with _sqlite_seconds.time("inbox_page"), self.database.transaction() as conn:
+
+            def cursor_key(cursor: str, is_after: bool) -> Tuple[str, str]:
+                kind, value = parse_cursor(cursor)
+                if kind == "timestamp":
+                    return (value, "\uffff" if is_after else "")
+                row = conn.execute(
+                    "SELECT last_timestamp FROM inbox WHERE agent_id = ? AND conversation_id = ?",
+                    (agent_id, value),
+                ).fetchone()
+                if row is None:
+                    raise CursorNotFoundError(value)
+                return (row[0], value)
+
+            where = "agent_id = ?"
+            params: List[Any] = [agent_id]
+            if after:
+                where += " AND (last_timestamp, conversation_id) > (?, ?)"
+                params.extend(cursor_key(after, is_after=True))
+            if before:
+                where += " AND (last_timestamp, conversation_id) < (?, ?)"
+                params.extend(cursor_key(before, is_after=False))
+
+            total = conn.execute("SELECT COUNT(*) FROM inbox WHERE agent_id = ?", (agent_id,)).fetchone()[0]
+            # Con `after` se devuelven las conversaciones más cercanas al cursor
+            closest_after = bool(after and not before and limit is not None)
+            order = "ASC" if closest_after else "DESC"
+            rows = conn.execute(
+                f"SELECT conversation_id, entry FROM inbox WHERE {where}"
+                f" ORDER BY last_timestamp {order}, conversation_id {order} LIMIT ?",
+                [*params, -1 if limit is None else limit],
+            ).fetchall()
+            # Solo hace falta contar las que cumplen los cursores si la página se llenó
+            has_more = (
+                limit is not None
+                and len(rows) == limit
+                and conn.execute(f"SELECT COUNT(*) FROM inbox WHERE {where}", params).fetchone()[0] > limit
+            )
+
+        if closest_after:
+            rows.reverse()
+        return {
+            "conversations": {conversation_id: json.loads(entry) for conversation_id, entry in rows},
+            "total": total,
+            "has_more": has_more,
+            "next_cursor": ID_PREFIX + rows[-1][0] if rows else None,
+        }
+
+
+class SqliteSessionStore:
+    """Sesiones de usuario como filas; misma interfaz que `JsonSessionStore`"""
+
+    def __init__(self, database: SqliteDatabase):
+        self.database = database
+
+    def get(self, session_id: str, user_id: str) -> Dict[str, Any]:
+        """Obtiene una sesión de usuario o un diccionario vacío"""
+        with _sqlite_seconds.time("session_get"), self.database.connection() as conn:
+            row = conn.execute(
+                "SELECT data FROM sessions WHERE user_id = ? AND session_id = ?", (user_id, session_id)
+            ).fetchone()
+        return json.loads(row[0]) if row else {}
+
+    def put(self, session_id: str, user_id: str, data: Dict[str, Any]) -> Dict[str, Any]:
+        """Almacena o actualiza una sesión de usuario"""
+        with _sqlite_seconds.time("session_put"), self.database.transaction(write=True) as conn:
+            row = conn.execute(
+                "SELECT data FROM sessions WHERE user_id = ? AND session_id = ?", (user_id, session_id)
+            ).fetchone()
+            session = json.loads(row[0]) if row else {}
+            session.update(data)
+            session["last_updated"] = datetime.now(timezone.utc).isoformat()
+            conn.execute(
+                "INSERT INTO sessions (user_id, session_id, data) VALUES (?, ?, ?)"
+                " ON CONFLICT(user_id, session_id) DO UPDATE SET data = excluded.data",
+                (user_id, session_id, _dumps(session)),
+            )
+        return session
@@ -0,0 +1,54 @@
+"""Saving benchmark results and flagging regressions against a baseline.
+
+Each benchmark produces `{name: {metric: value}}`. With `--save-baseline` the
+results are written to a JSON file; with `--baseline` they are compared to a
+previous run and every tracked metric that got worse by more than
+`--threshold` (a fraction, default 0.2) is reported. The process exits with
+status 1 when there are regressions, so the benchmarks can gate a CI job.
+"""
+
+import argparse
+import json
+from pathlib import Path
+from typing import Dict, List
+
+Results = Dict[str, Dict[str, float]]
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--baseline", type=Path, help="compare against results saved earlier")
+    parser.add_argument("--save-baseline", type=Path, help="write these results as the new baseline")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed slowdown, e.g. 0.2 = 20%%")
+
+
+def compare(results: Results, baseline: Results, tracked: Dict[str, str], threshold: float) -> List[str]:
+    """Regressions of the `tracked` metrics ("lower" or "higher" is better)."""
+    regressions = []
+    for name, metrics in results.items():
+        for metric, better in tracked.items():
+            old = baseline.get(name, {}).get(metric)
+            new = metrics.get(metric)
+            if old is None or new is None or old <= 0:
+                continue
+            change = (new - old) / old if better == "lower" else (old - new) / old
+            if change > threshold:
+                regressions.append(f"{name} {metric}: {old:.2f} -> {new:.2f} ({change:+.0%} worse)")
+    return regressions
+
+
+def finish(args: argparse.Namespace, results: Results, tracked: Dict[str, str]) -> int:
+    """Save and/or compare the results as requested; returns the exit status."""
+    status = 0
+    if args.baseline is not None:
+        regressions = compare(results, json.loads(args.baseline.read_text()), tracked, args.threshold)
+        if regressions:
+            status = 1
+            print(f"\nREGRESSIONS (threshold {args.threshold:.0%}):")
+            for regression in regressions:
+                print(f"  {regression}")
+        else:
+            print(f"\nno regressions against {args.baseline} (threshold {args.threshold:.0%})")
+    if args.save_baseline is not None:
+        args.save_baseline.write_text(json.dumps(results, indent=2, sort_keys=True))
+        print(f"baseline saved to {args.save_baseline}")
+    return status
@@ -0,0 +1,56 @@
+"""Per-request cost of internal HS256 token verification, with and without
+the decoded-token cache in `decode_token`.
+
+"uncached" clears the cache before every call, so each request pays the full
+HMAC verification and claim parsing (the old behaviour); "cached" repeats the
+same token as a client with a long-lived session does.
+
+    python -m benchmarks.bench_auth --calls 50000
+"""
+
+import argparse
+import time
+
+from benchmarks.memory_storage import install
+
+
+def measure(fn, calls: int) -> float:
+    started = time.perf_counter()
+    for _ in range(calls):
+        fn()
+    return (time.perf_counter() - started) / calls
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--calls", type=int, default=50000)
+    args = parser.parse_args()
+
+    install()
+    from datetime import timedelta
+
+    from app.apis import auth
+    from app.libs.cache import TTLCache
+
+    token = auth.create_access_token({"sub": "bench", "email": "bench@example.com"}, timedelta(hours=1))
+
+    def uncached() -> None:
+        auth._token_cache.clear()
+        auth.decode_token(token)
+
+    def cached() -> None:
+        auth.decode_token(token)
+
+    results = {"uncached": measure(uncached, args.calls)}
+    auth._token_cache = TTLCache(max_size=auth._token_cache.max_size, ttl=auth.TOKEN_CACHE_TTL_SECONDS)
+    results["cached"] = measure(cached, args.calls)
+
+    print(f"{'mode':<10}{'us/call':>10}")
+    for mode, seconds in results.items():
+        print(f"{mode:<10}{seconds * 1e6:>10.2f}")
+    print(f"speedup   {results['uncached'] / results['cached']:>10.1f}x")
+    print(f"hit ratio {auth.token_cache_stats()['hit_ratio']:>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""Throughput of N concurrent senders appending to one A2A conversation.
+
+Compares the write strategies available in `app.libs`:
+
+- naive:      read-modify-write with no coordination (loses messages)
+- global:     one process-wide asyncio.Lock around every append
+- keyed:      KeyedBatcher, concurrent appends coalesced per conversation
+- optimistic: no lock, version/CAS retries in the storage layer
+
+Storage calls run in worker threads with a configurable latency so they
+overlap the way real network round-trips would.
+
+    python -m benchmarks.bench_concurrent_append --senders 50 --messages 20 --latency-ms 2
+"""
+
+import argparse
+import asyncio
+import time
+
+from benchmarks.memory_storage import install
+
+
+def make_message(sender: int, n: int) -> dict:
+    return {
+        "message_id": f"s{sender}-m{n}",
+        "conversation_id": "bench",
+        "timestamp": f"2025-01-01T00:00:00.{sender:03d}{n:03d}",
+        "from": {"agent_id": f"sender-{sender}", "agent_name": "Unknown Agent"},
+        "to": {"agent_id": "training", "agent_name": "Unknown Agent"},
+        "type": "text",
+        "content": {"text": "x" * 200},
+    }
+
+
+async def run_mode(mode: str, senders: int, messages: int, latency: float) -> dict:
+    storage = install(latency)
+    from app.libs.concurrency import KeyedBatcher
+    from app.libs.conversation_store import SegmentedConversationStore
+
+    store = SegmentedConversationStore(storage, optimistic=(mode == "optimistic"), max_retries=10_000)
+    global_lock = asyncio.Lock()
+
+    async def flush(conversation_id, items):
+        count = await asyncio.to_thread(store.append_many, conversation_id, items)
+        return [count] * len(items)
+
+    batcher = KeyedBatcher(flush)
+
+    async def append(message):
+        if mode == "keyed":
+            await batcher.submit("bench", message)
+        elif mode == "global":
+            async with global_lock:
+                await asyncio.to_thread(store.append, "bench", message)
+        else:
+            await asyncio.to_thread(store.append, "bench", message)
+
+    async def sender(i):
+        for n in range(messages):
+            await append(make_message(i, n))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(sender(i) for i in range(senders)))
+    elapsed = time.perf_counter() - started
+
+    expected = senders * messages
+    stored = len(store.load("bench")["messages"])
+    return {
+        "mode": mode,
+        "expected": expected,
+        "stored": stored,
+        "lost": expected - stored,
+        "seconds": elapsed,
+        "msgs_per_s": expected / elapsed,
+        "writes": storage.writes,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--senders", type=int, default=50)
+    parser.add_argument("--messages", type=int, default=20)
+    parser.add_argument("--latency-ms", type=float, default=2.0)
+    parser.add_argument("--modes", default="naive,global,keyed,optimistic")
+    args = parser.parse_args()
+
+    print(f"{'mode':<11}{'sent':>7}{'stored':>8}{'lost':>6}{'writes':>8}{'secs':>8}{'msg/s':>10}")
+    for mode in args.modes.split(","):
+        result = asyncio.run(run_mode(mode, args.senders, args.messages, args.latency_ms / 1000))
+        print(
+            f"{result['mode']:<11}{result['expected']:>7}{result['stored']:>8}{result['lost']:>6}"
+            f"{result['writes']:>8}{result['seconds']:>8.2f}{result['msgs_per_s']:>10.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
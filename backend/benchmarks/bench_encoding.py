@@ -0,0 +1,156 @@
+"""Stored size and serialization cost of A2A messages, full JSON vs compact.
+
+Builds realistic conversations through `format_message` (the same dicts
+`/a2a/send` stores): four agents, most without a name ("Unknown Agent"),
+texts of varying length, occasional metadata. For one segment of
+`--segment-size` messages it reports, per format:
+
+- bytes_per_message: serialized size of the segment divided by its messages
+- encode_us / decode_us: per message, to build and serialize the segment
+  document, and to parse and decode it back to message dicts
+- append_us / read_us: per call, `SegmentedConversationStore.append` and a
+  50-message `read_window` against a store that serializes every document
+  to JSON, as the blob storage does
+
+Formats: `json` (the full messages, the current default), `compact` (the
+`A2A_MESSAGE_ENCODING=compact` segment document, still JSON) and `packed`
+(the compact block through `pack`: msgpack, or orjson/json when msgpack is
+not installed).
+
+    python -m benchmarks.bench_encoding
+    python -m benchmarks.bench_encoding --save-baseline encoding.json
+"""
+
+import argparse
+import json
+import random
+import sys
+from typing import Any, Callable, Dict, List, Tuple
+
+from benchmarks.baseline import add_arguments, finish
+from benchmarks.bench_micro import bench
+from benchmarks.memory_storage import install
+
+AGENTS = [("training", None), ("nutrition", "Nutrición"), ("recovery", None), ("biometrics", None)]
+WORDS = "plan semana series repeticiones proteína descanso sueño frecuencia cardiaca hidratación objetivo fuerza".split()
+
+
+def conversation(conversation_id: str, size: int, seed: int = 1) -> List[Dict[str, Any]]:
+    from datetime import datetime, timedelta
+
+    from app.apis.a2a import A2AMessage, format_message
+
+    rng = random.Random(seed)
+    started = datetime(2025, 3, 1, 9, 0, 0)
+    messages = []
+    for n in range(size):
+        sender, recipient = rng.sample(AGENTS, 2)
+        body = {
+            "conversation_id": conversation_id,
+            "from_agent": {"agent_id": sender[0], "agent_name": sender[1]},
+            "to_agent": {"agent_id": recipient[0], "agent_name": recipient[1]},
+            "message_type": "text",
+            "content": {"text": " ".join(rng.choices(WORDS, k=rng.randint(5, 60)))},
+        }
+        if rng.random() < 0.2:
+            body["metadata"] = {"priority": rng.choice(["low", "normal", "high"])}
+        timestamp = (started + timedelta(seconds=n * 7, microseconds=rng.randint(0, 999_999))).isoformat()
+        messages.append(format_message(A2AMessage(**body), f"msg-{seed}-{n:05d}", conversation_id, timestamp))
+    return messages
+
+
+class SerializingStore(dict):
+    """Keeps every document as a JSON string, so reads and writes pay for serialization."""
+
+    def get(self, key, default=None):
+        if key not in self:
+            raise FileNotFoundError
+        return json.loads(super().get(key))
+
+    def put(self, key, value):
+        self[key] = json.dumps(value)
+
+
+def codecs(conversation_id: str) -> Dict[str, Tuple[Callable[[List[Dict[str, Any]]], Any], Callable[[Any], Any]]]:
+    from app.libs.message_codec import decode_messages, encode_messages, pack, unpack
+
+    return {
+        "json": (
+            lambda messages: json.dumps({"messages": messages}),
+            lambda raw: json.loads(raw)["messages"],
+        ),
+        "compact": (
+            lambda messages: json.dumps({"packed": encode_messages(messages, conversation_id)}),
+            lambda raw: decode_messages(json.loads(raw)["packed"]),
+        ),
+        "packed": (
+            lambda messages: pack(encode_messages(messages, conversation_id)),
+            lambda raw: decode_messages(unpack(raw)),
+        ),
+    }
+
+
+def run(args: argparse.Namespace) -> Dict[str, Dict[str, float]]:
+    from app.libs.conversation_store import SegmentedConversationStore
+
+    messages = conversation("bench-conversation", args.segment_size)
+    results = {}
+    for name, (encode, decode) in codecs("bench-conversation").items():
+        raw = encode(messages)
+        assert decode(raw) == messages, f"{name} does not round-trip"
+        size = len(raw.encode() if isinstance(raw, str) else raw)
+        results[name] = {
+            "bytes_per_message": size / len(messages),
+            "encode_us": bench(lambda: encode(messages), args.rounds, args.min_time)["median_us"] / len(messages),
+            "decode_us": bench(lambda: decode(raw), args.rounds, args.min_time)["median_us"] / len(messages),
+        }
+
+    for name in ("json", "compact"):
+        store = SegmentedConversationStore(SerializingStore(), segment_size=args.segment_size, encoding=name)
+        store.append_many("bench-conversation", messages[:-1])
+        last = messages[-1]
+
+        def append() -> None:
+            # Rewrites the same tail position, so every call appends to a full-size segment
+            store.storage.put(
+                store._manifest_key("bench-conversation"),
+                {**store._read_manifest("bench-conversation"), "message_count": len(messages) - 1},
+            )
+            store.append("bench-conversation", last)
+
+        results[name]["append_us"] = bench(append, args.rounds, args.min_time)["median_us"]
+        results[name]["read_us"] = bench(
+            lambda: store.read_window("bench-conversation", limit=50), args.rounds, args.min_time
+        )["median_us"]
+    return results
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--segment-size", type=int, default=100)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--min-time", type=float, default=0.05)
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    install()
+    from app.libs import message_codec
+
+    results = run(args)
+    backend = "msgpack" if message_codec.msgpack else "orjson" if message_codec.orjson else "json"
+    print(f"segment of {args.segment_size} messages; packed = compact block via {backend}\n")
+    print(f"{'format':<10}{'bytes/msg':>11}{'encode us':>11}{'decode us':>11}{'append us':>11}{'read us':>10}")
+    for name, r in results.items():
+        append = f"{r['append_us']:>11.1f}" if "append_us" in r else f"{'-':>11}"
+        read = f"{r['read_us']:>10.1f}" if "read_us" in r else f"{'-':>10}"
+        print(f"{name:<10}{r['bytes_per_message']:>11.1f}{r['encode_us']:>11.2f}{r['decode_us']:>11.2f}{append}{read}")
+
+    base = results["json"]["bytes_per_message"]
+    for name in ("compact", "packed"):
+        print(f"{name}: {1 - results[name]['bytes_per_message'] / base:.0%} fewer bytes than json")
+
+    return finish(args, results, {"bytes_per_message": "lower", "encode_us": "lower", "decode_us": "lower"})
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,144 @@
+"""Concurrent load against `/a2a/send` and `/orchestrator/query`, offline.
+
+Builds the real app with `create_app()` on top of the in-memory storage
+stand-in (with `--latency-ms` of simulated latency per storage call), runs
+its lifespan, and drives it in-process through httpx's ASGI transport with
+`--clients` concurrent clients, each sending requests back to back until
+`--requests` have been sent per scenario. Requests carry an internal HS256
+token, so the auth middleware runs as in production. `--storage sqlite`
+runs the same scenarios on the SQLite backend, in a temporary file.
+
+Reports throughput and latency percentiles per scenario; `--baseline`
+flags a drop in req/s or a rise in p95/p99.
+
+    python -m benchmarks.bench_load --clients 50 --requests 2000 --latency-ms 1
+    python -m benchmarks.bench_load --storage sqlite
+    python -m benchmarks.bench_load --save-baseline load.json
+    python -m benchmarks.bench_load --baseline load.json
+"""
+
+import argparse
+import asyncio
+import itertools
+import os
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict
+
+import httpx
+
+from benchmarks.baseline import add_arguments, finish
+from benchmarks.memory_storage import BACKEND_DIR, install
+
+AGENTS = ["training", "nutrition", "recovery", "biometrics"]
+QUERIES = [
+    "Necesito una rutina de pesas",
+    "Quiero mejorar mi dieta",
+    "Cómo recupero después de correr",
+    "hola",
+]
+
+
+def a2a_send(client: int, n: int) -> Dict[str, Any]:
+    return {
+        "conversation_id": f"bench-{client % 20}",
+        "from_agent": {"agent_id": AGENTS[client % len(AGENTS)]},
+        "to_agent": {"agent_id": AGENTS[(client + 1) % len(AGENTS)]},
+        "message_type": "text",
+        "content": {"text": f"mensaje {n} " + "x" * 200},
+    }
+
+
+def orchestrator_query(client: int, n: int) -> Dict[str, Any]:
+    return {"query": QUERIES[n % len(QUERIES)], "session_id": f"bench-session-{client}"}
+
+
+SCENARIOS: Dict[str, tuple[str, Callable[[int, int], Dict[str, Any]]]] = {
+    "a2a_send": ("/routes/a2a/send", a2a_send),
+    "orchestrator_query": ("/routes/orchestrator/query", orchestrator_query),
+}
+
+
+async def run_scenario(http: httpx.AsyncClient, path: str, body: Callable, clients: int, requests: int) -> Dict[str, float]:
+    from app.libs.async_storage import percentile
+
+    issued = itertools.count()
+    latencies = []
+    errors = 0
+
+    async def client(i: int) -> None:
+        nonlocal errors
+        while (n := next(issued)) < requests:
+            started = time.perf_counter()
+            response = await http.post(path, json=body(i, n))
+            latencies.append(time.perf_counter() - started)
+            if response.status_code != 200:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client(i) for i in range(clients)))
+    elapsed = time.perf_counter() - started
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "req_per_s": len(latencies) / elapsed,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+    }
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Dict[str, float]]:
+    install(args.latency_ms / 1000)
+    # The router middleware only accepts the backend's own HS256 tokens when
+    # enabled and signed with a non-default secret
+    os.environ["AUTH_ACCEPT_INTERNAL_TOKENS"] = "1"
+    sys.modules["databutton"].secrets.set("JWT_SECRET", "bench-secret")
+    if args.storage == "sqlite":
+        os.environ["STORAGE_BACKEND"] = "sqlite"
+        os.environ["SQLITE_STORAGE_PATH"] = os.path.join(tempfile.mkdtemp(prefix="bench-"), "bench.db")
+    # routers.json and routing.json are read relative to the backend directory
+    os.chdir(BACKEND_DIR)
+    from app.apis.auth import create_access_token
+    from main import create_app
+
+    app = create_app()
+    headers = {"Authorization": f"Bearer {create_access_token({'sub': 'bench'})}"}
+    transport = httpx.ASGITransport(app=app)
+
+    results = {}
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", headers=headers) as http:
+            for name in args.scenarios.split(","):
+                path, body = SCENARIOS[name]
+                # A short warm-up so imports and first-time allocations are not measured
+                await run_scenario(http, path, body, min(args.clients, 5), 20)
+                results[name] = await run_scenario(http, path, body, args.clients, args.requests)
+    return results
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--latency-ms", type=float, default=1.0)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--storage", choices=["memory", "sqlite"], default="memory")
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+
+    print(f"{'scenario':<20}{'reqs':>7}{'errors':>8}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+    for name, r in results.items():
+        print(
+            f"{name:<20}{r['requests']:>7}{r['errors']:>8}{r['req_per_s']:>9.0f}"
+            f"{r['p50_ms']:>9.1f}{r['p95_ms']:>9.1f}{r['p99_ms']:>9.1f}"
+        )
+
+    return finish(args, results, {"req_per_s": "higher", "p95_ms": "lower", "p99_ms": "lower"})
+
+
+if __name__ == "__main__":
+    sys.exit(main())
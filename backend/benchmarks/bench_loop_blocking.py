@@ -0,0 +1,83 @@
+"""Event-loop blocking with inline vs thread-offloaded storage calls.
+
+Runs N concurrent "requests", each doing a storage read and a write against
+the in-memory stand-in with a fixed latency, either calling the store
+directly from the coroutine (inline, the old behaviour) or through
+`run_blocking` (offload). Reports request latency percentiles and the event
+loop lag measured by `LoopLagMonitor`.
+
+    python -m benchmarks.bench_loop_blocking --requests 200 --concurrency 50 --latency-ms 5
+"""
+
+import argparse
+import asyncio
+import time
+
+from benchmarks.memory_storage import install
+
+
+async def run_mode(mode: str, requests: int, concurrency: int, latency: float) -> dict:
+    storage = install(latency)
+    from app.libs.async_storage import LoopLagMonitor, StorageExecutor, percentile
+
+    executor = StorageExecutor()
+    monitor = LoopLagMonitor(interval=0.005, warn_threshold=float("inf"))
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    def handle(i: int) -> None:
+        try:
+            session = storage.get(f"session_{i % 20}")
+        except FileNotFoundError:
+            session = {}
+        session["last_query"] = i
+        storage.put(f"session_{i % 20}", session)
+
+    async def request(i: int, issued: float) -> None:
+        # Latency counts from arrival, including time spent waiting for the loop
+        async with semaphore:
+            if mode == "inline":
+                handle(i)
+            else:
+                await executor.run(handle, i)
+            latencies.append(time.perf_counter() - issued)
+
+    monitor.start()
+    await asyncio.sleep(0)
+    started = time.perf_counter()
+    await asyncio.gather(*(request(i, time.perf_counter()) for i in range(requests)))
+    elapsed = time.perf_counter() - started
+    # Give the monitor a chance to record the final stall
+    await asyncio.sleep(monitor.interval * 2)
+    await monitor.stop()
+    executor.shutdown()
+
+    lag = monitor.stats()
+    return {
+        "mode": mode,
+        "req_per_s": requests / elapsed,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "lag_p99_ms": lag["lag_p99"] * 1000,
+        "lag_max_ms": lag["lag_max"] * 1000,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--latency-ms", type=float, default=5.0)
+    args = parser.parse_args()
+
+    print(f"{'mode':<9}{'req/s':>9}{'p50 ms':>9}{'p99 ms':>9}{'lag p99':>9}{'lag max':>9}")
+    for mode in ("inline", "offload"):
+        r = asyncio.run(run_mode(mode, args.requests, args.concurrency, args.latency_ms / 1000))
+        print(
+            f"{r['mode']:<9}{r['req_per_s']:>9.0f}{r['p50_ms']:>9.1f}{r['p99_ms']:>9.1f}"
+            f"{r['lag_p99_ms']:>9.1f}{r['lag_max_ms']:>9.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""Microbenchmarks of the per-request hot paths.
+
+Like pytest-benchmark, each benchmark is calibrated to run for roughly
+`--min-time` seconds per round and repeated for `--rounds` rounds; the table
+shows the fastest and the median round in microseconds per call. The median
+is what `--baseline` compares.
+
+- route_query_to_agent: keyword routing of a query with session context
+- decode_token_cached / decode_token_uncached: internal HS256 verification
+  with and without the decoded-token cache
+- sanitize_key: storage key sanitization
+- send_message_serialization: request body -> A2AMessage -> stored A2A
+  message dict -> JSON response, as `/a2a/send` does around its storage calls
+
+    python -m benchmarks.bench_micro --save-baseline micro.json
+    python -m benchmarks.bench_micro --baseline micro.json --threshold 0.2
+"""
+
+import argparse
+import json
+import statistics
+import sys
+import time
+from typing import Callable, Dict
+
+from benchmarks.baseline import add_arguments, finish
+from benchmarks.memory_storage import install
+
+
+def calibrate(fn: Callable[[], object], min_time: float) -> int:
+    """Number of calls that takes at least `min_time` seconds."""
+    calls = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(calls):
+            fn()
+        if time.perf_counter() - started >= min_time:
+            return calls
+        calls *= 2
+
+
+def bench(fn: Callable[[], object], rounds: int, min_time: float) -> Dict[str, float]:
+    calls = calibrate(fn, min_time)
+    per_call = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        for _ in range(calls):
+            fn()
+        per_call.append((time.perf_counter() - started) / calls)
+    return {
+        "calls": calls,
+        "min_us": min(per_call) * 1e6,
+        "median_us": statistics.median(per_call) * 1e6,
+    }
+
+
+def benchmarks() -> Dict[str, Callable[[], object]]:
+    from datetime import datetime, timedelta
+
+    from app.apis import auth
+    from app.apis.a2a import A2AMessage, A2AResponse, _sanitize_key, format_message
+    from app.apis.orchestrator import route_query_to_agent
+
+    token = auth.create_access_token({"sub": "bench", "email": "bench@example.com"}, timedelta(hours=1))
+    context = {"last_agent": "nutrition", "last_query": "dieta"}
+    body = json.dumps({
+        "conversation_id": "bench-conversation",
+        "from_agent": {"agent_id": "training", "agent_name": "Training"},
+        "to_agent": {"agent_id": "nutrition"},
+        "message_type": "text",
+        "content": {"text": "Plan semanal con " + "x" * 200},
+        "metadata": {"priority": "normal"},
+    })
+
+    def decode_uncached() -> None:
+        auth._token_cache.clear()
+        auth.decode_token(token)
+
+    def send_message_serialization() -> str:
+        message = A2AMessage.model_validate_json(body)
+        timestamp = datetime.utcnow().isoformat()
+        stored = format_message(message, "m1", message.conversation_id, timestamp)
+        json.dumps(stored)
+        return A2AResponse(
+            message_id=stored["message_id"],
+            conversation_id=stored["conversation_id"],
+            timestamp=timestamp,
+            status="success",
+            message="Mensaje enviado correctamente",
+        ).model_dump_json()
+
+    return {
+        "route_query_to_agent": lambda: route_query_to_agent("Necesito una rutina de pesas para ganar fuerza", context),
+        "decode_token_cached": lambda: auth.decode_token(token),
+        "decode_token_uncached": decode_uncached,
+        "sanitize_key": lambda: _sanitize_key("conversation_3f2a9c1e-7b4d-4e8a-9c2f-1a2b3c4d5e6f"),
+        "send_message_serialization": send_message_serialization,
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rounds", type=int, default=7)
+    parser.add_argument("--min-time", type=float, default=0.05)
+    parser.add_argument("--only", help="comma-separated benchmark names")
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    install()
+    selected = benchmarks()
+    if args.only:
+        selected = {name: selected[name] for name in args.only.split(",")}
+
+    results = {}
+    print(f"{'benchmark':<30}{'calls':>9}{'min us':>10}{'median us':>11}")
+    for name, fn in selected.items():
+        results[name] = r = bench(fn, args.rounds, args.min_time)
+        print(f"{name:<30}{r['calls']:>9}{r['min_us']:>10.2f}{r['median_us']:>11.2f}")
+
+    return finish(args, results, {"median_us": "lower"})
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,80 @@
+"""In-memory stand-in for `db.storage.json` used by the benchmarks.
+
+Every operation can be slowed down with a fixed latency (in seconds) to mimic
+a remote blob store, and the store offers an atomic `compare_and_put` so the
+optimistic write mode can be measured as a backend with native CAS would
+behave.
+"""
+
+import copy
+import sys
+import threading
+import time
+import types
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+
+class LatencyJsonStore:
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self._data = {}
+        self._lock = threading.Lock()
+        self.reads = 0
+        self.writes = 0
+        self.bytes_written = 0
+
+    def _wait(self) -> None:
+        if self.latency:
+            time.sleep(self.latency)
+
+    def get(self, key, default=None):
+        self._wait()
+        with self._lock:
+            self.reads += 1
+            if key not in self._data:
+                raise FileNotFoundError(key)
+            return copy.deepcopy(self._data[key])
+
+    def put(self, key, value):
+        self._wait()
+        with self._lock:
+            self.writes += 1
+            self.bytes_written += len(repr(value))
+            self._data[key] = copy.deepcopy(value)
+
+    def compare_and_put(self, key, value, expected_version):
+        self._wait()
+        with self._lock:
+            current = self._data.get(key) or {}
+            if current.get("version", 0) != expected_version:
+                return False
+            self.writes += 1
+            self.bytes_written += len(repr(value))
+            self._data[key] = copy.deepcopy(value)
+            return True
+
+
+class Secrets(dict):
+    def get(self, key, default=None):
+        return super().get(key, default)
+
+    def set(self, key, value):
+        self[key] = value
+
+
+def install(latency: float = 0.0) -> LatencyJsonStore:
+    """Make `import databutton` resolve to an in-memory stand-in and the
+    backend packages importable; returns the JSON store."""
+    for path in (str(BACKEND_DIR),):
+        if path not in sys.path:
+            sys.path.insert(0, path)
+
+    store = LatencyJsonStore(latency)
+    module = sys.modules.get("databutton")
+    if module is None or not isinstance(getattr(module, "storage", None), types.SimpleNamespace):
+        module = types.SimpleNamespace(secrets=Secrets(), storage=types.SimpleNamespace())
+        sys.modules["databutton"] = module
+    module.storage.json = store
+    return store
@@ -0,0 +1,39 @@
+"""Deferred imports for modules that are slow to import but not needed to build the app.
+
+`lazy_import("jwt")` returns the module object right away and registers it
+in `sys.modules`, but only executes the module the first time one of its
+attributes is used. After that it is the ordinary module, so there is no
+per-call overhead, and `import jwt` elsewhere returns the same object.
+
+Usage:
+
+    from databutton_app.lazy import lazy_import
+
+    jwt = lazy_import("jwt")
+
+    def decode(token):
+        return jwt.decode(token, ...)  # jwt is imported here, on first use
+"""
+
+import importlib.util
+import sys
+from types import ModuleType
+
+
+def lazy_import(name: str) -> ModuleType:
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+
+    spec = importlib.util.find_spec(name)
+    if spec is None or spec.loader is None:
+        raise ModuleNotFoundError(f"No module named '{name}'", name=name)
+    spec.loader = importlib.util.LazyLoader(spec.loader)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    parent, _, child = name.rpartition(".")
+    if parent:
+        # What a regular import does: make the submodule an attribute of its package
+        setattr(sys.modules[parent], child, module)
+    return module
@@ -0,0 +1,136 @@
+"""Structured, queue-backed logging for the request path.
+
+Log calls only format a record and put it on a bounded in-memory queue; a
+background listener thread writes the records to stderr as one JSON object
+per line. Request handlers therefore never block on stdout, and when the
+queue is full records are dropped (and counted) instead of stalling the
+caller.
+
+High-volume success messages go through a `Sampler`, which lets one in
+every N calls through. Counters, not log lines, are the source of truth for
+how often something happened.
+
+Configuration (environment):
+
+    LOG_LEVEL          minimum level, default INFO
+    LOG_QUEUE_SIZE     records buffered before dropping, default 10000
+
+Usage:
+
+    from databutton_app.logs import Sampler, get_logger
+
+    log = get_logger(__name__)
+    _sampler = Sampler(0.01)
+
+    if _sampler.sample():
+        log.info("user authenticated", extra={"sub": user.sub})
+"""
+
+import atexit
+import itertools
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+
+ROOT_LOGGER = "nexusforge"
+DEFAULT_QUEUE_SIZE = 10000
+
+# Attributes every LogRecord has; anything else came in through `extra`
+_RECORD_ATTRS = frozenset(logging.makeLogRecord({}).__dict__) | {"message", "asctime"}
+
+_lock = threading.Lock()
+_listener: logging.handlers.QueueListener | None = None
+_handler: "DroppingQueueHandler | None" = None
+
+
+class StructuredFormatter(logging.Formatter):
+    """One JSON object per record, including the fields passed via `extra`."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """Queue handler that never blocks: records are dropped when the queue is full."""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class Sampler:
+    """Lets one in every `1 / rate` calls through; cheap enough for the hot path."""
+
+    def __init__(self, rate: float):
+        self.every = max(1, round(1 / rate)) if rate > 0 else 0
+        self._counter = itertools.count()
+
+    def sample(self) -> bool:
+        if not self.every:
+            return False
+        return next(self._counter) % self.every == 0
+
+
+def configure_logging(stream=None) -> logging.Logger:
+    """Install the queue handler and start the writer thread (idempotent)."""
+    global _listener, _handler
+    root = logging.getLogger(ROOT_LOGGER)
+    with _lock:
+        if _listener is not None:
+            return root
+
+        output = logging.StreamHandler(stream or sys.stderr)
+        output.setFormatter(StructuredFormatter())
+        log_queue = queue.Queue(maxsize=int(os.environ.get("LOG_QUEUE_SIZE", DEFAULT_QUEUE_SIZE)))
+
+        _handler = DroppingQueueHandler(log_queue)
+        _listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=True)
+        _listener.start()
+
+        root.addHandler(_handler)
+        root.setLevel(os.environ.get("LOG_LEVEL", "INFO").upper())
+        root.propagate = False
+    atexit.register(shutdown_logging)
+    return root
+
+
+def shutdown_logging() -> None:
+    """Flush the queued records and stop the writer thread."""
+    global _listener, _handler
+    with _lock:
+        if _listener is None:
+            return
+        _listener.stop()
+        logging.getLogger(ROOT_LOGGER).removeHandler(_handler)
+        _listener = None
+        _handler = None
+
+
+def get_logger(name: str) -> logging.Logger:
+    """Logger under the application root, so it uses the queue handler."""
+    return logging.getLogger(f"{ROOT_LOGGER}.{name}")
+
+
+def dropped_records() -> int:
+    return _handler.dropped if _handler is not None else 0
@@ -1,13 +1,55 @@
 import functools
+import os
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass
 from http import HTTPStatus
-from typing import Annotated, Callable
-import jwt
+from typing import Annotated, Any, Callable
 from fastapi import Depends, HTTPException, WebSocket, WebSocketException, status
 from fastapi.requests import HTTPConnection
-from jwt import PyJWKClient
 from pydantic import BaseModel
 from starlette.requests import Request
 
+from databutton_app.lazy import lazy_import
+from databutton_app.logs import Sampler, get_logger
+from databutton_app.mw.jwks import JWKSManager
+
+jwt = lazy_import("jwt")
+
+log = get_logger("auth")
+
+# WebSocket clients send the token as the subprotocol `Authorization.Bearer.<token>`
+WS_BEARER_PREFIX = "Authorization.Bearer."
+
+# Successful authentications are logged 1 in 1/rate; the counters below count them all
+_success_sampler = Sampler(float(os.environ.get("AUTH_LOG_SAMPLE_RATE", 0.01)))
+
+# Outcome of every authentication attempt, exported as metrics
+_auth_outcomes: Counter = Counter()
+_auth_outcomes_lock = threading.Lock()
+
+
+# Called with (outcome, seconds) after every authentication, e.g. to export latency metrics
+_auth_observers: list[Callable[[str, float], None]] = []
+
+
+def register_auth_observer(observe: Callable[[str, float], None]) -> None:
+    _auth_observers.append(observe)
+
+
+def record_auth_outcome(outcome: str, seconds: float = 0.0) -> None:
+    with _auth_outcomes_lock:
+        _auth_outcomes[outcome] += 1
+    for observe in _auth_observers:
+        observe(outcome, seconds)
+
+
+def auth_outcome_counts() -> dict[str, int]:
+    """Authentications by outcome: authenticated, reused, missing_token, rejected."""
+    with _auth_outcomes_lock:
+        return dict(_auth_outcomes)
+
 
 class AuthConfig(BaseModel):
     jwks_url: str
@@ -26,6 +68,35 @@ class User(BaseModel):
     email: str | None = None
 
 
+@dataclass(frozen=True)
+class Principal:
+    """The authenticated caller, resolved once per request and kept on `request.state`."""
+
+    # Token algorithm that authenticated the caller, e.g. "RS256" or "HS256"
+    scheme: str
+    claims: dict[str, Any]
+    user: User
+
+
+# Extra token verifiers by JWT algorithm, e.g. the backend's own HS256 tokens.
+# A verifier returns the verified claims or raises.
+_token_verifiers: dict[str, Callable[[str], dict[str, Any]]] = {}
+
+
+def register_token_verifier(alg: str, verify: Callable[[str], dict[str, Any]]) -> None:
+    _token_verifiers[alg] = verify
+
+
+def get_principal(request: HTTPConnection) -> Principal | None:
+    """Principal already resolved for this request, if any."""
+    return getattr(request.state, "principal", None)
+
+
+def set_principal(request: HTTPConnection, principal: Principal) -> Principal:
+    request.state.principal = principal
+    return principal
+
+
 def get_auth_config(request: HTTPConnection) -> AuthConfig:
     auth_config: AuthConfig | None = request.app.state.auth_config
 
@@ -49,21 +120,25 @@ AuditLogDep = Annotated[Callable[[str], None] | None, Depends(get_audit_log)]
 def get_authorized_user(
     request: HTTPConnection,
 ) -> User:
-    auth_config = get_auth_config(request)
+    # Resolved earlier in this request (by another dependency): no second verification
+    principal = get_principal(request)
+    if principal is not None:
+        record_auth_outcome("reused")
+        return principal.user
 
+    started = time.perf_counter()
     try:
-        if isinstance(request, WebSocket):
-            user = authorize_websocket(request, auth_config)
-        elif isinstance(request, Request):
-            user = authorize_request(request, auth_config)
-        else:
-            raise ValueError("Unexpected request type")
-
-        if user is not None:
-            return user
-        print("Request authentication returned no user")
+        principal = resolve_principal(request)
+        if principal is not None:
+            record_auth_outcome("authenticated", time.perf_counter() - started)
+            if _success_sampler.sample():
+                log.info("user authenticated", extra={"sub": principal.user.sub, "scheme": principal.scheme})
+            return set_principal(request, principal).user
+        record_auth_outcome("missing_token", time.perf_counter() - started)
+        log.debug("request authentication returned no user")
     except Exception as e:
-        print(f"Request authentication failed: {e}")
+        record_auth_outcome("rejected", time.perf_counter() - started)
+        log.info("request authentication failed", extra={"error": str(e)})
 
     if isinstance(request, WebSocket):
         raise WebSocketException(
@@ -76,29 +151,50 @@ def get_authorized_user(
 
 
 @functools.cache
-def get_jwks_client(url: str):
-    """Reuse client cached by its url, client caches keys by default."""
-    return PyJWKClient(url, cache_keys=True)
+def get_jwks_manager(url: str) -> JWKSManager:
+    """Key set cached by its url; started from the app lifespan to prefetch and refresh keys."""
+    return JWKSManager(url)
 
 
 def get_signing_key(url: str, token: str) -> tuple[str, str]:
-    client = get_jwks_client(url)
-    signing_key = client.get_signing_key_from_jwt(token)
-    key = signing_key.key
-    alg = signing_key.algorithm_name
+    key, alg = get_jwks_manager(url).get_signing_key_from_jwt(token)
     if alg != "RS256":
         raise ValueError(f"Unsupported signing algorithm: {alg}")
     return (key, alg)
 
 
-def authorize_websocket(
-    request: WebSocket,
-    auth_config: AuthConfig,
-) -> User | None:
+def resolve_principal(request: HTTPConnection) -> Principal | None:
+    """Verify the request's bearer token once with the scheme its algorithm names."""
+    auth_config: AuthConfig | None = request.app.state.auth_config
+    if isinstance(request, WebSocket):
+        token = get_websocket_token(request)
+    elif isinstance(request, Request):
+        header = auth_config.header if auth_config is not None else "authorization"
+        token = get_bearer_token(request, header)
+    else:
+        raise ValueError("Unexpected request type")
+
+    if not token:
+        return None
+
+    alg = jwt.get_unverified_header(token).get("alg")
+    verify = _token_verifiers.get(alg)
+    if verify is not None:
+        claims = verify(token)
+    else:
+        claims = verify_token(token, get_auth_config(request))
+    if claims is None:
+        return None
+
+    user = User.model_validate(claims)
+    return Principal(scheme=alg, claims=claims, user=user)
+
+
+def get_websocket_token(request: WebSocket) -> str | None:
     # Parse Sec-Websocket-Protocol
     header = "Sec-Websocket-Protocol"
     sep = ","
-    prefix = "Authorization.Bearer."
+    prefix = WS_BEARER_PREFIX
     protocols_header = request.headers.get(header)
     protocols = (
         [h.strip() for h in protocols_header.split(sep)] if protocols_header else []
@@ -111,33 +207,62 @@ def authorize_websocket(
             break
 
     if not token:
-        print(f"Missing bearer {prefix}.<token> in protocols")
+        log.debug("missing bearer %s<token> in protocols", prefix)
         return None
 
-    return authorize_token(token, auth_config)
+    return token
 
 
-def authorize_request(
-    request: Request,
-    auth_config: AuthConfig,
-) -> User | None:
-    auth_header = request.headers.get(auth_config.header)
+def get_bearer_token(request: Request, header: str) -> str | None:
+    auth_header = request.headers.get(header)
     if not auth_header:
-        print(f"Missing header '{auth_config.header}'")
+        log.debug("missing header '%s'", header)
         return None
 
     token = auth_header.startswith("Bearer ") and auth_header[7:]
     if not token:
-        print(f"Missing bearer token in '{auth_config.header}'")
+        log.debug("missing bearer token in '%s'", header)
         return None
 
-    return authorize_token(token, auth_config)
+    return token
+
+
+def authorize_websocket(
+    request: WebSocket,
+    auth_config: AuthConfig,
+) -> User | None:
+    token = get_websocket_token(request)
+    return authorize_token(token, auth_config) if token else None
+
+
+def authorize_request(
+    request: Request,
+    auth_config: AuthConfig,
+) -> User | None:
+    token = get_bearer_token(request, auth_config.header)
+    return authorize_token(token, auth_config) if token else None
 
 
 def authorize_token(
     token: str,
     auth_config: AuthConfig,
 ) -> User | None:
+    payload = verify_token(token, auth_config)
+
+    try:
+        user = User.model_validate(payload)
+        if _success_sampler.sample():
+            log.info("user authenticated", extra={"sub": user.sub})
+        return user
+    except Exception as e:
+        log.info("failed to parse token payload", extra={"error": str(e)})
+        return None
+
+
+def verify_token(
+    token: str,
+    auth_config: AuthConfig,
+) -> dict[str, Any] | None:
     # Audience and jwks url to get signing key from based on the users config
     jwks_urls = [(auth_config.audience, auth_config.jwks_url)]
 
@@ -146,7 +271,7 @@ def authorize_token(
         try:
             key, alg = get_signing_key(jwks_url, token)
         except Exception as e:
-            print(f"Failed to get signing key {e}")
+            log.info("failed to get signing key", extra={"error": str(e)})
             continue
 
         try:
@@ -157,13 +282,7 @@ def authorize_token(
                 audience=audience,
             )
         except jwt.PyJWTError as e:
-            print(f"Failed to decode and validate token {e}")
+            log.info("failed to decode and validate token", extra={"error": str(e)})
             continue
 
-    try:
-        user = User.model_validate(payload)
-        print(f"User {user.sub} authenticated")
-        return user
-    except Exception as e:
-        print(f"Failed to parse token payload {e}")
-        return None
+    return payload
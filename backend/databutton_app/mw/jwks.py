@@ -0,0 +1,159 @@
+"""In-memory JWKS key set with background refresh.
+
+Signing keys are fetched once at startup and refreshed in the background
+before they expire (the response's Cache-Control max-age, or
+`refresh_interval`), so request handling only does a dict lookup by `kid`.
+A token with an unknown `kid` (key rotation) triggers a single-flight
+refresh: concurrent requests wait for the same fetch instead of each
+issuing their own, and misses are rate limited by `min_refresh_interval`.
+A failed refresh keeps serving the previous keys.
+"""
+
+import asyncio
+import json
+import re
+import threading
+import time
+from typing import Any, Callable
+
+from databutton_app.lazy import lazy_import
+from databutton_app.logs import get_logger
+
+jwt = lazy_import("jwt")
+
+log = get_logger("jwks")
+
+FetchFn = Callable[[str, float], tuple[dict[str, Any], float | None]]
+
+
+def fetch_jwks(url: str, timeout: float) -> tuple[dict[str, Any], float | None]:
+    """Fetch a JWKS document; returns it with its max-age in seconds, if any."""
+    import urllib.request  # Only needed when refreshing, off the startup path
+
+    with urllib.request.urlopen(url, timeout=timeout) as response:
+        document = json.loads(response.read())
+        match = re.search(r"max-age=(\d+)", response.headers.get("Cache-Control", ""))
+    return document, float(match.group(1)) if match else None
+
+
+class UnknownKeyError(KeyError):
+    pass
+
+
+class JWKSManager:
+    def __init__(
+        self,
+        url: str,
+        refresh_interval: float = 3600.0,
+        min_refresh_interval: float = 30.0,
+        retry_interval: float = 30.0,
+        timeout: float = 5.0,
+        fetch: FetchFn = fetch_jwks,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.url = url
+        self.refresh_interval = refresh_interval
+        self.min_refresh_interval = min_refresh_interval
+        self.retry_interval = retry_interval
+        self.timeout = timeout
+        self._fetch = fetch
+        self._clock = clock
+        self._keys: dict[str, tuple[Any, str]] = {}
+        self._max_age: float | None = None
+        self._fetched_at: float | None = None
+        self._attempted_at: float | None = None
+        self._generation = 0
+        self._lock = threading.Lock()
+        self._task: asyncio.Task | None = None
+        self.fetches = 0
+        self.fetch_errors = 0
+
+    @property
+    def kids(self) -> list[str]:
+        return list(self._keys)
+
+    def _load(self) -> None:
+        document, max_age = self._fetch(self.url, self.timeout)
+        keys = {}
+        for data in document.get("keys", []):
+            try:
+                jwk = jwt.PyJWK(data)
+            except jwt.PyJWKError as e:
+                log.warning("skipping unusable JWK", extra={"kid": data.get("kid"), "error": str(e)})
+                continue
+            keys[jwk.key_id] = (jwk.key, jwk.algorithm_name)
+        # Swap the whole dict at once: readers never see a half-built key set
+        self._keys = keys
+        self._max_age = max_age
+        self._fetched_at = self._clock()
+        self._generation += 1
+        self.fetches += 1
+
+    def refresh(self, force: bool = True, generation: int | None = None) -> bool:
+        """Fetch the key set. Concurrent callers share one fetch; returns True on success.
+
+        `generation` is the key set version the caller looked at; if it has
+        changed by the time the lock is held, that newer set is used instead.
+        """
+        if generation is None:
+            generation = self._generation
+        with self._lock:
+            if self._generation != generation:
+                # Someone else refreshed while we waited for the lock
+                return True
+            if (
+                not force
+                and self._attempted_at is not None
+                and self._clock() - self._attempted_at < self.min_refresh_interval
+            ):
+                # Rate limit refreshes triggered by unknown kids (including failed ones)
+                return False
+            self._attempted_at = self._clock()
+            try:
+                self._load()
+                return True
+            except Exception as e:
+                self.fetch_errors += 1
+                log.warning("failed to refresh JWKS", extra={"url": self.url, "error": str(e)})
+                return False
+
+    def get_signing_key(self, kid: str | None) -> tuple[Any, str]:
+        """Key and algorithm for `kid`, refreshing once if the kid is unknown."""
+        generation = self._generation
+        entry = self._keys.get(kid)
+        if entry is None:
+            self.refresh(force=False, generation=generation)
+            entry = self._keys.get(kid)
+        if entry is None:
+            raise UnknownKeyError(kid)
+        return entry
+
+    def get_signing_key_from_jwt(self, token: str) -> tuple[Any, str]:
+        return self.get_signing_key(jwt.get_unverified_header(token).get("kid"))
+
+    def next_refresh_delay(self) -> float:
+        """Seconds until the key set should be refreshed, ahead of its expiry."""
+        if self._fetched_at is None:
+            return self.retry_interval
+        ttl = self._max_age if self._max_age is not None else self.refresh_interval
+        elapsed = self._clock() - self._fetched_at
+        return max(ttl * 0.8 - elapsed, self.min_refresh_interval)
+
+    async def _refresh_loop(self) -> None:
+        while True:
+            ok = await asyncio.to_thread(self.refresh)
+            await asyncio.sleep(self.next_refresh_delay() if ok else self.retry_interval)
+
+    def start(self) -> None:
+        """Prefetch (in the background) and keep the key set fresh."""
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._refresh_loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
@@ -0,0 +1,75 @@
+"""Precomputed list of the API routers to mount, generated from `routers.json`.
+
+Building the app used to glob `app/apis/*/__init__.py`, import every match
+(in filesystem order) and then look each one up in `routers.json`. The
+manifest records the result once: the API modules that exist, in a fixed
+order, and whether each one requires authentication. It also stores the
+hash of the `routers.json` it was generated from; if `routers.json` changes
+and the manifest is not regenerated, the app builds the list from
+`routers.json` at startup instead and logs a warning.
+
+Regenerate after adding an API or editing `routers.json`:
+
+    python -m databutton_app.router_manifest
+"""
+
+import hashlib
+import json
+from pathlib import Path
+from typing import Any
+
+from databutton_app.logs import get_logger
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+ROUTERS_PATH = BACKEND_DIR / "routers.json"
+MANIFEST_PATH = BACKEND_DIR / "router_manifest.json"
+APIS_PATH = BACKEND_DIR / "app" / "apis"
+API_MODULE_PREFIX = "app.apis."
+
+log = get_logger("router_manifest")
+
+
+def build_manifest(routers_path: Path = ROUTERS_PATH, apis_path: Path = APIS_PATH) -> dict[str, Any]:
+    content = routers_path.read_bytes()
+    config = json.loads(content)
+    routers = [
+        {
+            "name": name,
+            "module": API_MODULE_PREFIX + name,
+            "auth": not config["routers"][name]["disableAuth"],
+        }
+        for name in sorted(config["routers"])
+        if (apis_path / name / "__init__.py").exists()
+    ]
+    return {"source_sha256": hashlib.sha256(content).hexdigest(), "routers": routers}
+
+
+def load_manifest(manifest_path: Path = MANIFEST_PATH, routers_path: Path = ROUTERS_PATH) -> list[dict[str, Any]]:
+    """Routers to mount: the saved manifest if it matches `routers.json`, else built now."""
+    try:
+        content = routers_path.read_bytes()
+    except FileNotFoundError:
+        content = None
+    try:
+        manifest = json.loads(manifest_path.read_text())
+    except (FileNotFoundError, ValueError):
+        manifest = None
+
+    if manifest is not None and (content is None or manifest["source_sha256"] == hashlib.sha256(content).hexdigest()):
+        return manifest["routers"]
+    if content is None:
+        log.warning("no routers.json and no router manifest, no APIs will be mounted")
+        return []
+    log.warning("router manifest missing or stale, building it from routers.json")
+    return build_manifest(routers_path)["routers"]
+
+
+def write_manifest(manifest_path: Path = MANIFEST_PATH, routers_path: Path = ROUTERS_PATH) -> dict[str, Any]:
+    manifest = build_manifest(routers_path)
+    manifest_path.write_text(json.dumps(manifest, indent=2) + "\n")
+    return manifest
+
+
+if __name__ == "__main__":
+    manifest = write_manifest()
+    print(f"Wrote {MANIFEST_PATH.name} with {len(manifest['routers'])} routers")
@@ -1,64 +1,56 @@
+import time
+
+# Measured from here: the startup report covers the imports below
+_IMPORT_STARTED = time.perf_counter()
+
+import importlib
+import logging
 import os
-import pathlib
 import json
+from contextlib import asynccontextmanager
 import dotenv
-from fastapi import FastAPI, APIRouter, Depends
+from fastapi import FastAPI, APIRouter, Depends, Response
 
 dotenv.load_dotenv()
 
-from databutton_app.mw.auth_mw import AuthConfig, get_authorized_user
-
+from databutton_app.logs import configure_logging, dropped_records, get_logger
+from databutton_app.mw.auth_mw import AuthConfig, get_authorized_user, get_jwks_manager
+from databutton_app.router_manifest import load_manifest
+from app.libs.async_storage import get_loop_monitor, get_storage_executor
+from app.libs.lifecycle import run_shutdown, run_startup
+from app.libs.metrics import CONTENT_TYPE, MetricsMiddleware, get_metrics
 
-def get_router_config() -> dict:
-    try:
-        # Note: This file is not available to the agent
-        cfg = json.loads(open("routers.json").read())
-    except:
-        return False
-    return cfg
+log = get_logger("main")
 
+_IMPORT_SECONDS = time.perf_counter() - _IMPORT_STARTED
 
-def is_auth_disabled(router_config: dict, name: str) -> bool:
-    return router_config["routers"][name]["disableAuth"]
 
+def import_api_routers(timings: dict[str, float] | None = None) -> APIRouter:
+    """Create top level router including all user defined endpoints.
 
-def import_api_routers() -> APIRouter:
-    """Create top level router including all user defined endpoints."""
+    The routers and their auth settings come from the precomputed router
+    manifest (see databutton_app.router_manifest); `timings` receives the
+    import time of each API module.
+    """
     routes = APIRouter(prefix="/routes")
 
-    router_config = get_router_config()
-
-    src_path = pathlib.Path(__file__).parent
-
-    # Import API routers from "src/app/apis/*/__init__.py"
-    apis_path = src_path / "app" / "apis"
-
-    api_names = [
-        p.relative_to(apis_path).parent.as_posix()
-        for p in apis_path.glob("*/__init__.py")
-    ]
-
-    api_module_prefix = "app.apis."
-
-    for name in api_names:
-        print(f"Importing API: {name}")
+    for entry in load_manifest():
+        name = entry["name"]
+        started = time.perf_counter()
         try:
-            api_module = __import__(api_module_prefix + name, fromlist=[name])
+            api_module = importlib.import_module(entry["module"])
             api_router = getattr(api_module, "router", None)
             if isinstance(api_router, APIRouter):
                 routes.include_router(
                     api_router,
-                    dependencies=(
-                        []
-                        if is_auth_disabled(router_config, name)
-                        else [Depends(get_authorized_user)]
-                    ),
+                    dependencies=[Depends(get_authorized_user)] if entry["auth"] else [],
                 )
         except Exception as e:
-            print(e)
+            log.exception("failed to import API %s", name, extra={"error": str(e)})
             continue
-
-    print(routes.routes)
+        finally:
+            if timings is not None:
+                timings[f"api:{name}"] = time.perf_counter() - started
 
     return routes
 
@@ -74,23 +66,77 @@ def get_firebase_config() -> dict | None:
     return None
 
 
+def collect_process_metrics():
+    """Storage pool, event loop lag and logging metrics."""
+    storage = get_storage_executor().stats()
+    loop = get_loop_monitor().stats()
+    return [
+        ("storage_pool_in_flight", "gauge", "Storage operations running or queued", [({}, storage["in_flight"])]),
+        ("storage_pool_errors_total", "counter", "Storage operations that raised", [({}, storage["errors"])]),
+        ("event_loop_lag_max_seconds", "gauge", "Largest event loop lag observed", [({}, loop["lag_max"])]),
+        ("event_loop_blocked_seconds_total", "counter", "Event loop lag accumulated", [({}, loop["blocked_seconds"])]),
+        ("log_records_dropped_total", "counter", "Log records dropped with a full queue", [({}, dropped_records())]),
+    ]
+
+
+async def metrics_endpoint() -> Response:
+    """Prometheus text exposition of the process metrics."""
+    return Response(get_metrics().render(), media_type=CONTENT_TYPE)
+
+
+def startup_families(report: dict[str, float]):
+    return [("app_startup_seconds", "gauge", "Time spent in each startup phase", [({"phase": phase}, seconds) for phase, seconds in report.items()])]
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Run startup/shutdown hooks registered by the imported API modules."""
+    started = time.perf_counter()
+    auth_config = getattr(app.state, "auth_config", None)
+    jwks_manager = get_jwks_manager(auth_config.jwks_url) if auth_config else None
+    if jwks_manager is not None:
+        # Prefetch signing keys and keep them fresh off the request path
+        jwks_manager.start()
+    await run_startup()
+    report = app.state.startup_report
+    report["lifespan_startup"] = time.perf_counter() - started
+    report["total"] = report["import"] + report["create_app"] + report["lifespan_startup"]
+    log.info("startup complete", extra={"startup_ms": {phase: round(s * 1000, 1) for phase, s in report.items()}})
+    try:
+        yield
+    finally:
+        await run_shutdown()
+        if jwks_manager is not None:
+            await jwks_manager.stop()
+
+
 def create_app() -> FastAPI:
     """Create the app. This is called by uvicorn with the factory option to construct the app object."""
-    app = FastAPI()
-    app.include_router(import_api_routers())
-
-    for route in app.routes:
-        if hasattr(route, "methods"):
-            for method in route.methods:
-                print(f"{method} {route.path}")
+    started = time.perf_counter()
+    configure_logging()
+    # Startup report: seconds per phase, logged once the lifespan has started
+    report = {"import": _IMPORT_SECONDS}
+    app = FastAPI(lifespan=lifespan)
+    app.state.startup_report = report
+    app.include_router(import_api_routers(report))
+    app.add_middleware(MetricsMiddleware)
+    app.get("/metrics", include_in_schema=False)(metrics_endpoint)
+    get_metrics().collector("process", collect_process_metrics)
+    get_metrics().collector("startup", lambda: startup_families(report))
+
+    if log.isEnabledFor(logging.DEBUG):
+        for route in app.routes:
+            for method in getattr(route, "methods", None) or ():
+                log.debug("route %s %s", method, route.path)
+    log.info("app created", extra={"routes": len(app.routes)})
 
     firebase_config = get_firebase_config()
 
     if firebase_config is None:
-        print("No firebase config found")
+        log.info("no firebase config found")
         app.state.auth_config = None
     else:
-        print("Firebase config found")
+        log.info("firebase config found")
         auth_config = {
             "jwks_url": "https://www.googleapis.com/service_accounts/v1/jwk/securetoken@system.gserviceaccount.com",
             "audience": firebase_config["projectId"],
@@ -99,7 +145,14 @@ def create_app() -> FastAPI:
 
         app.state.auth_config = AuthConfig(**auth_config)
 
+    report["create_app"] = time.perf_counter() - started
     return app
 
 
-app = create_app()
+def __getattr__(name: str):
+    # `uvicorn main:app` builds the app on first access instead of at import,
+    # so importing main (tests, tooling, the factory mode) doesn't build it twice
+    if name == "app":
+        app = globals()["app"] = create_app()
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
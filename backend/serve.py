@@ -0,0 +1,77 @@
+"""Run the backend on several worker processes.
+
+    python serve.py                      # WEB_CONCURRENCY workers, default one per CPU
+    python serve.py --workers 4 --port 8000
+
+Uses gunicorn with uvicorn workers when gunicorn is installed (it restarts
+workers that die or hang), otherwise uvicorn's own process manager. Each
+worker builds the app with `main:create_app`.
+
+State that requests must see the same way from every worker (session cache,
+locks behind optimistic writes) lives in the backend selected by
+`SHARED_STATE_URL`. With more than one worker and no URL set, a SQLite file in
+the backend directory is used, which is enough for workers on one host; for
+several hosts point `SHARED_STATE_URL` at Redis.
+"""
+
+import argparse
+import importlib.util
+import os
+import sys
+from pathlib import Path
+from typing import List, Optional
+
+BACKEND_DIR = Path(__file__).resolve().parent
+DEFAULT_SHARED_STATE_URL = f"sqlite://{BACKEND_DIR / 'shared_state.db'}"
+
+
+def default_workers() -> int:
+    return int(os.environ.get("WEB_CONCURRENCY") or os.cpu_count() or 1)
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=default_workers())
+    parser.add_argument("--host", default=os.environ.get("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.environ.get("PORT", 8000)))
+    parser.add_argument("--timeout", type=int, default=60, help="gunicorn: restart a worker silent for this long")
+    parser.add_argument("--uvicorn", action="store_true", help="use uvicorn's process manager even if gunicorn is installed")
+    return parser.parse_args(argv)
+
+
+def configure_shared_state(workers: int, environ: Optional[dict] = None) -> Optional[str]:
+    """Defaults SHARED_STATE_URL to the local SQLite file when running several workers."""
+    environ = os.environ if environ is None else environ
+    if workers > 1 and not environ.get("SHARED_STATE_URL"):
+        environ["SHARED_STATE_URL"] = DEFAULT_SHARED_STATE_URL
+    return environ.get("SHARED_STATE_URL")
+
+
+def gunicorn_command(args: argparse.Namespace) -> List[str]:
+    return [
+        sys.executable, "-m", "gunicorn", "main:create_app()",
+        "--worker-class", "uvicorn.workers.UvicornWorker",
+        "--workers", str(args.workers),
+        "--bind", f"{args.host}:{args.port}",
+        "--timeout", str(args.timeout),
+        "--graceful-timeout", "30",
+    ]
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    args = parse_args(argv)
+    os.chdir(BACKEND_DIR)
+    shared_state_url = configure_shared_state(args.workers)
+    print(f"Starting {args.workers} workers on {args.host}:{args.port}, shared state: {shared_state_url or 'memory://'}")
+
+    if not args.uvicorn and importlib.util.find_spec("gunicorn") is not None:
+        command = gunicorn_command(args)
+        os.execv(command[0], command)
+
+    import uvicorn
+
+    uvicorn.run("main:create_app", factory=True, host=args.host, port=args.port, workers=args.workers)
+
+
+if __name__ == "__main__":
+    main()
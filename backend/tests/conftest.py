@@ -44,6 +44,10 @@ def app():
     application.dependency_overrides[get_authorized_user] = lambda: {'sub': 'testuser'}
     return application
 
+@pytest.fixture
+def json_storage():
+    return JsonStore()
+
 @pytest.fixture
 def client(app):
     from fastapi.testclient import TestClient
@@ -0,0 +1,125 @@
+import asyncio
+
+from backend.app.libs.agent_health import AgentHealthTracker
+from backend.app.libs.agent_registry import AgentRegistry
+from backend.app.libs.routing import compile_snapshot
+from backend.app.libs.shared_state import MemorySharedState
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_registry():
+    return AgentRegistry([
+        {"agent_id": "orchestrator", "agent_name": "Orquestador", "description": "o"},
+        {"agent_id": "training", "agent_name": "Training", "description": "t"},
+        {"agent_id": "nutrition", "agent_name": "Nutrition", "description": "n"},
+    ])
+
+
+def test_status_transitions():
+    clock = FakeClock()
+    health = AgentHealthTracker(heartbeat_timeout=10, min_calls=2, clock=clock)
+    assert health.status("orchestrator") == "online"
+    assert health.status("training") == "unknown"
+
+    assert health.heartbeat("training", load=0.2) == "online"
+    assert health.heartbeat("training", load=0.95) == "degraded"
+    health.heartbeat("training", load=0.1)
+
+    health.record_call("training", 0.1, ok=False)
+    assert health.status("training") == "online"  # aún no hay llamadas suficientes
+    health.record_call("training", 0.3, ok=False)
+    assert health.status("training") == "degraded"
+
+    clock.now = 11
+    assert health.status("training") == "offline"
+
+
+def test_snapshot_is_cached_until_ttl_or_transition():
+    clock = FakeClock()
+    health = AgentHealthTracker(heartbeat_timeout=10, cache_seconds=1, clock=clock)
+    registry = make_registry()
+
+    first = health.snapshot(registry)
+    assert health.snapshot(registry) is first
+    assert first.statuses == {"orchestrator": "online", "training": "unknown", "nutrition": "unknown"}
+
+    # Un latido que cambia el estado publica una instantánea nueva al momento
+    health.heartbeat("nutrition")
+    second = health.snapshot(registry)
+    assert second is not first and second.statuses["nutrition"] == "online"
+
+    # Un latido que no cambia el estado espera al TTL
+    health.heartbeat("nutrition", load=0.5)
+    assert health.snapshot(registry) is second
+    clock.now = 1.5
+    third = health.snapshot(registry)
+    assert third is not second and third.payload["agents"][2]["load"] == 0.5
+
+    clock.now = 20
+    assert health.snapshot(registry).unavailable == frozenset({"nutrition"})
+
+
+def test_matcher_skips_unavailable_agents():
+    snapshot = compile_snapshot({
+        "default_agent": "training",
+        "agents": [
+            {"agent_id": "training", "agent_name": "T", "description": "t", "keywords": ["dieta", "rutina"]},
+            {"agent_id": "nutrition", "agent_name": "N", "description": "n", "keywords": ["dieta", "comida"]},
+        ],
+    })
+    assert snapshot.matcher.best("dieta") == "training"
+    assert snapshot.matcher.best("dieta", exclude={"training"}) == "nutrition"
+    assert snapshot.matcher.best("rutina", exclude={"training"}) is None
+
+
+def test_degraded_agent_recovers_when_its_errors_expire():
+    clock = FakeClock()
+    health = AgentHealthTracker(heartbeat_timeout=30, cache_seconds=1, min_calls=2, window_seconds=10, clock=clock)
+    registry = make_registry()
+    health.heartbeat("training")
+    for _ in range(3):
+        health.record_call("training", 0.1, ok=False)
+    assert "training" in health.snapshot(registry).unavailable
+
+    # Sin consultas (el enrutamiento lo evita) sus fallos caducan con la ventana
+    clock.now = 10.5
+    health.heartbeat("training")
+    assert health.status("training") == "online"
+    assert "training" not in health.snapshot(registry).unavailable
+    assert health.agent_payload(registry, "training")["error_rate"] is None
+
+
+def test_workers_share_heartbeats_through_shared_state():
+    clock = FakeClock()
+    state = MemorySharedState(clock=clock)
+    worker_a, worker_b = (
+        AgentHealthTracker(heartbeat_timeout=10, cache_seconds=1, clock=clock, shared=state) for _ in range(2)
+    )
+    registry = make_registry()
+    assert worker_b.snapshot(registry).statuses["training"] == "unknown"
+
+    async def heartbeat_on_a():
+        worker_a.heartbeat("training", load=0.95)
+        await worker_a.publish_heartbeat("training")
+        # B incorpora el latido que llegó a A
+        await worker_b.sync(registry.ids)
+
+    asyncio.run(heartbeat_on_a())
+    assert worker_b.status("training") == worker_a.status("training") == "degraded"
+    assert worker_b.snapshot(registry).unavailable == worker_a.snapshot(registry).unavailable
+
+    # Un latido más antiguo que el propio no retrocede el estado
+    clock.now = 5
+    worker_b.heartbeat("training", load=0.1)
+    asyncio.run(worker_b.sync(registry.ids))
+    assert worker_b.status("training") == "online"
+
+    clock.now = 16
+    assert worker_a.status("training") == worker_b.status("training") == "offline"
@@ -1,4 +1,7 @@
+import json
+
 import jwt
+import pytest
 from backend.app.apis.a2a import AgentInfo, A2AMessage
 
 JWT_SECRET = "nexusforge_default_secret"
@@ -40,6 +43,34 @@ def test_a2a_send(client):
     assert "message_id" in data
 
 
+def test_a2a_subscribe_receives_new_messages(client):
+    protocol = f"Authorization.Bearer.{make_token()}"
+    with client.websocket_connect("/routes/a2a/subscribe?agent_id=sub-agent", subprotocols=[protocol]) as ws:
+        assert ws.receive_json() == {"event": "subscribed", "data": {"topics": ["agent:sub-agent"]}}
+        message = A2AMessage(
+            from_agent=AgentInfo(agent_id="a1"),
+            to_agent=AgentInfo(agent_id="sub-agent"),
+            message_type="text",
+            content={"text": "push"},
+        )
+        resp = client.post("/routes/a2a/send", json=message.model_dump(), headers=auth_headers())
+        event = ws.receive_json()
+        assert event["event"] == "message"
+        assert event["data"]["message_id"] == resp.json()["message_id"]
+        assert event["data"]["content"] == {"text": "push"}
+
+
+def test_websocket_accepts_without_bearer_subprotocol(app):
+    import sys
+    from fastapi.testclient import TestClient
+
+    # Otra dependencia de autenticación puede aceptar clientes sin el subprotocolo del token
+    app.dependency_overrides[sys.modules["app.apis.auth"].get_current_user_ws] = lambda: {"sub": "testuser"}
+    with TestClient(app).websocket_connect("/routes/a2a/subscribe?agent_id=sub-agent") as ws:
+        assert ws.accepted_subprotocol is None
+        assert ws.receive_json()["event"] == "subscribed"
+
+
 def test_agents_status(client):
     resp = client.get("/routes/orchestrator/agents/status", headers=auth_headers())
     assert resp.status_code == 200
@@ -56,3 +87,189 @@ def test_agent_info(client):
     assert resp.status_code == 200
     data = resp.json()
     assert data["agent_id"] == "training"
+
+
+def test_agent_heartbeat_updates_status(client):
+    resp = client.post(
+        "/routes/orchestrator/agent/recovery/heartbeat",
+        json={"load": 0.2},
+        headers=auth_headers(),
+    )
+    assert resp.status_code == 200
+    assert resp.json()["status"] == "online"
+
+    resp = client.get("/routes/orchestrator/agent/recovery", headers=auth_headers())
+    assert resp.json()["status"] == "online"
+    assert resp.json()["load"] == 0.2
+
+    resp = client.post("/routes/orchestrator/agent/unknown/heartbeat", json={}, headers=auth_headers())
+    assert resp.status_code == 404
+
+
+def test_routing_info(client):
+    resp = client.get("/routes/orchestrator/routing", headers=auth_headers())
+    assert resp.status_code == 200
+    data = resp.json()
+    assert data["default_agent"] == "training"
+    assert "nutrition" in data["agents"]
+
+
+def test_a2a_conversation_roundtrip(client):
+    conversation_id = "conv-roundtrip"
+    for text in ("uno", "dos"):
+        message = A2AMessage(
+            conversation_id=conversation_id,
+            from_agent=AgentInfo(agent_id="a1"),
+            to_agent=AgentInfo(agent_id="a2"),
+            message_type="text",
+            content={"text": text},
+        )
+        resp = client.post("/routes/a2a/send", json=message.model_dump(), headers=auth_headers())
+        assert resp.status_code == 200
+
+    resp = client.get(f"/routes/a2a/conversation/{conversation_id}", headers=auth_headers())
+    assert resp.status_code == 200
+    assert [m["content"]["text"] for m in resp.json()["messages"]] == ["uno", "dos"]
+
+
+def test_a2a_agent_conversations_index(client):
+    message = A2AMessage(
+        conversation_id="conv-inbox",
+        from_agent=AgentInfo(agent_id="a1"),
+        to_agent=AgentInfo(agent_id="inbox-agent"),
+        message_type="text",
+        content={"text": "hola"},
+    )
+    resp = client.post("/routes/a2a/send", json=message.model_dump(), headers=auth_headers())
+    assert resp.status_code == 200
+    message_id = resp.json()["message_id"]
+
+    resp = client.get("/routes/a2a/agent/inbox-agent/conversations", headers=auth_headers())
+    assert resp.status_code == 200
+    data = resp.json()
+    assert data["count"] == 1
+    assert data["conversations"]["conv-inbox"]["last_message_id"] == message_id
+    assert "messages" not in data["conversations"]["conv-inbox"]
+
+
+def test_a2a_conversation_pagination_headers_only(client):
+    conversation_id = "conv-pages"
+    for i in range(5):
+        message = A2AMessage(
+            message_id=f"p{i}",
+            conversation_id=conversation_id,
+            from_agent=AgentInfo(agent_id="a1"),
+            to_agent=AgentInfo(agent_id="a2"),
+            message_type="text",
+            content={"text": str(i)},
+        )
+        client.post("/routes/a2a/send", json=message.model_dump(), headers=auth_headers())
+
+    resp = client.get(
+        f"/routes/a2a/conversation/{conversation_id}",
+        params={"limit": 2, "before": "p3", "headers_only": True},
+        headers=auth_headers(),
+    )
+    assert resp.status_code == 200
+    data = resp.json()
+    assert [m["message_id"] for m in data["messages"]] == ["p1", "p2"]
+    assert all("content" not in m for m in data["messages"])
+    assert data["total"] == 5
+    assert data["has_more_before"] and data["has_more_after"]
+
+    resp = client.get(
+        f"/routes/a2a/conversation/{conversation_id}",
+        params={"before": "unknown"},
+        headers=auth_headers(),
+    )
+    assert resp.status_code == 400
+
+
+def test_orchestrator_query_persists_session(client):
+    resp = client.post(
+        "/routes/orchestrator/query",
+        json={"query": "Necesito una dieta", "session_id": "s1"},
+        headers=auth_headers(),
+    )
+    assert resp.status_code == 200
+    data = resp.json()
+    assert data["session_id"] == "s1"
+    assert data["response"]["agent"]["agent_id"] == "nutrition"
+
+    # Sin palabras clave se reutiliza el último agente de la sesión
+    resp = client.post(
+        "/routes/orchestrator/query",
+        json={"query": "hola", "session_id": "s1"},
+        headers=auth_headers(),
+    )
+    assert resp.json()["response"]["agent"]["agent_id"] == "nutrition"
+
+
+def test_orchestrator_multi_agent_query(client):
+    resp = client.post(
+        "/routes/orchestrator/query",
+        json={"query": "Rutina de pesas y dieta", "user_id": "u1", "multi_agent": True},
+        headers=auth_headers(),
+    )
+    assert resp.status_code == 200
+    response = resp.json()["response"]
+    assert [agent["agent_id"] for agent in response["agents"]] == ["training", "nutrition"]
+    assert set(response["responses"]) == {"training", "nutrition"}
+    assert response["partial"] is False
+
+
+def parse_sse(body):
+    events = []
+    for block in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+def test_orchestrator_query_stream_sse(client):
+    resp = client.post(
+        "/routes/orchestrator/query/stream",
+        json={"query": "Quiero una dieta", "user_id": "u1"},
+        headers=auth_headers(),
+    )
+    assert resp.status_code == 200
+    assert resp.headers["content-type"].startswith("text/event-stream")
+    events = parse_sse(resp.text)
+    assert events[0][0] == "routing"
+    assert events[0][1]["agents"][0]["agent_id"] == "nutrition"
+    chunks = [data["text"] for name, data in events if name == "chunk"]
+    assert len(chunks) > 1
+    assert events[-1][0] == "result"
+    assert "".join(chunks).strip() == events[-1][1]["response"]["text"]
+
+
+def test_orchestrator_query_websocket(client):
+    protocol = f"Authorization.Bearer.{make_token()}"
+    with client.websocket_connect("/routes/orchestrator/query/ws", subprotocols=[protocol]) as ws:
+        assert ws.accepted_subprotocol == protocol
+        ws.send_json({"query": "rutina y dieta", "multi_agent": True})
+        events = []
+        while not events or events[-1]["event"] not in ("result", "error"):
+            events.append(ws.receive_json())
+        assert events[0]["event"] == "routing"
+        assert {e["data"]["agent_id"] for e in events if e["event"] == "chunk"} == {"training", "nutrition"}
+        assert events[-1]["event"] == "result"
+
+        ws.send_json({"multi_agent": True})
+        assert ws.receive_json()["data"]["status_code"] == 422
+
+
+def test_orchestrator_websocket_requires_token(client):
+    from starlette.websockets import WebSocketDisconnect
+
+    with pytest.raises(WebSocketDisconnect):
+        with client.websocket_connect("/routes/orchestrator/query/ws") as ws:
+            ws.receive_json()
+
+
+def test_lifespan_runs_hooks(app):
+    from fastapi.testclient import TestClient
+
+    with TestClient(app) as client:
+        resp = client.get("/routes/orchestrator/agents/status", headers=auth_headers())
+        assert resp.status_code == 200
@@ -0,0 +1,99 @@
+import threading
+import time
+
+import jwt
+import pytest
+from fastapi import HTTPException
+
+from backend.app.apis import auth
+from backend.app.libs.cache import LockedTTLCache, TTLCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(auth, "_token_cache", TTLCache(max_size=10, ttl=300, clock=clock))
+    return clock
+
+
+def make_token(**claims):
+    return jwt.encode({"sub": "u1", **claims}, auth.JWT_SECRET, algorithm=auth.ALGORITHM)
+
+
+def test_repeated_token_is_served_from_cache(clock, monkeypatch):
+    token = make_token(exp=int(time.time()) + 60)
+    first = auth.decode_token(token)
+
+    def fail(*args, **kwargs):
+        raise AssertionError("no debería verificarse de nuevo")
+
+    monkeypatch.setattr(auth.jwt, "decode", fail)
+    assert auth.decode_token(token) == first
+    # Quien llama puede modificar su copia sin alterar la caché
+    auth.decode_token(token)["sub"] = "otro"
+    assert auth.decode_token(token)["sub"] == "u1"
+    stats = auth.token_cache_stats()
+    assert stats["hits"] == 3 and stats["misses"] == 1
+
+
+def test_cached_token_expires_with_exp(clock, monkeypatch):
+    token = make_token(exp=int(time.time()) + 2)
+    auth.decode_token(token)
+    clock.now = 1
+    auth.decode_token(token)
+    assert auth.token_cache_stats()["hits"] == 1
+
+    # Pasado el `exp` se vuelve a verificar (y jwt rechaza el token caducado)
+    def expired(*args, **kwargs):
+        raise jwt.ExpiredSignatureError("expirado")
+
+    monkeypatch.setattr(auth.jwt, "decode", expired)
+    clock.now = 3
+    with pytest.raises(HTTPException) as error:
+        auth.decode_token(token)
+    assert error.value.status_code == 401
+
+
+def test_invalid_token_is_not_cached(clock):
+    token = jwt.encode({"sub": "u1"}, "otra_clave", algorithm="HS256")
+    for _ in range(2):
+        with pytest.raises(HTTPException):
+            auth.decode_token(token)
+    assert len(auth._token_cache) == 0
+
+
+def test_cache_is_safe_under_concurrent_verification(monkeypatch):
+    # Como el middleware de los routers en el threadpool: varios hilos a la vez
+    def yielding_clock():
+        # Cede el GIL entre la búsqueda y la actualización de la entrada
+        time.sleep(0.0001)
+        return time.monotonic()
+
+    cache = LockedTTLCache(max_size=8, ttl=300, clock=yielding_clock)
+    monkeypatch.setattr(auth, "_token_cache", cache)
+    tokens = [make_token(n=n, exp=int(time.time()) + 60) for n in range(32)]
+    errors = []
+
+    def verify(offset):
+        try:
+            for i in range(400):
+                token = tokens[(i * 7 + offset) % len(tokens)]
+                assert auth.decode_token(token)["sub"] == "u1"
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=verify, args=(n,)) for n in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    assert len(cache) <= 8
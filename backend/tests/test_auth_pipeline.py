@@ -0,0 +1,102 @@
+import os
+import sys
+
+import jwt
+import pytest
+from fastapi.testclient import TestClient
+
+from backend.main import create_app
+
+JWT_SECRET = "clave_de_pruebas"
+
+
+@pytest.fixture
+def unauthenticated_client():
+    # Sin anular get_authorized_user: el middleware real verifica cada petición
+    cwd = os.getcwd()
+    os.chdir(os.path.join(os.path.dirname(__file__), ".."))
+    try:
+        application = create_app()
+    finally:
+        os.chdir(cwd)
+    return TestClient(application)
+
+
+def clear_jwt_secret():
+    # El verificador registrado puede ser el de cualquiera de las dos copias del módulo
+    for name in ("app.apis.auth", "backend.app.apis.auth"):
+        if name in sys.modules:
+            sys.modules[name].get_jwt_secret.cache_clear()
+
+
+@pytest.fixture
+def internal_tokens(unauthenticated_client, monkeypatch):
+    # Los routers aceptan tokens internos solo si se habilita y con un secreto propio
+    monkeypatch.setenv("AUTH_ACCEPT_INTERNAL_TOKENS", "1")
+    monkeypatch.setitem(sys.modules["databutton"].secrets._data, "JWT_SECRET", JWT_SECRET)
+    clear_jwt_secret()
+    yield
+    clear_jwt_secret()
+
+
+@pytest.fixture
+def decode_calls(monkeypatch):
+    auth = sys.modules["app.apis.auth"]
+    auth._token_cache.clear()
+    calls = []
+    original = jwt.decode
+
+    def counting_decode(*args, **kwargs):
+        calls.append(args)
+        return original(*args, **kwargs)
+
+    monkeypatch.setattr(jwt, "decode", counting_decode)
+    return calls
+
+
+def test_internal_token_is_verified_once_per_request(unauthenticated_client, internal_tokens, decode_calls):
+    token = jwt.encode({"sub": "u1", "email": "u1@example.com"}, JWT_SECRET, algorithm="HS256")
+    resp = unauthenticated_client.get("/routes/auth/verify-token", headers={"Authorization": f"Bearer {token}"})
+    assert resp.status_code == 200
+    assert resp.json()["user_id"] == "u1"
+    # El middleware del router y get_current_user comparten el mismo principal
+    assert len(decode_calls) == 1
+
+
+def test_invalid_token_is_rejected_by_the_middleware(unauthenticated_client, decode_calls):
+    token = jwt.encode({"sub": "u1"}, "otra_clave", algorithm="HS256")
+    resp = unauthenticated_client.get("/routes/orchestrator/agents/status", headers={"Authorization": f"Bearer {token}"})
+    assert resp.status_code == 401
+    assert unauthenticated_client.get("/routes/orchestrator/agents/status").status_code in (401, 403)
+
+
+def test_auth_outcomes_are_counted(unauthenticated_client, internal_tokens, decode_calls):
+    from databutton_app.mw.auth_mw import auth_outcome_counts
+
+    before = auth_outcome_counts()
+    token = jwt.encode({"sub": "u1"}, JWT_SECRET, algorithm="HS256")
+    bad_token = jwt.encode({"sub": "u1"}, "otra_clave", algorithm="HS256")
+    unauthenticated_client.get("/routes/auth/verify-token", headers={"Authorization": f"Bearer {token}"})
+    unauthenticated_client.get("/routes/auth/verify-token", headers={"Authorization": f"Bearer {bad_token}"})
+    unauthenticated_client.get("/routes/orchestrator/agents/status")
+    after = auth_outcome_counts()
+
+    def delta(outcome):
+        return after.get(outcome, 0) - before.get(outcome, 0)
+
+    assert (delta("authenticated"), delta("rejected"), delta("missing_token")) == (1, 1, 1)
+
+
+def test_internal_tokens_are_rejected_by_the_middleware_unless_enabled(unauthenticated_client, decode_calls, monkeypatch):
+    auth = sys.modules["app.apis.auth"]
+    clear_jwt_secret()
+    monkeypatch.delenv("AUTH_ACCEPT_INTERNAL_TOKENS", raising=False)
+    token = auth.create_access_token({"sub": "u1"})
+    headers = {"Authorization": f"Bearer {token}"}
+    assert unauthenticated_client.get("/routes/orchestrator/agents/status", headers=headers).status_code == 401
+
+    # Habilitados pero con el secreto por defecto: cualquiera podría firmarlos
+    monkeypatch.setenv("AUTH_ACCEPT_INTERNAL_TOKENS", "1")
+    assert auth.get_jwt_secret() == auth.DEFAULT_JWT_SECRET
+    assert unauthenticated_client.get("/routes/orchestrator/agents/status", headers=headers).status_code == 401
+    assert decode_calls == []
@@ -0,0 +1,107 @@
+import asyncio
+
+from backend.app.libs.concurrency import KeyedBatcher, KeyedLock
+from backend.app.libs.conversation_store import SegmentedConversationStore
+from backend.app.libs.inbox_index import JsonInboxIndex
+
+
+def make_message(i):
+    return {
+        "message_id": f"m{i}",
+        "timestamp": f"2025-01-01T00:00:{i:02d}",
+        "from": {"agent_id": "a1"},
+        "type": "text",
+        "content": {},
+    }
+
+
+def test_keyed_lock_releases_unused_keys():
+    locks = KeyedLock()
+
+    async def run():
+        async with locks.hold("a"):
+            assert len(locks) == 1
+        assert len(locks) == 0
+
+    asyncio.run(run())
+
+
+def test_batcher_coalesces_concurrent_appends(json_storage):
+    store = SegmentedConversationStore(json_storage, segment_size=7)
+
+    async def flush(conversation_id, messages):
+        # Ceder el bucle para que lleguen más envíos mientras se "escribe"
+        await asyncio.sleep(0.01)
+        count = store.append_many(conversation_id, messages)
+        return [count - len(messages) + i + 1 for i in range(len(messages))]
+
+    batcher = KeyedBatcher(flush)
+
+    async def run():
+        return await asyncio.gather(*(batcher.submit("c1", make_message(i)) for i in range(40)))
+
+    positions = asyncio.run(run())
+    assert sorted(positions) == list(range(1, 41))
+    assert len(store.load("c1")["messages"]) == 40
+    assert batcher.flushes < 40
+
+
+def test_batcher_propagates_errors():
+    def flush(key, items):
+        raise RuntimeError("boom")
+
+    batcher = KeyedBatcher(flush)
+
+    async def run():
+        return await asyncio.gather(batcher.submit("k", 1), return_exceptions=True)
+
+    assert isinstance(asyncio.run(run())[0], RuntimeError)
+
+
+class InterleavingStore(dict):
+    """Ejecuta otra escritura justo antes de la primera escritura condicional"""
+
+    def __init__(self):
+        super().__init__()
+        self.before_first_cas = None
+
+    def get(self, key, default=None):
+        if key not in self:
+            raise FileNotFoundError
+        return super().get(key, default)
+
+    def put(self, key, value):
+        self[key] = value
+
+    def compare_and_put(self, key, value, expected_version):
+        hook, self.before_first_cas = self.before_first_cas, None
+        if hook:
+            hook()
+        current = dict.get(self, key) or {}
+        if current.get("version", 0) != expected_version:
+            return False
+        self[key] = value
+        return True
+
+
+def test_optimistic_append_retries_on_conflict():
+    storage = InterleavingStore()
+    writer_a = SegmentedConversationStore(storage, segment_size=4, optimistic=True)
+    writer_b = SegmentedConversationStore(storage, segment_size=4, optimistic=True)
+    writer_a.append("c1", make_message(0))
+
+    storage.before_first_cas = lambda: writer_b.append("c1", make_message(1))
+    writer_a.append("c1", make_message(2))
+
+    assert [m["message_id"] for m in writer_a.load("c1")["messages"]] == ["m0", "m1", "m2"]
+
+
+def test_optimistic_inbox_retries_on_conflict():
+    storage = InterleavingStore()
+    inbox_a = JsonInboxIndex(storage, optimistic=True)
+    inbox_b = JsonInboxIndex(storage, optimistic=True)
+
+    storage.before_first_cas = lambda: inbox_b.record("training", "c2", make_message(1), 0)
+    inbox_a.record("training", "c1", make_message(0), 0)
+
+    assert set(inbox_a.list("training")) == {"c1", "c2"}
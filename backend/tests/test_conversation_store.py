@@ -0,0 +1,216 @@
+from backend.app.libs.conversation_store import (
+    CursorNotFoundError,
+    SegmentedConversationStore,
+    parse_cursor,
+    project_headers,
+)
+import threading
+
+import pytest
+
+
+class CountingStore(dict):
+    """Almacén en memoria que registra el tamaño de cada escritura"""
+
+    def __init__(self):
+        super().__init__()
+        self.writes = []
+
+    def get(self, key, default=None):
+        if key not in self:
+            raise FileNotFoundError
+        return super().get(key, default)
+
+    def put(self, key, value):
+        self.writes.append((key, len(value.get("messages", []))))
+        self[key] = value
+
+
+def make_message(i):
+    return {
+        "message_id": f"m{i}",
+        "timestamp": f"2025-01-01T00:{i // 60:02d}:{i % 60:02d}",
+        "type": "text",
+        "content": {"n": i},
+    }
+
+
+def ids(page):
+    return [m["message_id"] for m in page["messages"]]
+
+
+def test_append_and_load_across_segments(json_storage):
+    store = SegmentedConversationStore(json_storage, segment_size=3)
+    for i in range(8):
+        assert store.append("c1", make_message(i)) == i + 1
+
+    conversation = store.load("c1")
+    assert [m["message_id"] for m in conversation["messages"]] == [f"m{i}" for i in range(8)]
+    assert "a2a_conversation_c1_seg_2" in json_storage
+    assert store.load("missing") is None
+
+
+def test_append_writes_only_tail_segment():
+    storage = CountingStore()
+    store = SegmentedConversationStore(storage, segment_size=10)
+    for i in range(250):
+        store.append("c1", make_message(i))
+
+    # Cada envío escribe el segmento final y el manifiesto, nunca más de un segmento
+    segment_writes = [n for key, n in storage.writes if "_seg_" in key]
+    assert len(segment_writes) == 250
+    assert max(segment_writes) == 10
+
+
+def test_metadata_is_merged(json_storage):
+    store = SegmentedConversationStore(json_storage, segment_size=2)
+    store.append("c1", make_message(0), {"a": 1})
+    store.append("c1", make_message(1), {"b": 2})
+    assert store.load("c1")["metadata"] == {"a": 1, "b": 2}
+
+
+def test_legacy_document_is_migrated(json_storage):
+    json_storage.put("a2a_conversation_old", {
+        "conversation_id": "old",
+        "messages": [make_message(i) for i in range(5)],
+        "metadata": {"topic": "x"},
+    })
+    store = SegmentedConversationStore(json_storage, segment_size=2)
+    store.append("old", make_message(5))
+
+    conversation = store.load("old")
+    assert len(conversation["messages"]) == 6
+    assert conversation["metadata"] == {"topic": "x"}
+
+
+class GatedMigrationStore(CountingStore):
+    """Detiene la primera escritura de un segmento hasta que el anexo termina (o pasa un rato)"""
+
+    def __init__(self):
+        super().__init__()
+        self.migrating = threading.Event()
+        self.appended = threading.Event()
+
+    def put(self, key, value):
+        if "_seg_" in key and not self.migrating.is_set():
+            self.migrating.set()
+            self.appended.wait(0.3)
+        super().put(key, value)
+
+
+def test_read_and_append_racing_on_legacy_document():
+    storage = GatedMigrationStore()
+    storage.put("a2a_conversation_old", {"conversation_id": "old", "messages": [make_message(i) for i in range(5)]})
+    store = SegmentedConversationStore(storage, segment_size=2)
+
+    reader = threading.Thread(target=store.read_window, args=("old",))
+    reader.start()
+    assert storage.migrating.wait(1)
+
+    def append():
+        store.append("old", make_message(5))
+        storage.appended.set()
+
+    writer = threading.Thread(target=append)
+    writer.start()
+    reader.join()
+    writer.join()
+
+    # La migración del lector no debe borrar el mensaje anexado mientras tanto
+    assert ids(store.load("old")) == [f"m{i}" for i in range(6)]
+
+
+def test_uncommitted_tail_is_discarded(json_storage):
+    store = SegmentedConversationStore(json_storage, segment_size=4)
+    store.append("c1", make_message(0))
+    # Simular una escritura del segmento sin confirmar en el manifiesto
+    json_storage["a2a_conversation_c1_seg_0"]["messages"].append(make_message(99))
+    store.append("c1", make_message(1))
+
+    assert [m["message_id"] for m in store.load("c1")["messages"]] == ["m0", "m1"]
+
+
+class ReadCountingStore(CountingStore):
+    def __init__(self):
+        super().__init__()
+        self.reads = []
+
+    def get(self, key, default=None):
+        self.reads.append(key)
+        return super().get(key, default)
+
+
+def test_read_window_by_message_id(json_storage):
+    store = SegmentedConversationStore(json_storage, segment_size=4)
+    for i in range(10):
+        store.append("c1", make_message(i))
+
+    page = store.read_window("c1", limit=3)
+    assert ids(page) == ["m7", "m8", "m9"]
+    assert page["has_more_before"] and not page["has_more_after"]
+    assert page["total"] == 10
+
+    page = store.read_window("c1", limit=3, before="m7")
+    assert ids(page) == ["m4", "m5", "m6"]
+
+    page = store.read_window("c1", limit=3, after="m2")
+    assert ids(page) == ["m3", "m4", "m5"]
+    assert page["has_more_before"] and page["has_more_after"]
+
+    page = store.read_window("c1", before="m5", after="m2")
+    assert ids(page) == ["m3", "m4"]
+
+    with pytest.raises(CursorNotFoundError):
+        store.read_window("c1", before="nope")
+
+
+def test_read_window_by_timestamp(json_storage):
+    store = SegmentedConversationStore(json_storage, segment_size=4)
+    for i in range(10):
+        store.append("c1", make_message(i))
+
+    assert ids(store.read_window("c1", limit=2, before="2025-01-01T00:00:05")) == ["m3", "m4"]
+    assert ids(store.read_window("c1", limit=2, after="2025-01-01T00:00:05Z")) == ["m6", "m7"]
+    assert ids(store.read_window("c1", after="2025-01-01T00:10:00")) == []
+
+
+def test_numeric_message_ids_are_not_taken_for_timestamps(json_storage):
+    store = SegmentedConversationStore(json_storage, segment_size=2)
+    for i, message_id in enumerate(["20240101", "20240101T1200", "20240102"]):
+        store.append("c1", {**make_message(i), "message_id": message_id})
+
+    assert parse_cursor("20240101T1200") == ("message_id", "20240101T1200")
+    assert ids(store.read_window("c1", before="20240101T1200")) == ["20240101"]
+    assert ids(store.read_window("c1", after="20240101")) == ["20240101T1200", "20240102"]
+
+
+def test_cursor_prefixes_fix_the_kind(json_storage):
+    store = SegmentedConversationStore(json_storage, segment_size=2)
+    for i in range(4):
+        store.append("c1", {**make_message(i), "message_id": f"2025-01-01T00:00:0{3 - i}"})
+
+    assert parse_cursor("ts:20250101T000001") == ("timestamp", "2025-01-01T00:00:01")
+    assert parse_cursor("2025-01-01T00:00:01Z") == ("timestamp", "2025-01-01T00:00:01")
+    # Un id con forma de timestamp necesita el prefijo `id:`
+    assert ids(store.read_window("c1", after="id:2025-01-01T00:00:03")) == [f"2025-01-01T00:00:0{3 - i}" for i in (1, 2, 3)]
+    assert ids(store.read_window("c1", before="ts:2025-01-01T00:00:02")) == ["2025-01-01T00:00:03", "2025-01-01T00:00:02"]
+    with pytest.raises(CursorNotFoundError):
+        store.read_window("c1", before="ts:no-es-fecha")
+
+
+def test_read_window_only_loads_needed_segments():
+    storage = ReadCountingStore()
+    store = SegmentedConversationStore(storage, segment_size=10)
+    for i in range(200):
+        store.append("c1", make_message(i))
+    storage.reads.clear()
+
+    page = store.read_window("c1", limit=5, before="2025-01-01T00:01:45")
+    assert ids(page) == [f"m{i}" for i in range(100, 105)]
+    # Manifiesto + un único segmento
+    assert len(storage.reads) == 2
+
+
+def test_project_headers_drops_content():
+    headers = project_headers({**make_message(1), "metadata": {"x": 1}})
+    assert set(headers) == {"message_id", "timestamp", "type"}
@@ -0,0 +1,192 @@
+import asyncio
+
+import pytest
+
+from backend.app.libs.dispatch import AgentDispatcher, AgentQueueFullError, AgentTimeoutError
+
+
+def make_stub_agent(delay=0.0, fail=False):
+    state = {"running": 0, "peak": 0, "calls": 0}
+
+    async def handler(request):
+        state["calls"] += 1
+        state["running"] += 1
+        state["peak"] = max(state["peak"], state["running"])
+        try:
+            await asyncio.sleep(delay)
+            if fail:
+                raise ValueError("fallo del agente")
+            return {"text": f"ok {request['n']}"}
+        finally:
+            state["running"] -= 1
+
+    return handler, state
+
+
+def test_concurrency_is_bounded_per_agent():
+    slow, slow_state = make_stub_agent(delay=0.05)
+    fast, fast_state = make_stub_agent()
+    results = []
+    dispatcher = AgentDispatcher(on_result=lambda agent, latency, ok: results.append((agent, ok)))
+    dispatcher.register("nutrition", slow, concurrency=2)
+    dispatcher.register("training", fast)
+
+    async def run():
+        slow_calls = [dispatcher.dispatch("nutrition", {"n": i}) for i in range(6)]
+        pending = asyncio.gather(*slow_calls)
+        # El agente lento no retrasa al rápido
+        fast_response = await asyncio.wait_for(dispatcher.dispatch("training", {"n": 0}), 0.03)
+        responses = await pending
+        await dispatcher.close()
+        return fast_response, responses
+
+    fast_response, responses = asyncio.run(run())
+    assert fast_response == {"text": "ok 0"}
+    assert [r["text"] for r in responses] == [f"ok {i}" for i in range(6)]
+    assert slow_state["peak"] == 2
+    assert dispatcher.stats()["nutrition"]["completed"] == 6
+    assert len(results) == 7 and all(ok for _, ok in results)
+
+
+def test_full_queue_rejects_immediately():
+    slow, _ = make_stub_agent(delay=0.05)
+    dispatcher = AgentDispatcher(slow, concurrency=1, queue_size=2)
+
+    async def run():
+        tasks = [asyncio.ensure_future(dispatcher.dispatch("nutrition", {"n": 0}))]
+        await asyncio.sleep(0.01)  # el worker ya está ocupado con la primera
+        tasks += [asyncio.ensure_future(dispatcher.dispatch("nutrition", {"n": i})) for i in (1, 2)]
+        await asyncio.sleep(0)  # dos en cola: la cola está llena
+        with pytest.raises(AgentQueueFullError):
+            await dispatcher.dispatch("nutrition", {"n": 99})
+        await asyncio.gather(*tasks)
+        await dispatcher.close()
+
+    asyncio.run(run())
+    assert dispatcher.stats()["nutrition"]["rejected"] == 1
+
+
+def test_timeout_frees_worker():
+    slow, state = make_stub_agent(delay=1.0)
+    outcomes = []
+    dispatcher = AgentDispatcher(slow, concurrency=1, timeout=0.05,
+                                 on_result=lambda agent, latency, ok: outcomes.append(ok))
+
+    async def run():
+        with pytest.raises(AgentTimeoutError):
+            await dispatcher.dispatch("nutrition", {"n": 1})
+        await asyncio.sleep(0.01)
+        assert state["running"] == 0
+        await dispatcher.close()
+
+    asyncio.run(run())
+    assert outcomes == [False]
+    assert dispatcher.stats()["nutrition"]["timeouts"] == 1
+
+
+def test_handler_errors_propagate():
+    failing, _ = make_stub_agent(fail=True)
+    dispatcher = AgentDispatcher(failing)
+
+    async def run():
+        with pytest.raises(ValueError):
+            await dispatcher.dispatch("recovery", {"n": 1})
+        await dispatcher.close()
+
+    asyncio.run(run())
+    assert dispatcher.stats()["recovery"]["failed"] == 1
+
+
+def test_stream_yields_chunks_then_result():
+    async def streaming_agent(request):
+        for word in ("hola", "mundo"):
+            await asyncio.sleep(0.01)
+            yield word
+        yield {"text": "hola mundo"}
+
+    dispatcher = AgentDispatcher(streaming_agent)
+
+    async def run():
+        events = [event async for event in dispatcher.stream("training", {"n": 1})]
+        # dispatch del mismo handler devuelve solo la respuesta final
+        final = await dispatcher.dispatch("training", {"n": 2})
+        await dispatcher.close()
+        return events, final
+
+    events, final = asyncio.run(run())
+    assert events == [("chunk", "hola"), ("chunk", "mundo"), ("result", {"text": "hola mundo"})]
+    assert final == {"text": "hola mundo"}
+
+
+def test_cancelled_submit_frees_worker_immediately():
+    slow, state = make_stub_agent(delay=10.0)
+    fast, _ = make_stub_agent()
+    outcomes = []
+    dispatcher = AgentDispatcher(slow, concurrency=1, on_result=lambda agent, latency, ok: outcomes.append(ok))
+
+    async def run():
+        waiting = asyncio.ensure_future(dispatcher.dispatch("nutrition", {"n": 1}))
+        await asyncio.sleep(0.01)
+        assert state["running"] == 1
+        waiting.cancel()
+        await asyncio.sleep(0.01)
+        # El handler se canceló con la espera y el único worker queda libre
+        assert state["running"] == 0
+        assert dispatcher.pool("nutrition").in_flight == 0
+        dispatcher.pool("nutrition").handler = fast
+        response = await asyncio.wait_for(dispatcher.dispatch("nutrition", {"n": 2}), 0.1)
+        await dispatcher.close()
+        return response
+
+    assert asyncio.run(run()) == {"text": "ok 2"}
+    stats = dispatcher.stats()["nutrition"]
+    assert stats["cancelled"] == 1 and stats["failed"] == 0
+    assert outcomes == [True]
+
+
+def test_stream_consumer_disconnect_cancels_agent():
+    state = {"finished": False}
+
+    async def endless_agent(request):
+        for n in range(1000):
+            await asyncio.sleep(0.01)
+            yield f"parte {n}"
+        state["finished"] = True
+        yield {"text": "fin"}
+
+    dispatcher = AgentDispatcher(endless_agent)
+
+    async def run():
+        events = dispatcher.stream("training", {"n": 1})
+        assert await events.__anext__() == ("chunk", "parte 0")
+        # Como hace Starlette al desconectarse el cliente
+        await events.aclose()
+        await asyncio.sleep(0.01)
+        in_flight = dispatcher.pool("training").in_flight
+        await dispatcher.close()
+        return in_flight
+
+    assert asyncio.run(run()) == 0
+    assert not state["finished"]
+    assert dispatcher.stats()["training"]["cancelled"] == 1
+
+
+def test_workers_of_a_previous_loop_are_cancelled():
+    handler, _ = make_stub_agent()
+    dispatcher = AgentDispatcher(handler, concurrency=2)
+    old_loop = asyncio.new_event_loop()
+    try:
+        assert old_loop.run_until_complete(dispatcher.dispatch("training", {"n": 1})) == {"text": "ok 1"}
+        old_workers = list(dispatcher.pool("training")._workers)
+
+        async def on_new_loop():
+            response = await dispatcher.dispatch("training", {"n": 2})
+            await dispatcher.close()
+            return response
+
+        assert asyncio.run(on_new_loop()) == {"text": "ok 2"}
+        # La cancelación se entrega cuando el bucle anterior vuelve a ejecutarse
+        old_loop.run_until_complete(asyncio.sleep(0))
+        assert all(worker.cancelled() for worker in old_workers)
+    finally:
+        old_loop.close()
@@ -0,0 +1,45 @@
+import asyncio
+import time
+
+from backend.app.libs.fanout import fan_out, merge_responses
+
+
+def make_agent(text, delay=0.0, error=None):
+    async def call():
+        await asyncio.sleep(delay)
+        if error:
+            raise error
+        return {"text": text, "recommendations": [f"rec {text}"], "next_steps": []}
+
+    return call
+
+
+def test_fan_out_runs_concurrently_and_returns_partial_results():
+    calls = {
+        "training": make_agent("t", delay=0.05),
+        "nutrition": make_agent("n", delay=0.05),
+        "recovery": make_agent("r", delay=1.0),
+        "cognitive": make_agent("c", error=ValueError("caído")),
+    }
+    started = time.perf_counter()
+    results, errors = asyncio.run(fan_out(calls, deadline=0.2))
+    elapsed = time.perf_counter() - started
+
+    assert elapsed < 0.5
+    assert set(results) == {"training", "nutrition"}
+    assert errors == {"recovery": "timeout", "cognitive": "caído"}
+
+
+def test_merge_responses_keeps_agent_order():
+    agents = [{"agent_id": "nutrition"}, {"agent_id": "training"}, {"agent_id": "recovery"}]
+    results = {
+        "training": {"text": "t", "recommendations": ["a"]},
+        "nutrition": {"text": "n", "recommendations": ["b"], "next_steps": ["x"]},
+    }
+    merged = merge_responses(agents, results, {"recovery": "timeout"})
+    assert merged["text"] == "n\n\nt"
+    assert merged["agent"] == {"agent_id": "nutrition"}
+    assert merged["recommendations"] == ["b", "a"]
+    assert merged["next_steps"] == ["x"]
+    assert merged["partial"] is True
+    assert [a["agent_id"] for a in merged["agents"]] == ["nutrition", "training"]
@@ -0,0 +1,120 @@
+import threading
+
+from backend.app.libs.inbox_index import JsonInboxIndex
+
+
+def make_message(i, sender="a1", metadata=None):
+    message = {
+        "message_id": f"m{i}",
+        "timestamp": f"2025-01-01T00:00:{i:02d}",
+        "from": {"agent_id": sender, "agent_name": "Unknown Agent"},
+        "type": "text",
+        "content": {"text": "x" * 1000},
+    }
+    if metadata:
+        message["metadata"] = metadata
+    return message
+
+
+def test_record_keeps_references_only(json_storage):
+    inbox = JsonInboxIndex(json_storage)
+    for i in range(20):
+        inbox.record("training", "c1", make_message(i), position=i)
+    inbox.record("training", "c2", make_message(20, metadata={"k": "v"}), position=0)
+
+    entries = inbox.list("training")
+    assert set(entries) == {"c1", "c2"}
+    assert entries["c1"]["message_count"] == 20
+    assert entries["c1"]["last_message_id"] == "m19"
+    assert entries["c1"]["last_position"] == 19
+    assert entries["c2"]["metadata"] == {"k": "v"}
+    # El contenido de los mensajes nunca se copia al índice
+    assert "content" not in str(json_storage["a2a_inbox_training"])
+
+
+def test_legacy_agent_document_is_migrated(json_storage):
+    json_storage.put("a2a_agent_nutrition", {
+        "c1": {"messages": [make_message(0), make_message(1)], "metadata": {"a": 1}},
+    })
+    inbox = JsonInboxIndex(json_storage)
+
+    entries = inbox.list("nutrition")
+    assert entries["c1"]["message_count"] == 2
+    assert entries["c1"]["last_message_id"] == "m1"
+    assert entries["c1"]["metadata"] == {"a": 1}
+    assert inbox.list("unknown") == {}
+
+
+def test_list_page_orders_by_recent_activity(json_storage):
+    inbox = JsonInboxIndex(json_storage)
+    for i in range(5):
+        inbox.record("training", f"c{i}", make_message(i), position=0)
+
+    page = inbox.list_page("training", limit=2)
+    assert list(page["conversations"]) == ["c4", "c3"]
+    assert page["has_more"] and page["total"] == 5
+
+    page = inbox.list_page("training", limit=2, before=page["next_cursor"])
+    assert list(page["conversations"]) == ["c2", "c1"]
+
+    page = inbox.list_page("training", after="2025-01-01T00:00:02")
+    assert list(page["conversations"]) == ["c4", "c3"]
+    assert not page["has_more"]
+
+
+def test_entries_are_stored_in_activity_order(json_storage):
+    inbox = JsonInboxIndex(json_storage)
+    for i in (3, 0, 4, 1, 2):
+        inbox.record("training", f"c{i}", make_message(i), position=0)
+    inbox.record("training", "c0", make_message(5), position=1)
+
+    # La página es un corte del documento, que ya está ordenado
+    assert list(json_storage["a2a_inbox_training"]["conversations"]) == ["c1", "c2", "c3", "c4", "c0"]
+    assert list(inbox.list_page("training", limit=3)["conversations"]) == ["c0", "c4", "c3"]
+
+
+def test_unordered_index_is_read_in_order(json_storage):
+    json_storage.put("a2a_inbox_training", {
+        "format": "inbox-v1",
+        "agent_id": "training",
+        "conversations": {"c2": {"last_timestamp": "2025-01-01T00:00:02"}, "c1": {"last_timestamp": "2025-01-01T00:00:01"}},
+        "version": 1,
+    })
+    inbox = JsonInboxIndex(json_storage)
+    assert list(inbox.list_page("training")["conversations"]) == ["c2", "c1"]
+
+
+class GatedLegacyStore(dict):
+    """Detiene la primera lectura del documento antiguo hasta que otro hilo registra un mensaje"""
+
+    def __init__(self):
+        super().__init__()
+        self.migrating = threading.Event()
+        self.recorded = threading.Event()
+
+    def get(self, key, default=None):
+        if key.startswith("a2a_agent_") and not self.migrating.is_set():
+            self.migrating.set()
+            self.recorded.wait(0.3)
+        if key not in self:
+            raise FileNotFoundError
+        return super().get(key, default)
+
+    def put(self, key, value):
+        self[key] = value
+
+
+def test_read_and_record_racing_on_legacy_document():
+    storage = GatedLegacyStore()
+    storage.put("a2a_agent_nutrition", {"c1": {"messages": [make_message(0)]}})
+    inbox = JsonInboxIndex(storage)
+
+    reader = threading.Thread(target=inbox.list, args=("nutrition",))
+    reader.start()
+    assert storage.migrating.wait(1)
+    inbox.record("nutrition", "c2", make_message(1), position=0)
+    storage.recorded.set()
+    reader.join()
+
+    # La migración del lector no debe sobrescribir el registro hecho mientras tanto
+    assert set(inbox.list("nutrition")) == {"c1", "c2"}
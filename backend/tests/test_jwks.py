@@ -0,0 +1,134 @@
+import asyncio
+import base64
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import jwt
+import pytest
+from backend.databutton_app.mw.jwks import JWKSManager, UnknownKeyError
+
+
+def make_jwk(kid, secret):
+    k = base64.urlsafe_b64encode(secret.encode()).rstrip(b"=").decode()
+    return {"kty": "oct", "kid": kid, "alg": "HS256", "k": k}
+
+
+@pytest.fixture
+def jwks_server():
+    """Servidor JWKS local: `state["keys"]` se puede rotar durante el test"""
+    state = {"keys": [make_jwk("k1", "secret-one")], "requests": 0, "fail": False}
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            with lock:
+                state["requests"] += 1
+            if state["fail"]:
+                self.send_response(500)
+                self.end_headers()
+                return
+            body = json.dumps({"keys": state["keys"]}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Cache-Control", "public, max-age=100")
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    state["url"] = f"http://127.0.0.1:{server.server_address[1]}/jwks"
+    yield state
+    server.shutdown()
+    server.server_close()
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_prefetch_then_lookup_without_fetching(jwks_server):
+    manager = JWKSManager(jwks_server["url"])
+    assert manager.refresh()
+    assert manager.kids == ["k1"]
+    assert manager.next_refresh_delay() == pytest.approx(80, abs=1)
+
+    token = jwt.encode({"sub": "u1"}, "secret-one", algorithm="HS256", headers={"kid": "k1"})
+    for _ in range(5):
+        key, alg = manager.get_signing_key_from_jwt(token)
+    assert alg == "HS256"
+    assert jwt.decode(token, key, algorithms=[alg])["sub"] == "u1"
+    assert jwks_server["requests"] == 1
+
+
+def test_unknown_kid_single_flight_refresh(jwks_server):
+    manager = JWKSManager(jwks_server["url"], min_refresh_interval=0)
+    manager.refresh()
+    jwks_server["keys"] = [make_jwk("k1", "secret-one"), make_jwk("k2", "secret-two")]
+
+    results = []
+    barrier = threading.Barrier(10)
+
+    def lookup():
+        barrier.wait()
+        results.append(manager.get_signing_key("k2")[1])
+
+    threads = [threading.Thread(target=lookup) for _ in range(10)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == ["HS256"] * 10
+    # Una petición de la precarga y una sola para la rotación
+    assert jwks_server["requests"] == 2
+
+
+def test_unknown_kid_refresh_is_rate_limited(jwks_server):
+    clock = FakeClock()
+    manager = JWKSManager(jwks_server["url"], min_refresh_interval=30, clock=clock)
+    manager.refresh()
+
+    with pytest.raises(UnknownKeyError):
+        manager.get_signing_key("missing")
+    with pytest.raises(UnknownKeyError):
+        manager.get_signing_key("missing")
+    assert jwks_server["requests"] == 1
+
+    clock.now += 31
+    with pytest.raises(UnknownKeyError):
+        manager.get_signing_key("missing")
+    assert jwks_server["requests"] == 2
+
+
+def test_failed_refresh_keeps_previous_keys(jwks_server):
+    manager = JWKSManager(jwks_server["url"])
+    manager.refresh()
+    jwks_server["fail"] = True
+
+    assert manager.refresh() is False
+    assert manager.fetch_errors == 1
+    assert manager.get_signing_key("k1")[1] == "HS256"
+
+
+def test_background_refresh_task(jwks_server):
+    manager = JWKSManager(jwks_server["url"])
+
+    async def run():
+        manager.start()
+        for _ in range(100):
+            if manager.fetches:
+                break
+            await asyncio.sleep(0.01)
+        await manager.stop()
+
+    asyncio.run(run())
+    assert manager.kids == ["k1"]
@@ -0,0 +1,51 @@
+import io
+import json
+import logging
+import queue
+
+from backend.databutton_app.logs import DroppingQueueHandler, Sampler, StructuredFormatter
+
+
+def test_sampler_lets_one_in_n_through():
+    sampler = Sampler(0.25)
+    assert [sampler.sample() for _ in range(8)] == [True, False, False, False] * 2
+    assert not any(Sampler(0).sample() for _ in range(10))
+    assert all(Sampler(1).sample() for _ in range(10))
+
+
+def test_structured_formatter_includes_extra_fields():
+    logger = logging.getLogger("test.structured")
+    record = logger.makeRecord(logger.name, logging.INFO, __file__, 1, "user %s", ("u1",), None, extra={"scheme": "HS256"})
+    entry = json.loads(StructuredFormatter().format(record))
+    assert entry["msg"] == "user u1"
+    assert entry["level"] == "INFO"
+    assert entry["scheme"] == "HS256"
+
+
+def test_queue_handler_drops_instead_of_blocking():
+    log_queue = queue.Queue(maxsize=2)
+    handler = DroppingQueueHandler(log_queue)
+    logger = logging.getLogger("test.dropping")
+    logger.propagate = False
+    logger.addHandler(handler)
+    try:
+        for i in range(5):
+            logger.warning("record %d", i)
+    finally:
+        logger.removeHandler(handler)
+    assert log_queue.qsize() == 2
+    assert handler.dropped == 3
+
+
+def test_listener_writes_json_lines():
+    from backend.databutton_app import logs
+
+    stream = io.StringIO()
+    logs.shutdown_logging()
+    logs.configure_logging(stream)
+    try:
+        logs.get_logger("test").warning("hello", extra={"agent": "nutrition"})
+    finally:
+        logs.shutdown_logging()
+    line = json.loads(stream.getvalue().splitlines()[-1])
+    assert (line["msg"], line["agent"], line["logger"]) == ("hello", "nutrition", "nexusforge.test")
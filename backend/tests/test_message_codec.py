@@ -0,0 +1,134 @@
+import json
+
+import pytest
+
+from backend.app.libs.conversation_store import SegmentedConversationStore
+from backend.app.libs.message_codec import (
+    decode_messages,
+    encode_messages,
+    epoch_us_to_timestamp,
+    extend_messages,
+    pack,
+    pack_message,
+    timestamp_to_epoch_us,
+    unpack,
+    unpack_message,
+)
+from backend.app.libs.sqlite_storage import SqliteConversationStore, SqliteDatabase
+
+
+def make_message(i, conversation_id="c1"):
+    message = {
+        "message_id": f"m{i}",
+        "conversation_id": conversation_id,
+        "timestamp": f"2025-03-01T10:00:{i % 60:02d}" + (".123456" if i % 2 else ""),
+        "from": {"agent_id": ["training", "nutrition"][i % 2], "agent_name": "Unknown Agent"},
+        "to": {"agent_id": ["nutrition", "training"][i % 2], "agent_name": "Nutrición" if i % 3 else "Unknown Agent"},
+        "type": "text",
+        "content": {"text": f"mensaje {i}", "items": [1, 2, 3]},
+    }
+    if i % 4 == 0:
+        message["metadata"] = {"priority": "high"}
+    return message
+
+
+def test_round_trip_is_lossless_and_interns_agents():
+    messages = [make_message(i) for i in range(20)]
+    block = encode_messages(messages, "c1")
+
+    assert decode_messages(block) == messages
+    assert all(isinstance(row, list) for row in block["rows"])
+    # Cuatro descriptores distintos para 40 apariciones
+    assert len(block["agents"]) == 4
+    assert len(json.dumps(block)) < len(json.dumps(messages)) * 0.6
+
+
+@pytest.mark.parametrize("change", [
+    {"extra": 1},
+    {"timestamp": "2025-03-01T10:00:00+00:00"},
+    {"timestamp": "2025-03-01T10:00:00.500"},
+    {"from": {"agent_id": "training", "agent_name": None}},
+    {"to": {"agent_id": "training", "role": "coach"}},
+    {"metadata": None},
+    {"conversation_id": None},
+])
+def test_messages_that_cannot_be_compacted_are_kept_as_is(change):
+    message = {**make_message(1), **change}
+    block = encode_messages([make_message(0), message], "c1")
+    assert block["rows"][1] == message
+    assert decode_messages(block) == [make_message(0), message]
+
+
+def test_other_conversation_and_missing_agent_name_round_trip():
+    message = make_message(3, conversation_id="otra")
+    message["from"] = {"agent_id": "recovery"}
+    assert decode_messages(encode_messages([message], "c1")) == [message]
+
+
+def test_extend_keeps_existing_rows_encoded():
+    messages = [make_message(i) for i in range(10)]
+    block = encode_messages(messages[:6], "c1")
+    extended = extend_messages(block, 4, messages[6:])
+
+    assert extended["rows"][:4] == block["rows"][:4]
+    assert decode_messages(extended) == messages[:4] + messages[6:]
+    assert decode_messages(extended, limit=2) == messages[:2]
+
+
+def test_epoch_timestamps():
+    for timestamp in ("1970-01-01T00:00:00", "2025-03-01T10:00:05.000001", "1969-12-31T23:59:59.999999"):
+        assert epoch_us_to_timestamp(timestamp_to_epoch_us(timestamp)) == timestamp
+    assert timestamp_to_epoch_us("ayer") is None
+
+
+def test_pack_round_trip():
+    value = {"rows": [[1, None, "á"]], "n": 2}
+    assert unpack(pack(value)) == value
+    message = make_message(5)
+    assert unpack_message(pack_message(message, "c1"), "c1") == message
+    with pytest.raises(ValueError):
+        unpack(b"\x09{}")
+
+
+def test_segmented_store_reads_mixed_encodings(json_storage):
+    plain = SegmentedConversationStore(json_storage, segment_size=4)
+    compact = SegmentedConversationStore(json_storage, segment_size=4, encoding="compact")
+    messages = [make_message(i) for i in range(14)]
+
+    plain.append_many("c1", messages[:6])
+    compact.append_many("c1", messages[6:10])
+    plain.append_many("c1", messages[10:])
+
+    for store in (plain, compact):
+        assert store.load("c1")["messages"] == messages
+        page = store.read_window("c1", limit=3, before="2025-03-01T10:00:12")
+        assert [m["message_id"] for m in page["messages"]] == ["m9", "m10", "m11"]
+    # Cada segmento queda en el formato de su última escritura
+    assert "messages" in json_storage["a2a_conversation_c1_seg_0"]
+    assert "packed" in json_storage["a2a_conversation_c1_seg_1"]
+    assert "messages" in json_storage["a2a_conversation_c1_seg_2"]
+
+
+def test_compact_segments_are_smaller(json_storage):
+    store = SegmentedConversationStore(json_storage, segment_size=50, encoding="compact")
+    messages = [make_message(i) for i in range(50)]
+    store.append_many("c1", messages)
+
+    stored = len(json.dumps(json_storage["a2a_conversation_c1_seg_0"]))
+    assert stored < len(json.dumps({"messages": messages})) * 0.6
+    assert store.read_window("c1", after="m47")["messages"] == messages[48:]
+
+
+def test_sqlite_store_reads_json_and_binary_rows(tmp_path):
+    database = SqliteDatabase(str(tmp_path / "storage.db"), pool_size=2)
+    messages = [make_message(i) for i in range(6)]
+    SqliteConversationStore(database).append_many("c1", messages[:3])
+    compact = SqliteConversationStore(database, encoding="compact")
+    compact.append_many("c1", messages[3:])
+
+    assert compact.load("c1")["messages"] == messages
+    assert compact.read_window("c1", limit=2, after="m2")["messages"] == messages[3:5]
+    with database.connection() as conn:
+        kinds = [kind for kind, in conn.execute("SELECT typeof(body) FROM messages ORDER BY position")]
+    assert kinds == ["text"] * 3 + ["blob"] * 3
+    database.close()
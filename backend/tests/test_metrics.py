@@ -0,0 +1,59 @@
+from backend.app.libs.metrics import Histogram, MetricsRegistry, cache_families
+from backend.app.libs.cache import TTLCache
+from test_api import auth_headers
+
+
+def test_counter_and_histogram_render_prometheus_text():
+    registry = MetricsRegistry()
+    requests = registry.counter("requests_total", "Peticiones", ["route"])
+    latency = registry.histogram("latency_seconds", "Latencia", ["route"], buckets=(0.1, 1.0))
+    requests.inc("/a")
+    requests.inc("/a", amount=2)
+    latency.observe(0.05, "/a")
+    latency.observe(0.5, "/a")
+    latency.observe(5, "/a")
+
+    text = registry.render()
+    assert "# TYPE requests_total counter" in text
+    assert 'requests_total{route="/a"} 3' in text
+    assert 'latency_seconds_bucket{route="/a",le="0.1"} 1' in text
+    assert 'latency_seconds_bucket{route="/a",le="1.0"} 2' in text
+    assert 'latency_seconds_bucket{route="/a",le="+Inf"} 3' in text
+    assert 'latency_seconds_count{route="/a"} 3' in text
+    # Registrar otra vez la misma métrica devuelve la existente
+    assert registry.counter("requests_total", "Peticiones", ["route"]) is requests
+
+
+def test_collectors_are_read_on_render():
+    registry = MetricsRegistry()
+    cache = TTLCache(max_size=10, ttl=60)
+    cache.set("k", 1)
+    cache.get("k")
+    cache.get("missing")
+    registry.collector("caches", lambda: cache_families("cache", {"demo": cache}))
+    registry.collector("broken", lambda: 1 / 0)
+
+    text = registry.render()
+    assert 'cache_hits_total{cache="demo"} 1' in text
+    assert 'cache_misses_total{cache="demo"} 1' in text
+
+
+def test_histogram_time_context_manager():
+    histogram = Histogram("op_seconds", "Duración", ["op"])
+    with histogram.time("get"):
+        pass
+    assert histogram.count("get") == 1
+
+
+def test_metrics_endpoint_reports_routes_and_routing(client):
+    client.post("/routes/orchestrator/query", json={"query": "Necesito una dieta", "user_id": "u1"}, headers=auth_headers())
+    resp = client.get("/metrics")
+    assert resp.status_code == 200
+    assert resp.headers["content-type"].startswith("text/plain")
+    text = resp.text
+    assert 'route="/orchestrator/query",status="200"}' in text or 'route="/routes/orchestrator/query",status="200"}' in text
+    assert 'orchestrator_routed_total{agent="nutrition",mode="single"}' in text
+    assert 'orchestrator_stage_duration_seconds_count{stage="routing"}' in text
+    assert "agent_pool_queued" in text
+    # La propia petición a /metrics se cuenta con su plantilla, no como "unmatched"
+    assert 'route="/metrics",status="200"}' in client.get("/metrics").text
@@ -0,0 +1,56 @@
+import asyncio
+import threading
+
+from backend.app.libs.pubsub import PubSub
+
+
+def test_publish_delivers_once_per_subscriber():
+    bus = PubSub(buffer_size=10)
+
+    async def run():
+        both = bus.subscribe(["agent:a", "conversation:c1"])
+        other = bus.subscribe(["agent:b"])
+        assert bus.publish(["agent:a", "conversation:c1"], {"n": 1}) == 1
+        assert await both.get() == {"n": 1}
+        assert both._queue.empty() and other._queue.empty()
+
+        bus.unsubscribe(both)
+        assert await both.get() is None
+        assert bus.publish(["agent:a"], {"n": 2}) == 0
+        assert bus.stats()["subscribers"] == 1
+
+    asyncio.run(run())
+
+
+def test_slow_consumer_is_dropped_without_blocking_publisher():
+    bus = PubSub(buffer_size=3)
+
+    async def run():
+        slow = bus.subscribe(["agent:a"])
+        fast = bus.subscribe(["agent:a"])
+        received = []
+        for i in range(5):
+            bus.publish(["agent:a"], i)
+            received.append(await fast.get())
+
+        assert received == [0, 1, 2, 3, 4]
+        assert slow.dropped
+        assert [message async for message in slow] == [0, 1, 2]
+        assert bus.stats()["dropped_subscribers"] == 1
+        assert bus.publish(["agent:a"], 5) == 1
+
+    asyncio.run(run())
+
+
+def test_publish_from_another_thread():
+    bus = PubSub()
+
+    async def run():
+        subscription = bus.subscribe(["conversation:c1"])
+        thread = threading.Thread(target=bus.publish, args=(["conversation:c1"], "hola"))
+        thread.start()
+        message = await asyncio.wait_for(subscription.get(), 1)
+        thread.join()
+        return message
+
+    assert asyncio.run(run()) == "hola"
@@ -0,0 +1,122 @@
+import json
+import os
+
+import pytest
+
+from backend.app.apis.orchestrator import route_query_to_agent
+from backend.app.libs.agent_registry import AgentRegistry
+from backend.app.libs.routing import KeywordMatcher, RoutingTable, compile_snapshot, normalize_text
+
+
+def write_config(path, keywords, version="v1", mtime=None):
+    config = {
+        "version": version,
+        "default_agent": "training",
+        "agents": [
+            {"agent_id": agent_id, "agent_name": agent_id.title(), "description": agent_id, "keywords": words}
+            for agent_id, words in keywords.items()
+        ],
+    }
+    path.write_text(json.dumps(config))
+    if mtime is not None:
+        os.utime(path, (mtime, mtime))
+
+
+def test_normalize_text_removes_case_and_accents():
+    assert normalize_text("NUTRICIÓN y Compañeros") == "nutricion y companeros"
+
+
+def test_overlapping_keywords_all_score():
+    matcher = KeywordMatcher(
+        {"biometrics": ["datos", "peso"], "security": ["datos personales"]},
+        priority=["biometrics", "security"],
+    )
+    assert matcher.scores("mis datos personales") == {"biometrics": 1, "security": 1}
+    # Empate: gana el de mayor prioridad
+    assert matcher.best("mis datos personales") == "biometrics"
+    assert matcher.best("hola") is None
+
+
+def test_keyword_counts_once_and_shared_prefixes():
+    matcher = KeywordMatcher({"a": ["ab", "abcd"], "b": ["abc"]})
+    assert matcher.scores("abcd abcd") == {"a": 2, "b": 1}
+    assert matcher.scores("abx") == {"a": 1, "b": 0}
+
+
+def test_route_query_is_accent_insensitive():
+    assert route_query_to_agent("Necesito ayuda con mi NUTRICION")["agent_id"] == "nutrition"
+    assert route_query_to_agent("privacidad y proteccion de datos")["agent_id"] == "security"
+
+
+def test_route_query_falls_back_to_context():
+    assert route_query_to_agent("hola", {"last_agent": "recovery"})["agent_id"] == "recovery"
+    assert route_query_to_agent("hola")["agent_id"] == "training"
+
+
+def test_compile_snapshot_validates_config():
+    with pytest.raises(ValueError):
+        compile_snapshot({"agents": []})
+    with pytest.raises(ValueError):
+        compile_snapshot({"default_agent": "x", "agents": [{"agent_id": "a", "agent_name": "A", "description": "a"}]})
+    agent = {"agent_id": "a", "agent_name": "A", "description": "a"}
+    with pytest.raises(ValueError):
+        compile_snapshot({"agents": [agent, agent]})
+
+
+def test_routing_table_swaps_snapshot_on_change(tmp_path):
+    path = tmp_path / "routing.json"
+    write_config(path, {"training": ["rutina"], "nutrition": ["dieta"]}, mtime=1000)
+    table = RoutingTable(path, reload_interval=0)
+    old = table.snapshot()
+    assert old.matcher.best("mi dieta") == "nutrition"
+    assert table.reload() is False
+
+    write_config(path, {"training": ["rutina", "dieta"], "nutrition": ["comida"]}, version="v2", mtime=2000)
+    assert table.reload() is True
+    new = table.snapshot()
+    assert new.version.startswith("v2+")
+    assert new.matcher.best("mi dieta") == "training"
+    # La instantánea anterior sigue intacta para quien la estuviera usando
+    assert old.matcher.best("mi dieta") == "nutrition"
+
+
+def test_invalid_config_keeps_current_snapshot(tmp_path):
+    path = tmp_path / "routing.json"
+    write_config(path, {"training": ["rutina"]}, mtime=1000)
+    table = RoutingTable(path, reload_interval=0)
+    current = table.snapshot()
+
+    path.write_text("{not json")
+    os.utime(path, (2000, 2000))
+    assert table.reload() is False
+    assert table.snapshot() is current
+    assert table.reload_errors == 1
+
+
+def test_agent_registry_lookup_and_payloads():
+    registry = AgentRegistry([
+        {"agent_id": "orchestrator", "agent_name": "Orquestador", "description": "o"},
+        {"agent_id": "training", "agent_name": "Training", "description": "t", "keywords": ["rutina"]},
+    ])
+    assert registry.get("training").keywords == ("rutina",)
+    assert registry.get("missing") is None
+    assert "training" in registry and len(registry) == 2
+    assert registry.get("training").rank == 1
+    assert registry.status_payload("training", "online", "t0") == {
+        "agent_id": "training", "agent_name": "Training", "description": "t",
+        "status": "online", "last_active": "t0",
+    }
+    assert registry.status_payload("missing", "online", None) is None
+    with pytest.raises(ValueError):
+        AgentRegistry([{"agent_id": "a", "agent_name": "A", "description": "a"}] * 2)
+
+
+def test_ranked_orders_by_score_then_priority():
+    matcher = KeywordMatcher(
+        {"training": ["rutina"], "nutrition": ["dieta", "comida"], "recovery": ["dolor"]},
+        priority=["training", "nutrition", "recovery"],
+    )
+    query = "rutina, dieta y comida con dolor"
+    assert matcher.ranked(query) == [("nutrition", 2), ("training", 1), ("recovery", 1)]
+    assert matcher.ranked(query, min_score=2) == [("nutrition", 2)]
+    assert matcher.ranked(query, exclude={"nutrition"}) == [("training", 1), ("recovery", 1)]
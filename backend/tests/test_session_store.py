@@ -0,0 +1,156 @@
+import asyncio
+
+from backend.app.libs.session_store import JsonSessionStore, WriteBehindSessionWriter
+
+
+class CountingStore(dict):
+    def __init__(self):
+        super().__init__()
+        self.puts = 0
+
+    def get(self, key, default=None):
+        if key not in self:
+            raise FileNotFoundError
+        return super().get(key, default)
+
+    def put(self, key, value):
+        self.puts += 1
+        self[key] = value
+
+
+def test_updates_within_window_are_coalesced():
+    storage = CountingStore()
+    writer = WriteBehindSessionWriter(JsonSessionStore(storage), window=0.05)
+
+    async def run():
+        for i in range(10):
+            writer.schedule("s1", "u1", {"last_query": f"q{i}"})
+        # Las lecturas ven lo pendiente antes de que se escriba
+        assert (await writer.get("s1", "u1"))["last_query"] == "q9"
+        assert storage.puts == 0
+        await asyncio.sleep(0.15)
+
+    asyncio.run(run())
+    assert storage.puts == 1
+    assert storage["session_u1_s1"]["last_query"] == "q9"
+    assert writer.stats()["updates"] == 10
+
+
+def test_flush_writes_pending_sessions():
+    storage = CountingStore()
+    writer = WriteBehindSessionWriter(JsonSessionStore(storage), window=60)
+
+    async def run():
+        writer.schedule("s1", "u1", {"a": 1})
+        writer.schedule("s2", "u1", {"b": 2})
+        await writer.flush()
+
+    asyncio.run(run())
+    assert storage.puts == 2
+    assert writer.pending == 0
+    assert "last_updated" in storage["session_u1_s2"]
+
+
+def test_zero_window_writes_through():
+    storage = CountingStore()
+    writer = WriteBehindSessionWriter(JsonSessionStore(storage), window=0)
+
+    async def run():
+        await writer.put("s1", "u1", {"a": 1})
+        await writer.put("s1", "u1", {"b": 2})
+
+    asyncio.run(run())
+    assert storage.puts == 2
+    assert storage["session_u1_s1"]["a"] == 1 and storage["session_u1_s1"]["b"] == 2
+
+
+def test_follow_up_reads_hit_cache():
+    storage = CountingStore()
+    storage.reads = 0
+    original_get = storage.get
+
+    def counting_get(key, default=None):
+        storage.reads += 1
+        return original_get(key, default)
+
+    storage.get = counting_get
+    writer = WriteBehindSessionWriter(JsonSessionStore(storage), window=60)
+
+    async def run():
+        for i in range(5):
+            session = await writer.get("s1", "u1")
+            session["last_query"] = f"q{i}"
+            writer.schedule("s1", "u1", session)
+        return await writer.get("s1", "u1")
+
+    session = asyncio.run(run())
+    assert session["last_query"] == "q4"
+    assert storage.reads == 1
+    assert writer.cache.stats()["hits"] == 5
+
+
+def test_cache_entries_expire_and_reload():
+    storage = CountingStore()
+    storage.put("session_u1_s1", {"last_agent": "training"})
+    writer = WriteBehindSessionWriter(JsonSessionStore(storage), window=60)
+    writer.cache.ttl = 0.01
+
+    async def run():
+        await writer.get("s1", "u1")
+        # Otro worker actualiza la sesión directamente en el almacenamiento
+        storage["session_u1_s1"] = {"last_agent": "nutrition"}
+        await asyncio.sleep(0.02)
+        return await writer.get("s1", "u1")
+
+    assert asyncio.run(run())["last_agent"] == "nutrition"
+
+
+class FlakyStore(CountingStore):
+    def __init__(self, failures):
+        super().__init__()
+        self.failures = failures
+
+    def put(self, key, value):
+        if self.failures:
+            self.failures -= 1
+            raise OSError("almacenamiento no disponible")
+        super().put(key, value)
+
+
+def test_failed_flush_is_retried_under_newer_updates():
+    storage = FlakyStore(failures=1)
+    writer = WriteBehindSessionWriter(JsonSessionStore(storage), window=0.02)
+
+    async def run():
+        writer.schedule("s1", "u1", {"a": 1, "b": 1})
+        await writer.flush()
+        # La escritura falló: sigue pendiente y se ve en las lecturas
+        assert writer.pending == 1 and storage.puts == 0
+        writer.schedule("s1", "u1", {"b": 2})
+        assert (await writer.get("s1", "u1")) == {"a": 1, "b": 2}
+        # El temporizador vuelve a estar armado y la reintenta
+        await asyncio.sleep(0.1)
+
+    asyncio.run(run())
+    assert storage.puts == 1
+    assert {k: storage["session_u1_s1"][k] for k in ("a", "b")} == {"a": 1, "b": 2}
+    assert writer.stats()["errors"] == 1 and writer.pending == 0
+
+
+def test_scheduled_flush_task_is_kept_until_done():
+    storage = CountingStore()
+    writer = WriteBehindSessionWriter(JsonSessionStore(storage), window=60)
+
+    async def run():
+        writer.schedule("s1", "u1", {"a": 1})
+        # Lo que hace el temporizador al cerrarse la ventana
+        writer._timer.cancel()
+        writer._start_flush()
+        task = writer._flush_task
+        assert task is not None and not task.done()
+        # Un vaciado explícito (p. ej. al apagar) espera al programado
+        await writer.flush()
+        assert task.done() and writer._flush_task is None
+
+    asyncio.run(run())
+    assert storage.puts == 1
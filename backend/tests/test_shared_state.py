@@ -0,0 +1,266 @@
+import asyncio
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+from backend.app.libs.json_storage import VersionConflictError, compare_and_put, read_json
+from backend.app.libs.session_store import JsonSessionStore, WriteBehindSessionWriter
+from backend.app.libs.shared_state import (
+    LockTimeoutError,
+    MemorySharedState,
+    SqliteSharedState,
+    open_shared_state,
+)
+from backend.serve import DEFAULT_SHARED_STATE_URL, configure_shared_state, gunicorn_command, parse_args
+
+BACKEND_DIR = os.path.join(os.path.dirname(__file__), "..")
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def state_and_clock(request, tmp_path):
+    clock = FakeClock()
+    if request.param == "memory":
+        return MemorySharedState(clock=clock), clock
+    return SqliteSharedState(str(tmp_path / "state.db"), clock=clock), clock
+
+
+def test_get_set_delete_and_ttl(state_and_clock):
+    state, clock = state_and_clock
+    state.set("a", {"x": [1, 2]})
+    state.set("b", "temporal", ttl=5)
+    assert state.get("a") == {"x": [1, 2]}
+    assert state.get("b") == "temporal"
+
+    clock.now += 6
+    assert state.get("b") is None
+    assert state.get("a") == {"x": [1, 2]}
+    state.delete("a")
+    assert state.get("a") is None
+
+
+def test_add_only_when_absent_or_expired(state_and_clock):
+    state, clock = state_and_clock
+    assert state.add("k", "uno", ttl=5)
+    assert not state.add("k", "dos", ttl=5)
+    assert not state.delete_if("k", "dos")
+    assert state.get("k") == "uno"
+
+    # Una entrada caducada (un cerrojo abandonado) se puede volver a tomar
+    clock.now += 10
+    assert state.add("k", "tres", ttl=5)
+    assert state.delete_if("k", "tres")
+    assert state.get("k") is None
+
+
+def test_sqlite_state_is_shared_between_instances(tmp_path):
+    path = str(tmp_path / "state.db")
+    worker_a = SqliteSharedState(path)
+    worker_b = SqliteSharedState(path)
+
+    worker_a.set("session", {"last_agent": "training"}, ttl=30)
+    assert worker_b.get("session") == {"last_agent": "training"}
+    assert worker_a.shared and not MemorySharedState().shared
+
+
+def test_lock_times_out_while_held():
+    state = MemorySharedState()
+    with state.lock("inbox"):
+        with pytest.raises(LockTimeoutError):
+            with state.lock("inbox", timeout=0.05):
+                pass
+    with state.lock("inbox", timeout=0.05):
+        pass
+
+
+INCREMENT_UNDER_LOCK = """
+import sys, time
+from app.libs.shared_state import SqliteSharedState
+state = SqliteSharedState(sys.argv[1])
+for _ in range(int(sys.argv[2])):
+    with state.lock("counter"):
+        value = state.get("counter") or 0
+        time.sleep(0.0005)
+        state.set("counter", value + 1)
+"""
+
+
+def test_sqlite_lock_is_exclusive_across_processes(tmp_path):
+    path = str(tmp_path / "state.db")
+    SqliteSharedState(path)
+    processes = [
+        subprocess.Popen([sys.executable, "-c", INCREMENT_UNDER_LOCK, path, "25"], cwd=BACKEND_DIR)
+        for _ in range(4)
+    ]
+    for process in processes:
+        assert process.wait(timeout=30) == 0
+
+    assert SqliteSharedState(path).get("counter") == 100
+
+
+class SlowStore(dict):
+    def get(self, key, default=None):
+        if key not in self:
+            raise FileNotFoundError
+        value = dict(super().get(key))
+        # Ensancha la ventana entre leer la versión y escribir
+        time.sleep(0.002)
+        return value
+
+    def put(self, key, value):
+        self[key] = value
+
+
+def test_compare_and_put_has_no_lost_updates_between_threads():
+    storage = SlowStore()
+
+    def writer():
+        for _ in range(10):
+            while True:
+                current = read_json(storage, "doc") or {"version": 0, "n": 0}
+                try:
+                    compare_and_put(storage, "doc", {"version": current["version"] + 1, "n": current["n"] + 1}, current["version"])
+                    break
+                except VersionConflictError:
+                    continue
+
+    threads = [threading.Thread(target=writer) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert storage["doc"] == {"version": 40, "n": 40}
+
+
+def test_session_updates_are_visible_from_another_worker(tmp_path, json_storage):
+    path = str(tmp_path / "state.db")
+
+    def worker():
+        # Cada worker con su caché en memoria y su propia conexión al estado compartido
+        return WriteBehindSessionWriter(JsonSessionStore(json_storage), window=60, shared=SqliteSharedState(path))
+
+    worker_a, worker_b = worker(), worker()
+
+    async def run():
+        await worker_b.get("s1", "u1")
+        worker_a.schedule("s1", "u1", {"last_agent": "nutrition"})
+        await worker_a.flush()
+        # B tenía la sesión en caché, pero la versión compartida cambió
+        assert (await worker_b.get("s1", "u1"))["last_agent"] == "nutrition"
+        await worker_b.get("s1", "u1")
+
+    asyncio.run(run())
+    assert json_storage["session_u1_s1"]["last_agent"] == "nutrition"
+    assert worker_b.stats()["cache"]["hits"] == 1 and worker_b.stats()["cache"]["misses"] == 2
+
+
+class CountingReads(dict):
+    def __init__(self):
+        super().__init__()
+        self.reads = 0
+
+    def get(self, key, default=None):
+        self.reads += 1
+        if key not in self:
+            raise FileNotFoundError
+        return super().get(key, default)
+
+    def put(self, key, value):
+        self[key] = value
+
+
+@pytest.mark.parametrize("window", [0, 60])
+def test_own_writes_keep_the_session_cached(window):
+    storage = CountingReads()
+    writer = WriteBehindSessionWriter(JsonSessionStore(storage), window=window, shared=MemorySharedState())
+
+    async def run():
+        for i in range(10):
+            session = await writer.get("s1", "u1")
+            session["last_query"] = f"q{i}"
+            await writer.put("s1", "u1", session)
+            await writer.flush()
+        return await writer.get("s1", "u1")
+
+    assert asyncio.run(run())["last_query"] == "q9"
+    # Una lectura para cargarla y una por escritura (la de leer, combinar y guardar)
+    assert storage.reads == 1 + 10
+    assert writer.stats()["cache"]["hits"] == 10 and writer.stats()["cache"]["misses"] == 1
+
+
+class LoopWatchingState(MemorySharedState):
+    """Anota en qué hilo se hace cada operación"""
+
+    def __init__(self):
+        super().__init__()
+        self.threads = set()
+
+    def get(self, key):
+        self.threads.add(threading.get_ident())
+        return super().get(key)
+
+    def set(self, key, value, ttl=None):
+        self.threads.add(threading.get_ident())
+        super().set(key, value, ttl)
+
+
+def test_session_writer_does_not_touch_shared_state_on_the_event_loop(json_storage):
+    state = LoopWatchingState()
+    writer = WriteBehindSessionWriter(JsonSessionStore(json_storage), window=60, shared=state)
+
+    async def run():
+        await writer.get("s1", "u1")
+        writer.schedule("s1", "u1", {"a": 1})
+        await writer.flush()
+        await writer.get("s1", "u1")
+        return threading.get_ident()
+
+    loop_thread = asyncio.run(run())
+    assert state.threads and loop_thread not in state.threads
+    assert "size" in writer.stats()["cache"]
+
+
+def test_concurrent_session_writes_do_not_lose_fields():
+    storage = SlowStore()
+    store = JsonSessionStore(storage)
+
+    def writer(name):
+        for i in range(10):
+            store.put("s1", "u1", {f"{name}_{i}": i})
+
+    threads = [threading.Thread(target=writer, args=(name,)) for name in ("a", "b", "c")]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert {f"{name}_{i}" for name in "abc" for i in range(10)} <= storage["session_u1_s1"].keys()
+
+
+def test_open_shared_state_urls(tmp_path):
+    assert isinstance(open_shared_state("memory://"), MemorySharedState)
+    assert isinstance(open_shared_state(f"sqlite://{tmp_path / 's.db'}"), SqliteSharedState)
+    with pytest.raises(ValueError):
+        open_shared_state("memcached://localhost")
+
+
+def test_launcher_defaults_shared_state_for_several_workers():
+    environ = {}
+    assert configure_shared_state(1, environ) is None
+    assert configure_shared_state(4, environ) == DEFAULT_SHARED_STATE_URL
+    assert configure_shared_state(4, {"SHARED_STATE_URL": "redis://cache:6379/0"}) == "redis://cache:6379/0"
+
+    command = gunicorn_command(parse_args(["--workers", "3", "--port", "9000"]))
+    assert command[command.index("--workers") + 1] == "3"
+    assert "uvicorn.workers.UvicornWorker" in command
+    assert "main:create_app()" in command
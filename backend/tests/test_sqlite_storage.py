@@ -0,0 +1,179 @@
+import random
+import sqlite3
+import sys
+import threading
+
+import pytest
+
+from backend.app.apis.auth import create_access_token
+from backend.app.libs.conversation_store import SegmentedConversationStore
+from backend.app.libs.inbox_index import JsonInboxIndex
+from backend.app.libs.sqlite_storage import (
+    SqliteConversationStore,
+    SqliteDatabase,
+    SqliteInboxIndex,
+    SqliteSessionStore,
+)
+
+
+def make_message(i, sender="training"):
+    return {
+        "message_id": f"m{i}",
+        "timestamp": f"2025-01-01T00:{i // 60:02d}:{i % 60:02d}",
+        "from": {"agent_id": sender},
+        "type": "text",
+        "content": {"n": i},
+    }
+
+
+@pytest.fixture
+def database(tmp_path):
+    database = SqliteDatabase(str(tmp_path / "storage.db"), pool_size=4)
+    yield database
+    database.close()
+
+
+def test_read_window_matches_segmented_store(database, json_storage):
+    sqlite_store = SqliteConversationStore(database)
+    segmented = SegmentedConversationStore(json_storage, segment_size=7)
+    for start in range(0, 60, 6):
+        batch = [make_message(i) for i in range(start, start + 6)]
+        assert sqlite_store.append_many("c1", batch, {"batch": start}) == segmented.append_many("c1", batch, {"batch": start})
+
+    cursors = [None, "m0", "m17", "m59", "2025-01-01T00:00:30", "2025-01-01T00:00:30.5Z", "2030-01-01T00:00:00"]
+    rng = random.Random(7)
+    for _ in range(200):
+        kwargs = {
+            "limit": rng.choice([None, 1, 5, 20]),
+            "before": rng.choice(cursors),
+            "after": rng.choice(cursors),
+        }
+        assert sqlite_store.read_window("c1", **kwargs) == segmented.read_window("c1", **kwargs), kwargs
+
+    assert sqlite_store.read_window("missing") is None
+    # CursorNotFoundError de la copia `app.libs` del módulo, subclase de KeyError
+    with pytest.raises(KeyError):
+        sqlite_store.read_window("c1", before="nope")
+
+
+def test_list_page_matches_json_index(database, json_storage):
+    sqlite_inbox = SqliteInboxIndex(database)
+    json_inbox = JsonInboxIndex(json_storage)
+    for i in range(30):
+        records = [(f"c{i % 9}", make_message(i), i // 9), (f"c{(i * 5) % 9}", make_message(i), i)]
+        assert sqlite_inbox.record_many("nutrition", records) == json_inbox.record_many("nutrition", records)
+
+    assert sqlite_inbox.list("nutrition") == json_inbox.list("nutrition")
+    cursors = [None, "c0", "c4", "2025-01-01T00:00:20", "2025-01-01T00:00:00"]
+    for limit in (None, 1, 3, 20):
+        for before in cursors:
+            for after in cursors:
+                expected = json_inbox.list_page("nutrition", limit=limit, before=before, after=after)
+                actual = sqlite_inbox.list_page("nutrition", limit=limit, before=before, after=after)
+                assert actual == expected
+                assert list(actual["conversations"]) == list(expected["conversations"])
+    assert sqlite_inbox.list("nobody") == {}
+
+
+def test_session_store_merges_updates(database):
+    sessions = SqliteSessionStore(database)
+    assert sessions.get("s1", "u1") == {}
+    sessions.put("s1", "u1", {"last_agent": "training"})
+    stored = sessions.put("s1", "u1", {"last_query": "pesas"})
+    assert stored["last_agent"] == "training" and "last_updated" in stored
+    assert sessions.get("s1", "u1") == stored
+    assert sessions.get("s1", "u2") == {}
+
+
+def test_concurrent_appends_keep_every_message(tmp_path):
+    path = str(tmp_path / "storage.db")
+    # Dos bases sobre el mismo archivo, como dos workers
+    stores = [SqliteConversationStore(SqliteDatabase(path, pool_size=2)) for _ in range(2)]
+
+    def writer(store, prefix):
+        for i in range(50):
+            store.append("shared", {**make_message(i), "message_id": f"{prefix}{i}"})
+
+    threads = [threading.Thread(target=writer, args=(store, f"w{n}-")) for n, store in enumerate(stores * 2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    conversation = stores[0].load("shared")
+    assert conversation["total"] == 200
+    assert len(conversation["messages"]) == 200
+
+
+def test_failed_write_is_rolled_back(database):
+    store = SqliteConversationStore(database)
+    store.append("c1", make_message(0))
+    with pytest.raises(KeyError):
+        store.append_many("c1", [make_message(1), {"timestamp": "sin id"}])
+    assert store.load("c1")["total"] == 1
+    assert store.append("c1", make_message(1)) == 2
+
+
+@pytest.fixture
+def sqlite_backend(app, monkeypatch, tmp_path):
+    monkeypatch.setenv("STORAGE_BACKEND", "sqlite")
+    monkeypatch.setenv("SQLITE_STORAGE_PATH", str(tmp_path / "app.db"))
+    # La app usa los módulos importados como `app.libs...`
+    getters = [
+        sys.modules["app.libs.sqlite_storage"].get_sqlite_database,
+        sys.modules["app.libs.conversation_store"].get_conversation_store,
+        sys.modules["app.libs.inbox_index"].get_inbox_index,
+    ]
+    for getter in getters:
+        getter.cache_clear()
+    yield
+    for getter in getters:
+        getter.cache_clear()
+
+
+def test_failed_connect_releases_its_pool_slot(tmp_path):
+    database = SqliteDatabase(str(tmp_path / "pool.db"), pool_size=2)
+    connect = database._connect
+
+    def failing_connect():
+        database._connect = connect
+        raise sqlite3.OperationalError("unable to open database file")
+
+    with database.connection():
+        database._connect = failing_connect
+        with pytest.raises(sqlite3.OperationalError):
+            with database.connection():
+                pass
+
+        # Con el hueco perdido esta petición esperaría a que se libere la otra conexión
+        opened = threading.Event()
+
+        def open_second():
+            with database.connection():
+                opened.set()
+
+        thread = threading.Thread(target=open_second)
+        thread.start()
+        assert opened.wait(1)
+    thread.join()
+
+
+def test_a2a_api_on_sqlite_backend(sqlite_backend, client):
+    headers = {"Authorization": f"Bearer {create_access_token({'sub': 'testuser'})}"}
+    for n in range(3):
+        response = client.post("/routes/a2a/send", json={
+            "conversation_id": "sql-conv",
+            "from_agent": {"agent_id": "training"},
+            "to_agent": {"agent_id": "nutrition"},
+            "message_type": "text",
+            "content": {"text": f"hola {n}"},
+        }, headers=headers)
+        assert response.status_code == 200
+
+    page = client.get("/routes/a2a/conversation/sql-conv", params={"limit": 2}, headers=headers).json()
+    assert [m["content"]["text"] for m in page["messages"]] == ["hola 1", "hola 2"]
+    assert page["total"] == 3 and page["has_more_before"]
+
+    inbox = client.get("/routes/a2a/agent/nutrition/conversations", headers=headers).json()
+    assert inbox["conversations"]["sql-conv"]["message_count"] == 3
+    assert type(sys.modules["app.libs.conversation_store"].get_conversation_store()).__name__ == "SqliteConversationStore"
@@ -0,0 +1,61 @@
+import json
+import sys
+import types
+
+from backend.databutton_app.lazy import lazy_import
+from backend.databutton_app.router_manifest import MANIFEST_PATH, ROUTERS_PATH, build_manifest, load_manifest
+
+
+def write_routers(tmp_path, routers):
+    path = tmp_path / "routers.json"
+    path.write_text(json.dumps({"routers": {name: {"disableAuth": disabled} for name, disabled in routers.items()}}))
+    return path
+
+
+def test_committed_manifest_matches_routers_json():
+    # Si falla, regenerar con `python -m databutton_app.router_manifest`
+    assert json.loads(MANIFEST_PATH.read_text()) == build_manifest(ROUTERS_PATH)
+
+
+def test_manifest_is_sorted_and_skips_missing_modules(tmp_path):
+    apis = tmp_path / "apis"
+    for name in ("zeta", "alpha"):
+        (apis / name).mkdir(parents=True)
+        (apis / name / "__init__.py").write_text("")
+    routers = write_routers(tmp_path, {"zeta": False, "alpha": True, "missing": False})
+
+    manifest = build_manifest(routers, apis)
+    assert manifest["routers"] == [
+        {"name": "alpha", "module": "app.apis.alpha", "auth": False},
+        {"name": "zeta", "module": "app.apis.zeta", "auth": True},
+    ]
+
+
+def test_stale_manifest_is_rebuilt_from_routers_json(tmp_path):
+    routers = write_routers(tmp_path, {"auth": True})
+    manifest_path = tmp_path / "router_manifest.json"
+    manifest_path.write_text(json.dumps({"source_sha256": "old", "routers": []}))
+    assert load_manifest(manifest_path, routers) == [{"name": "auth", "module": "app.apis.auth", "auth": False}]
+
+    manifest_path.write_text(json.dumps(build_manifest(routers)))
+    routers.write_text(routers.read_text())  # mismo contenido: el manifiesto sigue siendo válido
+    assert load_manifest(manifest_path, routers)[0]["auth"] is False
+
+
+def test_lazy_import_defers_execution(monkeypatch):
+    monkeypatch.delitem(sys.modules, "colorsys", raising=False)
+    module = lazy_import("colorsys")
+    assert sys.modules["colorsys"] is module
+    # Hasta el primer acceso a un atributo es un módulo perezoso sin ejecutar
+    assert type(module) is not types.ModuleType
+    assert module.rgb_to_hsv(1, 0, 0)[0] == 0
+    assert type(module) is types.ModuleType
+    assert lazy_import("colorsys") is module
+
+
+def test_importing_main_does_not_build_the_app(app):
+    import backend.main as main
+
+    assert "app" not in vars(main)
+    report = app.state.startup_report
+    assert {"import", "create_app", "api:orchestrator"} <= set(report)